@@ -1,3 +1,4 @@
+import argparse
 import os
 import shutil
 import urbs
@@ -8,18 +9,6 @@ input_dir = 'Input'
 input_path = os.path.join(input_dir, input_files)
 
 result_name = 'Intertemp'
-result_dir = urbs.prepare_result_directory(result_name)  # name + time stamp
-
-#get year
-year = date.today().year
-
-# copy input file to result directory
-try:
-    shutil.copytree(input_path, os.path.join(result_dir, input_dir))
-except NotADirectoryError:
-    shutil.copyfile(input_path, os.path.join(result_dir, input_files))
-# copy run file to result directory
-shutil.copy(__file__, result_dir)
 
 # objective function
 objective = 'cost'  # set either 'cost' or 'CO2' as objective
@@ -102,11 +91,44 @@ scenarios = [
              urbs.scenario_all_together
             ]
 
-for scenario in scenarios:
-    prob = urbs.run_scenario(input_path, solver, timesteps, scenario,
-                             result_dir, dt, objective,
-                             plot_tuples=plot_tuples,
-                             plot_sites_name=plot_sites_name,
-                             plot_periods=plot_periods,
-                             report_tuples=report_tuples,
-                             report_sites_name=report_sites_name)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the selected scenarios.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of scenarios solved (and input files '
+                             'parsed) in parallel')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='solver threads per worker (workers * threads '
+                             'should not exceed the number of cores)')
+    parser.add_argument('--persistent', action='store_true',
+                        help='build the model once and re-solve each '
+                             'scenario on it with the persistent solver '
+                             'interface (c.f. urbs.update_model)')
+    args = parser.parse_args()
+
+    result_dir = urbs.prepare_result_directory(result_name)  # name + time stamp
+
+    #get year
+    year = date.today().year
+
+    # copy input file to result directory
+    try:
+        shutil.copytree(input_path, os.path.join(result_dir, input_dir))
+    except NotADirectoryError:
+        shutil.copyfile(input_path, os.path.join(result_dir, input_files))
+    # copy run file to result directory
+    shutil.copy(__file__, result_dir)
+
+    results = urbs.run_scenarios(input_path, solver, timesteps, scenarios,
+                                 result_dir, dt, objective,
+                                 plot_tuples=plot_tuples,
+                                 plot_sites_name=plot_sites_name,
+                                 plot_periods=plot_periods,
+                                 report_tuples=report_tuples,
+                                 report_sites_name=report_sites_name,
+                                 workers=args.workers, threads=args.threads,
+                                 persistent=args.persistent)
+    failed = [sce for sce, result in results.items()
+              if isinstance(result, Exception)]
+    if failed:
+        raise SystemExit('Failed scenarios: ' + ', '.join(failed))
@@ -0,0 +1,96 @@
+import copy
+import math
+import os
+import unittest
+import pyomo.environ
+import urbs
+from pyomo.opt.base import SolverFactory
+
+INPUT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Input')
+
+
+class AggregationTest(unittest.TestCase):
+    """ Models of aggregated, segmented and resampled timeseries, also of
+    timesteps which do not start at 0, are compared with the full model of
+    the same timesteps: reductions which merge nothing give the same total
+    costs, the others a small error (c.f. urbs.aggregation_error) """
+
+    steps = 96
+    period_length = 24
+
+    @classmethod
+    def setUpClass(cls):
+        data = urbs.read_input(
+            os.path.join(INPUT, 'single_year_example.xlsx'), 2020)
+        cls.data = urbs.scenario_base(copy.deepcopy(data))
+        urbs.validate_input(cls.data)
+        cls.references = {}
+
+    def solve(self, data, dt=1, timesteps=None):
+        prob = urbs.create_model(data, dt, timesteps)
+        result = SolverFactory('appsi_highs').solve(prob)
+        self.assertEqual(str(result.solver.termination_condition), 'optimal')
+        return prob
+
+    def timesteps(self, offset):
+        return range(offset, offset + self.steps + 1)
+
+    def reference(self, offset):
+        if offset not in self.references:
+            self.references[offset] = self.solve(self.data, 1,
+                                                 self.timesteps(offset))
+        return self.references[offset]
+
+    def cost_error(self, reduced, offset, dt=1):
+        """ Relative error of the total costs of the reduced data """
+        prob = self.solve(reduced, dt)
+        total = urbs.aggregation_error(
+            prob, self.reference(offset)).loc['costs'].sum()
+        return ((total['aggregated'] - total['reference']) /
+                abs(total['reference']))
+
+    def check(self, offset):
+        timesteps = self.timesteps(offset)
+        periods = self.steps // self.period_length
+
+        # one timestep per segment or resampled timestep: the full model
+        for reduced in (urbs.segment_timeseries(self.data, self.steps,
+                                                timesteps=timesteps),
+                        urbs.resample_timeseries(self.data, 1,
+                                                 timesteps=timesteps)):
+            self.assertTrue(math.isclose(
+                pyomo.environ.value(self.solve(reduced).objective_function),
+                pyomo.environ.value(self.reference(offset).objective_function),
+                rel_tol=1e-7))
+
+        # one representative period per period: the same up to the cyclic
+        # representative periods (c.f. urbs.features.periods)
+        for method in ('kmeans', 'kmedoids'):
+            reduced = urbs.aggregate_timeseries(
+                self.data, periods, self.period_length, timesteps=timesteps,
+                method=method)
+            self.assertLess(abs(self.cost_error(reduced, offset)), 1e-4)
+
+        # half of the periods, a quarter of the timesteps, half the resolution
+        errors = {
+            'aggregate': self.cost_error(urbs.aggregate_timeseries(
+                self.data, periods // 2, self.period_length,
+                timesteps=timesteps, peaks=False), offset),
+            'segment': self.cost_error(urbs.segment_timeseries(
+                self.data, self.steps // 4, timesteps=timesteps), offset),
+            'resample': self.cost_error(urbs.resample_timeseries(
+                self.data, 2, timesteps=timesteps), offset, dt=2)}
+        for method, error in errors.items():
+            self.assertLess(abs(error), 0.01,
+                            '{} at offset {}'.format(method, offset))
+
+    def test_initial_timesteps(self):
+        self.check(0)
+
+    def test_offset_timesteps(self):
+        self.check(1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
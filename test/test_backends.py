@@ -0,0 +1,83 @@
+import copy
+import math
+import os
+import unittest
+import pyomo.environ
+import urbs
+from pyomo.opt.base import SolverFactory
+
+INPUT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Input')
+
+
+def read(name, year=2020):
+    """ Read an example input file of folder Input """
+    return urbs.read_input(os.path.join(INPUT, name), year)
+
+
+class BackendTest(unittest.TestCase):
+    """ The Pyomo and the matrix backend of create_model build the same linear
+    program: this checks that both reach the same optimum for the example
+    input files, as the rules are written twice (c.f. urbs.matrix) """
+
+    timesteps = range(0, 49)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = {name: read(name) for name in
+                    ('single_year_example.xlsx', 'Intertemporal_example')}
+
+    def compare(self, name, scenario, objective='cost'):
+        data = scenario(copy.deepcopy(self.data[name]))
+        urbs.validate_input(data)
+
+        prob = urbs.create_model(data, 1, self.timesteps, objective)
+        result = SolverFactory('appsi_highs').solve(prob)
+        self.assertEqual(str(result.solver.termination_condition), 'optimal')
+
+        matrix = urbs.create_model(data, 1, self.timesteps, objective,
+                                   backend='matrix')
+        self.assertEqual(matrix.solve('highs'), 'optimal')
+
+        expected = pyomo.environ.value(prob.objective_function)
+        self.assertTrue(
+            math.isclose(matrix.objective_value, expected, rel_tol=1e-7,
+                         abs_tol=1e-6),
+            '{} {} {}: matrix objective {!r}, pyomo objective {!r}'.format(
+                name, scenario.__name__, objective, matrix.objective_value,
+                expected))
+
+    def test_single_year_base(self):
+        self.compare('single_year_example.xlsx', urbs.scenario_base)
+
+    def test_single_year_co2_limit(self):
+        self.compare('single_year_example.xlsx', urbs.scenario_co2_limit)
+
+    def test_single_year_no_dsm(self):
+        self.compare('single_year_example.xlsx', urbs.scenario_no_dsm)
+
+    def test_single_year_co2_objective(self):
+        self.compare('single_year_example.xlsx', urbs.scenario_base, 'CO2')
+
+    def test_intertemporal_base(self):
+        self.compare('Intertemporal_example', urbs.scenario_base)
+
+    def test_intertemporal_all_together(self):
+        self.compare('Intertemporal_example', urbs.scenario_all_together)
+
+    def test_rejects_dc_power_flow(self):
+        data = copy.deepcopy(self.data['single_year_example.xlsx'])
+        data['transmission']['reactance'] = 0.1
+        with self.assertRaises(NotImplementedError):
+            urbs.create_model(data, 1, self.timesteps, backend='matrix')
+
+    def test_rejects_other_solvers(self):
+        # rejected before the (here missing) input file is read
+        with self.assertRaises(ValueError):
+            urbs.run_scenario('missing.xlsx', 'glpk', self.timesteps,
+                              urbs.scenario_base, 'result', 1, 'cost',
+                              backend='matrix')
+
+
+if __name__ == '__main__':
+    unittest.main()
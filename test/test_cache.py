@@ -0,0 +1,99 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+from urbs import cache
+
+
+class CacheTest(unittest.TestCase):
+    """ The input cache (urbs.cache) is off by default, only hashes files
+    whose time stamp changed and drops entries which cannot be unpickled """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.filename = os.path.join(self.directory, 'input.txt')
+        with open(self.filename, 'w') as f:
+            f.write('input')
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        self.calls += 1
+        with open(filename) as f:
+            return f.read()
+
+    def cached(self):
+        return cache.cached(self.read, self.filename,
+                            cache_dir=self.cache_dir)
+
+    def test_disabled_by_default(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop(cache.CACHE_ENV, None)
+            cache.cached(self.read, self.filename)
+            cache.cached(self.read, self.filename)
+        self.assertEqual(self.calls, 2)
+
+    def test_environment_variable(self):
+        with mock.patch.dict(os.environ, {cache.CACHE_ENV: self.cache_dir}):
+            cache.cached(self.read, self.filename)
+            cache.cached(self.read, self.filename)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_hash_only_on_changed_time_stamp(self):
+        self.cached()
+        with mock.patch.object(cache, 'file_digest',
+                               wraps=cache.file_digest) as digest:
+            self.assertEqual(self.cached(), 'input')
+            self.assertEqual(digest.call_count, 0)
+
+            # touched, but unchanged: hashed, but not parsed again
+            stat = os.stat(self.filename)
+            os.utime(self.filename, ns=(stat.st_atime_ns,
+                                        stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual(self.cached(), 'input')
+            self.assertEqual(digest.call_count, 1)
+            self.assertEqual(self.cached(), 'input')
+            self.assertEqual(digest.call_count, 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_changed_file(self):
+        self.cached()
+        with open(self.filename, 'w') as f:
+            f.write('changed input')
+        self.assertEqual(self.cached(), 'changed input')
+        self.assertEqual(self.calls, 2)
+
+    def test_stale_entry(self):
+        # an entry of a class whose module no longer exists
+        module = types.ModuleType('urbs_removed_module')
+        module.Removed = type('Removed', (), {'__module__': module.__name__})
+        sys.modules[module.__name__] = module
+        try:
+            payload = pickle.dumps(module.Removed())
+        finally:
+            del sys.modules[module.__name__]
+        path = os.path.join(
+            self.cache_dir, cache.cache_key(self.read, self.filename) + '.pkl')
+        os.makedirs(self.cache_dir)
+        with open(path, 'wb') as f:
+            pickle.dump((cache.file_stamp(self.filename),
+                         cache.file_digest(self.filename)), f)
+            f.write(payload)
+
+        self.assertEqual(self.cached(), 'input')
+        self.assertEqual(self.calls, 1)
+        with open(path, 'rb') as f:
+            pickle.load(f)
+            self.assertEqual(pickle.load(f), 'input')
+
+
+if __name__ == '__main__':
+    unittest.main()
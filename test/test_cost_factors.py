@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+import pandas as pd
+from urbs.features.modelhelper import invcost_factor, overpay_factor
+
+
+class CostFactorTest(unittest.TestCase):
+    """ invcost_factor and overpay_factor return floats for scalar arguments
+    and arrays of the same factors for columns """
+
+    def test_scalar_arguments(self):
+        for factor in (invcost_factor(20, 0.06), invcost_factor(20, 0),
+                       invcost_factor(20, 0.06, 0.02, 2030, 2020),
+                       overpay_factor(20, 0.06, 0.02, 2040, 2020, 2050)):
+            self.assertIs(type(factor), float)
+        self.assertAlmostEqual(invcost_factor(20, 0), 0.05)
+
+    def test_column_arguments(self):
+        dep_prd = pd.Series([20, 30, 40])
+        interest = pd.Series([0, 0.06, 0.1])
+        factors = invcost_factor(dep_prd, interest, 0.02, 2030, 2020)
+        self.assertIsInstance(factors, np.ndarray)
+        np.testing.assert_allclose(
+            factors, [invcost_factor(d, i, 0.02, 2030, 2020)
+                      for d, i in zip(dep_prd, interest)])
+        overpay = overpay_factor(dep_prd, interest, 0.02, 2040, 2020, 2050)
+        np.testing.assert_allclose(
+            overpay, [overpay_factor(d, i, 0.02, 2040, 2020, 2050)
+                      for d, i in zip(dep_prd, interest)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+import pandas as pd
+from urbs.paramstore import ParamStore
+
+
+class ParamStoreTest(unittest.TestCase):
+    """ Values written to a ParamStore column are kept unchanged """
+
+    def setUp(self):
+        self.store = ParamStore(pd.DataFrame(
+            {'inv-cost': [1000, 2000], 'name': ['a', 'b']},
+            index=pd.MultiIndex.from_tuples([(2020, 'A'), (2020, 'B')])))
+
+    def test_float_into_integer_column(self):
+        column = self.store['inv-cost']
+        column[(2020, 'A')] = 2.5 * column[(2020, 'A')]
+        self.assertEqual(column[(2020, 'A')], 2500)
+        column[(2020, 'B')] = 0.5
+        self.assertEqual(column[(2020, 'B')], 0.5)
+
+    def test_integer_into_integer_column(self):
+        column = self.store['inv-cost']
+        column[(2020, 'A')] = 2 * column[(2020, 'A')]
+        self.assertEqual(column[(2020, 'A')], 2000)
+        self.assertEqual(column.array.dtype.kind, 'i')
+
+    def test_object_column(self):
+        self.store['name'][(2020, 'B')] = 'c'
+        self.assertEqual(self.store['name'][(2020, 'B')], 'c')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import copy
+import os
+import unittest
+import urbs
+
+INPUT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Input')
+
+
+def nested_join(m, name):
+    """ Build a process commodity tuple set as the model did before the ratio
+    keys were grouped by (stf, process), i.e. by comparing every process
+    tuple with every ratio key.
+
+    Returns:
+        list of the set elements without duplicates, in order
+    """
+    if name == 'pro_input_tuples':
+        tuples = [(stf, site, process, commodity)
+                  for (stf, site, process) in m.pro_tuples
+                  for (s, pro, commodity) in tuple(m.r_in_dict.keys())
+                  if process == pro and s == stf]
+    elif name == 'pro_output_tuples':
+        tuples = [(stf, site, process, commodity)
+                  for (stf, site, process) in m.pro_tuples
+                  for (s, pro, commodity) in tuple(m.r_out_dict.keys())
+                  if process == pro and s == stf]
+    elif name == 'pro_partial_tuples':
+        tuples = [(stf, site, process)
+                  for (stf, site, process) in m.pro_tuples
+                  for (s, pro, _) in tuple(m.r_in_min_fraction_dict.keys())
+                  if process == pro and s == stf]
+    elif name == 'pro_partial_input_tuples':
+        tuples = [(stf, site, process, commodity)
+                  for (stf, site, process) in m.pro_partial_tuples
+                  for (s, pro, commodity) in tuple(m.r_in_min_fraction_dict
+                                                   .keys())
+                  if process == pro and s == stf]
+    elif name == 'pro_partial_output_tuples':
+        tuples = [(stf, site, process, commodity)
+                  for (stf, site, process) in m.pro_partial_tuples
+                  for (s, pro, commodity) in tuple(m.r_out_min_fraction_dict
+                                                   .keys())
+                  if process == pro and s == stf]
+    elif name == 'pro_timevar_output_tuples':
+        tve_stflist = set()
+        for key in m.eff_factor_dict[tuple(m.eff_factor_dict.keys())[0]]:
+            tve_stflist.add(tuple(key)[0])
+        tuples = [(stf, site, process, commodity)
+                  for stf in tve_stflist
+                  for (site, process) in tuple(m.eff_factor_dict.keys())
+                  for (st, pro, commodity) in tuple(m.r_out_dict.keys())
+                  if process == pro and st == stf and commodity not in
+                  m.com_env]
+    # a pyomo Set keeps the first of duplicate elements
+    return list(dict.fromkeys(tuples))
+
+
+class TupleSetTest(unittest.TestCase):
+    """ The process commodity tuple sets are built from the ratio keys
+    grouped by (stf, process): this checks that they have the same elements
+    in the same order as the nested join of all process tuples and ratio
+    keys (c.f. doc/implementdoc/sets.rst) """
+
+    timesteps = range(0, 2)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = {name: urbs.read_input(os.path.join(INPUT, name), 2020)
+                    for name in ('single_year_example.xlsx',
+                                 'Intertemporal_example')}
+
+    def compare(self, name, scenario):
+        data = scenario(copy.deepcopy(self.data[name]))
+        urbs.validate_input(data)
+        prob = urbs.create_model(data, 1, self.timesteps)
+
+        names = ['pro_input_tuples', 'pro_output_tuples',
+                 'pro_partial_tuples', 'pro_partial_input_tuples',
+                 'pro_partial_output_tuples']
+        if prob.mode['tve']:
+            names.append('pro_timevar_output_tuples')
+        for set_name in names:
+            with self.subTest(set_name):
+                self.assertEqual(list(getattr(prob, set_name)),
+                                 nested_join(prob, set_name))
+
+    def test_single_year_base(self):
+        self.compare('single_year_example.xlsx', urbs.scenario_base)
+
+    def test_single_year_all_together(self):
+        self.compare('single_year_example.xlsx', urbs.scenario_all_together)
+
+    def test_intertemporal_base(self):
+        self.compare('Intertemporal_example', urbs.scenario_base)
+
+    def test_intertemporal_all_together(self):
+        self.compare('Intertemporal_example', urbs.scenario_all_together)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,10 +11,14 @@ commodities.
 """
 
 from .colorcodes import COLORS
+from .aggregation import aggregate_timeseries, aggregation_error, \
+                         resample_timeseries, segment_timeseries
+from .dispatch import chunked_dispatch, fix_capacities, rolling_horizon
 from .model import create_model
+from .persistent import update_model
 from .input import *
 from .validation import validate_input
-from .output import get_constants, get_timeseries
+from .output import get_constants, get_cost_breakdown, get_timeseries
 from .plot import plot, result_figures, to_color
 from .pyomoio import get_entity, get_entities, list_entities
 from .report import report
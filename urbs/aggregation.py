@@ -0,0 +1,432 @@
+import heapq
+import numpy as np
+import pandas as pd
+from .pyomoio import get_entity
+
+# input DataFrames with timeseries, which are aggregated
+TIMESERIES = ['demand', 'supim', 'eff_factor', 'buy_sell_price']
+
+
+def aggregate_timeseries(data, periods, period_length=24, timesteps=None,
+                         method='kmeans', peaks=True, seed=0):
+    """Aggregate the timeseries to a few representative periods.
+
+    The modelled timesteps (except the initial one) are split into periods
+    of equal length, e.g. days. These are clustered by the (normalized)
+    values of all timeseries (demand, supim, eff_factor, buy_sell_price) of
+    all support timeframes; each cluster is replaced by one representative
+    period. The aggregated data contains the representative periods one
+    after the other and the entry 'aggregation', which lists the
+    representative period of each original period. create_model then weights
+    each representative period by the number of periods it represents and
+    links the storage content across the original periods (c.f.
+    urbs.features.periods).
+
+    Args:
+        - data: input data dict (c.f. read_input)
+        - periods: number of representative periods
+        - period_length: number of timesteps of a period, default: 24
+        - timesteps: optional list of the timesteps to aggregate (the first
+          one being the initial timestep), default: demand timeseries;
+          timesteps after the last complete period are left out
+        - method: "kmeans" (default) to represent a cluster by its mean, or
+          "kmedoids" to represent it by its most central period
+        - peaks: keep the periods of the peak demands as own representative
+          periods, default: True
+        - seed: seed of the random initial clusters, default: 0
+
+    Returns:
+        the aggregated data dict
+    """
+    if 'segmentation' in data:
+        raise ValueError("Segmented timeseries cannot be aggregated. "
+                         "Aggregate before segmenting.")
+    if method not in ('kmeans', 'kmedoids'):
+        raise ValueError("Unknown aggregation method '{}'. Use either "
+                         "'kmeans' or 'kmedoids'.".format(method))
+    if timesteps is None:
+        timesteps = sorted(set(
+            data['demand'].index.get_level_values('t')))
+    timesteps = list(timesteps)
+    count = (len(timesteps) - 1) // period_length
+    if count < periods:
+        raise ValueError("Cannot aggregate {} periods to {} representative "
+                         "periods.".format(count, periods))
+    steps = timesteps[1:count * period_length + 1]
+
+    # values of all timeseries as one array (period, step, column)
+    frames = {name: data[name] for name in TIMESERIES
+              if name in data and not data[name].empty}
+    values = {name: _period_values(frame, steps, count, period_length)
+              for name, frame in frames.items()}
+    features = np.concatenate(
+        [_normalize(array) for array in values.values()], axis=2)
+    features = features.reshape(count, -1)
+
+    # peak periods and clusters
+    extremes = []
+    if peaks and 'demand' in values:
+        extremes = sorted(set(
+            values['demand'].max(axis=1).argmax(axis=0).tolist()))
+    if periods <= len(extremes):
+        raise ValueError("{} representative periods are too few to keep "
+                         "the {} peak periods.".format(periods,
+                                                       len(extremes)))
+    others = [p for p in range(count) if p not in extremes]
+    labels, centers = _cluster(features[others], periods - len(extremes),
+                               method, np.random.default_rng(seed))
+    clusters = [others[center] if method == 'kmedoids' else None
+                for center in centers]
+    members = [[others[i] for i in np.flatnonzero(labels == c)]
+               for c in range(len(centers))]
+    members += [[p] for p in extremes]
+    clusters += extremes
+
+    # representative periods in the order of their first period
+    order = sorted(range(len(members)), key=lambda c: min(members[c]))
+    members = [members[c] for c in order]
+    clusters = [clusters[c] for c in order]
+    representative = np.empty(count, dtype=int)
+    for r, periods_r in enumerate(members):
+        representative[periods_r] = r
+
+    # aggregated timeseries: initial timestep and representative periods
+    aggregated = dict(data)
+    errors = []
+    for name, frame in frames.items():
+        array = values[name]
+        rep_values = np.array([
+            array[clusters[r]] if clusters[r] is not None
+            else array[members[r]].mean(axis=0)
+            for r in range(len(members))])
+        aggregated[name] = _aggregated_frame(frame, timesteps[0],
+                                             rep_values, period_length)
+        error = np.sqrt(np.mean(
+            (_normalize(array) -
+             _normalize(rep_values[representative], array)) ** 2))
+        errors.append('{} {:.3f}'.format(name, error))
+    first = timesteps[0] + 1 + representative * period_length
+    aggregated['aggregation'] = pd.DataFrame(
+        {'representative': representative,
+         'first': first,
+         'last': first + period_length - 1},
+        index=pd.RangeIndex(count, name='Period'))
+
+    print('Aggregation: {} periods of {} timesteps represented by {} '
+          'periods ({} peak periods); normalized RMSE: {}.'.format(
+              count, period_length, len(members), len(extremes),
+              ', '.join(errors)))
+    return aggregated
+
+
+def resample_timeseries(data, factor, timesteps=None):
+    """Resample the timeseries to a coarser time resolution.
+
+    Each factor successive timesteps (except the initial one) are merged
+    into one: demands, which are energies per timestep, are summed up;
+    SupIm, efficiency factors and buy/sell prices are averaged. All other
+    parameters are given per hour (e.g. max-grad, DSM delay and recovery
+    time, storage discharge) and are scaled by the model with its timestep
+    duration dt, which has to be factor times the one of data.
+
+    Args:
+        - data: input data dict (c.f. read_input)
+        - factor: number of timesteps merged into one, e.g. 3
+        - timesteps: optional list of the timesteps to resample (the first
+          one being the initial timestep), default: demand timeseries;
+          timesteps after the last complete group are left out
+
+    Returns:
+        the resampled data dict with timesteps numbered from the initial
+        timestep on
+    """
+    if 'aggregation' in data:
+        raise ValueError("Representative periods cannot be resampled. "
+                         "Resample before aggregating.")
+    if 'segmentation' in data:
+        raise ValueError("Segmented timeseries cannot be resampled. "
+                         "Resample before segmenting.")
+    if timesteps is None:
+        timesteps = sorted(set(
+            data['demand'].index.get_level_values('t')))
+    timesteps = list(timesteps)
+    count = (len(timesteps) - 1) // factor
+    steps = timesteps[1:count * factor + 1]
+
+    resampled = dict(data)
+    for name in TIMESERIES:
+        if name not in data or data[name].empty:
+            continue
+        values = _period_values(data[name], steps, count, factor)
+        if name == 'demand':
+            values = values.sum(axis=1)
+        else:
+            values = values.mean(axis=1)
+        resampled[name] = _aggregated_frame(
+            data[name], timesteps[0], values[np.newaxis], count)
+    return resampled
+
+
+def segment_timeseries(data, segments, timesteps=None, peaks=True):
+    """Merge similar successive timesteps to timesteps of longer duration.
+
+    Starting from single timesteps (except the initial one), the two
+    neighbouring segments whose merge changes the (normalized) values of all
+    timeseries (demand, supim, eff_factor, buy_sell_price) least are merged,
+    until the given number of segments is left. So flat periods are
+    represented by few long timesteps, while peaks and ramps keep a fine
+    resolution. Like for resample_timeseries, demands are summed up and the
+    other timeseries are averaged over each segment. The segmented data
+    contains the entry 'segmentation', which lists the original timesteps
+    and the duration (in timesteps of the original data) of each timestep;
+    create_model then scales all time-dependent parameters by the duration
+    of each timestep (c.f. urbs.features.add_durations).
+
+    Args:
+        - data: input data dict (c.f. read_input)
+        - segments: number of timesteps of the segmented data (without the
+          initial timestep)
+        - timesteps: optional list of the timesteps to segment (the first
+          one being the initial timestep), default: demand timeseries
+        - peaks: keep the timesteps of the peak demands as own segments,
+          default: True
+
+    Returns:
+        the segmented data dict with timesteps numbered from the initial
+        timestep on
+    """
+    if 'aggregation' in data:
+        raise ValueError("Representative periods cannot be segmented.")
+    if timesteps is None:
+        timesteps = sorted(set(
+            data['demand'].index.get_level_values('t')))
+    timesteps = list(timesteps)
+    steps = timesteps[1:]
+    count = len(steps)
+    if not 0 < segments <= count:
+        raise ValueError("Cannot segment {} timesteps to {} timesteps."
+                         .format(count, segments))
+
+    # values of all timeseries as one array (timestep, column)
+    frames = {name: data[name] for name in TIMESERIES
+              if name in data and not data[name].empty}
+    values = {name: _period_values(frame, steps, 1, count)[0]
+              for name, frame in frames.items()}
+    features = np.concatenate(
+        [_normalize(array[np.newaxis])[0] for array in values.values()],
+        axis=1)
+
+    fixed = np.zeros(count, dtype=bool)
+    if peaks and 'demand' in values:
+        fixed[values['demand'].argmax(axis=0)] = True
+    starts = _segment(features, segments, fixed)
+    lengths = np.diff(np.append(starts, count))
+
+    segmented = dict(data)
+    errors = []
+    for name, frame in frames.items():
+        array = values[name]
+        sums = np.add.reduceat(array, starts, axis=0)
+        means = sums / lengths[:, np.newaxis]
+        segmented[name] = _aggregated_frame(
+            frame, timesteps[0],
+            (sums if name == 'demand' else means)[np.newaxis], segments)
+        error = np.sqrt(np.mean(
+            (_normalize(array[np.newaxis]) -
+             _normalize(np.repeat(means, lengths, axis=0)[np.newaxis],
+                        array[np.newaxis])) ** 2))
+        errors.append('{} {:.3f}'.format(name, error))
+    first = np.asarray(steps)[starts]
+    segmented['segmentation'] = pd.DataFrame(
+        {'first': first,
+         'last': first + lengths - 1,
+         'duration': lengths},
+        index=pd.RangeIndex(timesteps[0] + 1, timesteps[0] + segments + 1,
+                            name='t'))
+
+    print('Segmentation: {} timesteps represented by {} timesteps of '
+          '{} to {} timesteps; normalized RMSE: {}.'.format(
+              count, segments, lengths.min(), lengths.max(),
+              ', '.join(errors)))
+    return segmented
+
+
+def aggregation_error(prob, reference):
+    """Compare the result of an aggregated model with a reference result.
+
+    Args:
+        - prob: a solved model of aggregated or resampled data (or a
+          loaded result)
+        - reference: the solved model (or loaded result) of the original
+          data, e.g. of all timesteps of a year
+
+    Returns:
+        a DataFrame of costs by type and total capacities by process,
+        storage and transmission, with columns 'aggregated', 'reference'
+        and the relative 'error'
+    """
+    rows = {}
+    for label, result in (('aggregated', prob), ('reference', reference)):
+        values = [get_entity(result, 'costs')
+                  .rename(lambda cost_type: ('costs', cost_type))]
+        for name, level in (('cap_pro', 'pro'), ('cap_sto_c', 'sto'),
+                            ('cap_sto_p', 'sto'), ('cap_tra', 'tra')):
+            capacity = get_entity(result, name)
+            if capacity.empty:
+                continue
+            capacity = capacity.groupby(level=level).sum()
+            values.append(capacity.rename(lambda unit: (name, unit)))
+        rows[label] = pd.concat(values)
+    result = pd.DataFrame(rows)
+    result.index = pd.MultiIndex.from_tuples(result.index,
+                                             names=['Entity', 'Name'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['error'] = ((result['aggregated'] - result['reference']) /
+                           result['reference'].abs())
+    return result
+
+
+def _period_values(frame, steps, count, period_length):
+    """Values of a timeseries DataFrame (support_timeframe, t) at steps as
+    an array (period, step in period, column), support timeframes side by
+    side."""
+    stfs = frame.index.get_level_values('support_timeframe').unique()
+    arrays = [frame.xs(stf, level='support_timeframe')
+              .reindex(steps).to_numpy(dtype=float) for stf in stfs]
+    return np.concatenate(arrays, axis=1).reshape(count, period_length, -1)
+
+
+def _aggregated_frame(frame, initial, rep_values, period_length):
+    """Timeseries DataFrame of the representative periods, with the values
+    of the initial timestep kept."""
+    stfs = frame.index.get_level_values('support_timeframe').unique()
+    columns = frame.shape[1]
+    t = range(initial, initial + rep_values.shape[0] * period_length + 1)
+    frames = []
+    for i, stf in enumerate(stfs):
+        part = rep_values[:, :, i * columns:(i + 1) * columns]
+        part = np.vstack([frame.loc[(stf, initial)].to_numpy(dtype=float),
+                          part.reshape(-1, columns)])
+        frames.append(pd.DataFrame(
+            part, columns=frame.columns,
+            index=pd.MultiIndex.from_product([[stf], t],
+                                             names=frame.index.names)))
+    return pd.concat(frames)
+
+
+def _segment(features, segments, fixed):
+    """Merge neighbouring rows of features to the given number of segments.
+
+    Greedily merges the two neighbouring segments with the least increase
+    of the squared deviation from the segment means (Ward's criterion);
+    rows with fixed set stay single.
+
+    Returns:
+        array of the first row of each segment
+    """
+    count = len(features)
+    sums = features.astype(float)
+    lengths = np.ones(count)
+    following = np.arange(1, count + 1)
+    preceding = np.arange(-1, count - 1)
+    alive = np.ones(count, dtype=bool)
+
+    def cost(left, right):
+        difference = sums[left] / lengths[left] - sums[right] / lengths[right]
+        return (lengths[left] * lengths[right] /
+                (lengths[left] + lengths[right]) * difference.dot(difference))
+
+    # heap of (cost, left segment, right segment, lengths at the time)
+    heap = [(cost(i, i + 1), i, i + 1, 2) for i in range(count - 1)
+            if not fixed[i] and not fixed[i + 1]]
+    heapq.heapify(heap)
+    remaining = count
+    while remaining > segments and heap:
+        _, left, right, length = heapq.heappop(heap)
+        if (not alive[left] or not alive[right] or
+                following[left] != right or
+                lengths[left] + lengths[right] != length):
+            continue  # outdated entry
+        sums[left] += sums[right]
+        lengths[left] += lengths[right]
+        alive[right] = False
+        following[left] = following[right]
+        if following[left] < count:
+            preceding[following[left]] = left
+        remaining -= 1
+        for neighbour_left, neighbour_right in ((preceding[left], left),
+                                                (left, following[left])):
+            if (0 <= neighbour_left and neighbour_right < count and
+                    not fixed[neighbour_left] and
+                    not fixed[neighbour_right]):
+                heapq.heappush(heap, (
+                    cost(neighbour_left, neighbour_right),
+                    neighbour_left, neighbour_right,
+                    lengths[neighbour_left] + lengths[neighbour_right]))
+    if remaining > segments:
+        raise ValueError("{} timesteps are too few to keep the peak "
+                         "timesteps.".format(segments))
+    return np.flatnonzero(alive)
+
+
+def _normalize(array, reference=None):
+    """Scale each column of an (period, step, column) array like the columns
+    of reference (default: array) to [0, 1]; constant columns become zero."""
+    if reference is None:
+        reference = array
+    low = np.nanmin(reference, axis=(0, 1))
+    span = np.nanmax(reference, axis=(0, 1)) - low
+    span[span == 0] = 1
+    return np.nan_to_num((array - low) / span)
+
+
+def _cluster(features, k, method, rng):
+    """Cluster the rows of features into k clusters.
+
+    Returns:
+        a tuple of the cluster of each row and, for kmedoids, the row of
+        each cluster's medoid (for kmeans, only the number of clusters
+        matters)
+    """
+    # k-means++ initialization
+    centers = [rng.integers(len(features))]
+    distance = ((features - features[centers[0]]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        if distance.sum() > 0:
+            centers.append(rng.choice(len(features),
+                                      p=distance / distance.sum()))
+        else:
+            centers.append(int(np.argmax(
+                ~np.isin(np.arange(len(features)), centers))))
+        distance = np.minimum(
+            distance, ((features - features[centers[-1]]) ** 2).sum(axis=1))
+    means = features[centers]
+
+    labels = None
+    for _ in range(300):
+        distances = ((features[:, np.newaxis, :] -
+                      means[np.newaxis, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        new_labels[centers] = np.arange(k)  # clusters do not become empty
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+        for c in range(k):
+            rows = np.flatnonzero(labels == c)
+            if method == 'kmeans':
+                means[c] = features[rows].mean(axis=0)
+            else:
+                # medoid: member with the least distance to all others
+                within = ((features[rows][:, np.newaxis, :] -
+                           features[rows][np.newaxis, :, :]) ** 2).sum(
+                    axis=2)
+                centers[c] = rows[within.sum(axis=1).argmin()]
+                means[c] = features[centers[c]]
+        if method == 'kmeans':
+            # keep a member per cluster, the one nearest to the mean
+            centers = [
+                np.flatnonzero(labels == c)[
+                    ((features[labels == c] - means[c]) ** 2).sum(
+                        axis=1).argmin()]
+                for c in range(k)]
+    return labels, centers
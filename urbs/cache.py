@@ -0,0 +1,156 @@
+import hashlib
+import os
+import pickle
+import pandas as pd
+
+# environment variable naming the directory of the input cache; without it,
+# input files are always parsed (c.f. cache_directory)
+CACHE_ENV = 'URBS_CACHE_DIR'
+
+# maximum size (bytes) of the input cache
+CACHE_SIZE = 2 ** 30
+
+# increase whenever the structure of cached results changes
+CACHE_VERSION = 2
+
+
+def cache_directory(cache_dir=None):
+    """Directory of the input cache.
+
+    Args:
+        - cache_dir: a directory, or None for the one named by the
+          environment variable URBS_CACHE_DIR
+
+    Returns:
+        the directory, or None if the cache is disabled
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_ENV) or None
+    return cache_dir
+
+
+def cache_key(function, filename, *args):
+    """Key of the cached result of function(filename, *args).
+
+    The key covers the file's path as well as the arguments and the pandas
+    version used to pickle the result. Whether the file is unchanged is
+    checked separately (c.f. file_stamp).
+    """
+    return hashlib.sha256(repr((
+        function.__module__, function.__name__, os.path.abspath(filename),
+        args, CACHE_VERSION, pd.__version__)).encode()).hexdigest()
+
+
+def file_stamp(filename):
+    """Modification time and size of a file."""
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(filename):
+    """SHA-256 of the content of a file."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached(function, filename, *args, cache_dir=None, max_size=CACHE_SIZE):
+    """Return function(filename, *args), using an on-disk cache.
+
+    The cache is only used if cache_dir is given or the environment variable
+    URBS_CACHE_DIR is set. Results are pickled to the cache directory, one
+    entry per file and arguments, together with the file's modification
+    time, size and content hash. An entry is used if the modification time
+    and size are unchanged; otherwise the file content is hashed, and the
+    entry is only used if the content is unchanged, e.g. for a touched file.
+    The least recently used entries are removed when the cache grows beyond
+    max_size bytes. A cache which cannot be read or written is ignored, and
+    an entry which cannot be unpickled (e.g. written by another urbs or
+    pandas version) is removed.
+
+    Args:
+        - function: a function reading the file filename
+        - filename: the input file
+        - args: further arguments of function
+        - cache_dir: (optional) cache directory, default: URBS_CACHE_DIR
+        - max_size: maximum size of the cache directory (bytes)
+
+    Returns:
+        the result of function(filename, *args)
+    """
+    cache_dir = cache_directory(cache_dir)
+    if cache_dir is None:
+        return function(filename, *args)
+
+    path = os.path.join(cache_dir,
+                        cache_key(function, filename, *args) + '.pkl')
+    stamp = file_stamp(filename)
+    hit, digest = False, None
+    try:
+        with open(path, 'rb') as f:
+            cached_stamp, cached_digest = pickle.load(f)
+            if cached_stamp != stamp:
+                # only hash the file if its time stamp or size changed
+                digest = file_digest(filename)
+            if digest is None or digest == cached_digest:
+                result, hit = pickle.load(f), True
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError,
+            AttributeError, ImportError):
+        # a corrupt or stale entry, e.g. of a class or module (ImportError
+        # includes ModuleNotFoundError) which no longer exists
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    if hit and digest is None:
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return result
+    if not hit:
+        result = function(filename, *args)
+        if digest is None:
+            digest = file_digest(filename)
+    # a new entry, or the new time stamp of a touched, but unchanged file
+    store(path, (stamp, digest), result, cache_dir, max_size)
+    return result
+
+
+def store(path, header, result, cache_dir, max_size):
+    """Pickle header and result to the cache entry path."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first, so that concurrent runs never
+        # read an incomplete result
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as f:
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        evict(cache_dir, max_size)
+    except OSError:
+        pass
+
+
+def evict(cache_dir, max_size):
+    """Remove the least recently used results beyond max_size bytes."""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.pkl'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = 0
+    for _, size, path in sorted(entries, reverse=True):
+        total_size += size
+        if total_size > max_size:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,560 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyomo.core as pyomo
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.opt.base import SolverFactory
+from pyomo.repn import generate_standard_repn
+from .model import create_model, total_cost_by_type
+from .output import get_cost_breakdown
+from .pyomoio import get_entity
+from .saveload import ResultContainer, create_result_cache
+
+# capacity entities of a result and their input DataFrame and columns
+# (inst-cap, cap-up, cap-lo)
+CAPACITIES = {
+    'cap_pro': ('process', [('inst-cap', 'cap-up', 'cap-lo')]),
+    'cap_sto_c': ('storage', [('inst-cap-c', 'cap-up-c', 'cap-lo-c')]),
+    'cap_sto_p': ('storage', [('inst-cap-p', 'cap-up-p', 'cap-lo-p')]),
+    'cap_tra': ('transmission', [('inst-cap', 'cap-up', 'cap-lo')])}
+
+# index level names of timesteps in a result cache (c.f. get_entity)
+TIME_LEVELS = ['t', 'tm', 't_', 'tm_', 'tt_']
+
+# relative tolerance of the capacities, storage contents and CO2 emissions of
+# a reference result, which is feasible only up to the tolerance of its solver
+TOLERANCE = 1e-6
+
+
+def fix_capacities(data, result):
+    """Fix the capacities of all units to the ones of a result.
+
+    The lower and upper capacity bounds (cap-lo, cap-up) of processes,
+    storages and transmissions are set to the capacities of the result, so
+    the model only optimizes their operation; installed capacities are
+    kept, so investment costs stay the same as in the result. As the result
+    is feasible only up to the tolerance of its solver, the bounds of new
+    capacities are widened by the relative TOLERANCE; units without new
+    capacity keep cap-up equal to inst-cap, i.e. a constant capacity. The
+    energy-to-power ratios of storages are dropped, as the fixed capacities
+    keep it.
+
+    Args:
+        - data: input data dict (c.f. read_input)
+        - result: a solved model or a loaded result (c.f. urbs.load) of the
+          same units, e.g. of a capacity expansion run
+
+    Returns:
+        the data dict with fixed capacities
+    """
+    data = dict(data)
+    for name, (frame_name, columns) in CAPACITIES.items():
+        frame = data.get(frame_name)
+        if frame is None or frame.empty:
+            continue
+        capacity = get_entity(result, name)
+        capacity = (capacity.reindex(pd.MultiIndex.from_tuples(frame.index))
+                    .fillna(0).clip(lower=0).to_numpy())
+        frame = frame.copy()
+        for inst, up, lo in columns:
+            constant = capacity == frame[inst].fillna(0).to_numpy()
+            frame[up] = np.where(constant, capacity,
+                                 capacity * (1 + TOLERANCE))
+            frame[lo] = np.where(constant, capacity,
+                                 capacity * (1 - TOLERANCE))
+        if frame_name == 'storage' and 'ep-ratio' in frame.columns:
+            frame['ep-ratio'] = np.nan
+        data[frame_name] = frame
+    return data
+
+
+def has_fixed_capacities(data):
+    """True if the capacities of all units are fixed, i.e. their cap-up
+    equals their inst-cap or cap-lo up to the tolerance of fix_capacities"""
+    for frame_name, columns in CAPACITIES.values():
+        frame = data.get(frame_name)
+        if frame is None or frame.empty:
+            continue
+        for inst, up, lo in columns:
+            if not ((frame[up] == frame[inst]) |
+                    (frame[up] - frame[lo] <=
+                     2 * TOLERANCE * frame[up])).all():
+                return False
+    return True
+
+
+def rolling_horizon(data, solver, window=168, lookahead=24, dt=1,
+                    timesteps=None, objective='cost', reference=None,
+                    tee=False, **kwargs):
+    """Solve the operation of fixed capacities in successive time windows.
+
+    Instead of one model of all timesteps, a model of each window (e.g. a
+    week) and a look-ahead (e.g. a day) is solved; only the results of the
+    window are kept. Each model starts with the timesteps before its window
+    which DSM may shift energy from or to (at least the last timestep
+    before it), whose variables are fixed to the results of the previous
+    window: so storage contents (e_sto_con), DSM shifts and the throughput
+    limiting the gradients (tau_pro) are handed over.
+
+    Given a reference result (e.g. of the capacity expansion run), each
+    model also has the timesteps after its look-ahead which DSM may shift
+    energy from or to, whose variables are fixed to the ones of the
+    reference: so the DSM shifts of the reference over the end of the
+    look-ahead are kept, without which fixed capacities may not suffice.
+    The storage content at the end of each window and of each model has to
+    reach the one of the reference, and the CO2 limit of each model is the
+    emission of its timesteps in the reference (scaled to a year). Without a
+    reference, the storage content at the end of each model has to reach
+    the one at the start of the first window, like at the end of a model of
+    all timesteps, so storages which are emptied over more than a window and
+    a look-ahead are hardly used; annual limits apply to each model scaled
+    to a year.
+
+    The results of all windows are stitched to one result, which can be
+    saved, reported and plotted like the one of a model of all timesteps.
+    The time-dependent costs of the windows are scaled to a year by the
+    weight of all timesteps.
+
+    Args:
+        - data: input data dict with fixed capacities (c.f. fix_capacities)
+        - solver: solver name, e.g. 'glpk' or 'appsi_highs'
+        - window: number of timesteps of a window, default: 168
+        - lookahead: number of further timesteps of each model (except the
+          last), default: 24
+        - dt: timestep duration in hours (default: 1)
+        - timesteps: optional list of timesteps (the first one being the
+          initial timestep), default: demand timeseries
+        - objective: "cost" (default) or "CO2"
+        - reference: optional result of the same timesteps (c.f.
+          fix_capacities), whose storage contents the models have to reach
+          and whose CO2 emissions they may not exceed
+        - tee: show solver output, default: False
+        - kwargs: further arguments of create_model, e.g.
+          dsm_formulation='level'
+
+    Returns:
+        the result (c.f. urbs.saveload.ResultContainer)
+    """
+    if 'aggregation' in data or 'segmentation' in data:
+        raise ValueError("Rolling horizon dispatch needs the timeseries of "
+                         "all timesteps.")
+    if not has_fixed_capacities(data):
+        raise ValueError("Rolling horizon dispatch needs fixed capacities "
+                         "(cap-up equal to inst-cap or cap-lo), c.f. "
+                         "fix_capacities.")
+    if timesteps is None:
+        timesteps = sorted(set(data['demand'].index.get_level_values('t')))
+    timesteps = list(timesteps)
+    history = _history_steps(data, dt)
+    steps = timesteps[1:]
+    windows = [steps[i:i + window] for i in range(0, len(steps), window)]
+    optim = SolverFactory(solver)
+    targets = emissions = None
+    if reference is not None:
+        if not data['storage'].empty:
+            targets = (get_entity(reference, 'e_sto_con').unstack('t') *
+                       (1 - TOLERANCE))
+        emissions = _emissions(reference)
+
+    fixed = {}  # results of the timesteps before the next window
+    initial = None  # storage content at the start
+    results = []
+    costs = []
+    for number, kept in enumerate(windows):
+        start = time.perf_counter()
+        first = max(kept[0] - history - 1, timesteps[0])
+        last = end = min(kept[-1] + lookahead, timesteps[-1])
+        if reference is not None:
+            last = min(end + history, timesteps[-1])
+        window_data = data
+        if emissions is not None:
+            window_data = _limit_emissions(
+                data, emissions.loc[first + 1:last].sum(),
+                8760.0 / ((last - first) * dt))
+        prob = create_model(window_data, dt, range(first, last + 1),
+                            objective, cost_breakdown=False, **kwargs)
+        if number > 0:
+            _fix_history(prob, fixed, kept[0])
+            _link_storage(prob)
+        if last > end:
+            _fix_future(prob, _reference_history(reference, end + 1, last),
+                        end)
+        if targets is not None:
+            for step in sorted({kept[-1], last}):
+                _target_storage(prob, targets[step].to_dict(), step)
+        elif number > 0:
+            _target_storage(prob, initial, last)
+        _solve(prob, optim, tee, 'Window {} (timesteps {} to {})'.format(
+            number + 1, kept[0], kept[-1]))
+        if number == 0 and prob.mode['sto']:
+            initial = {index[1:]: var.value for index, var
+                       in prob.e_sto_con.items() if index[0] == first}
+
+        keep = set(kept) if number > 0 else set(kept) | {first}
+        results.append(_kept_results(prob, keep))
+        costs.append(_kept_costs(prob, keep))
+        fixed = _history_values(prob, kept[-1] - history, kept[-1])
+        print('Window {}/{}: timesteps {} to {} (model {} to {}) solved in '
+              '{:.1f}s'.format(number + 1, len(windows), kept[0], kept[-1],
+                               first, last, time.perf_counter() - start))
+
+    return _stitch(data, prob.mode, timesteps, dt, results, costs)
+
+
+def chunked_dispatch(data, solver, reference, chunk=730, dt=1,
+                     timesteps=None, objective='cost', workers=1,
+                     threads=None, tee=False, **kwargs):
+    """Solve the operation of fixed capacities in independent time chunks.
+
+    The timesteps are split into chunks (e.g. of about a month), which are
+    solved independently of each other, in parallel by worker processes if
+    workers > 1. Like a window of rolling_horizon, the model of each chunk
+    starts with the timesteps before it which DSM may shift energy from or
+    to, but their variables are fixed to the ones of a reference result
+    (e.g. of the capacity expansion run): so the storage contents, DSM
+    shifts and the throughput limiting the gradients at the start of the
+    chunk follow the reference. Also the variables of as many timesteps
+    after the chunk are fixed to the reference, like the ones after the
+    look-ahead of rolling_horizon. At the end of the chunk, the storage
+    contents have to reach the ones of the reference; its CO2 limit is the
+    emission of the modelled timesteps in the reference (scaled to a year).
+    Chunks have to be longer than the DSM delay. So the dispatch of the same
+    capacities can be recomputed quickly for changed input, e.g. prices or
+    timeseries.
+
+    The results of all chunks are stitched to one result like the ones of
+    rolling_horizon.
+
+    Args:
+        - data: input data dict with fixed capacities (c.f. fix_capacities)
+        - solver: solver name, e.g. 'glpk' or 'appsi_highs'
+        - reference: result of the same timesteps (c.f. fix_capacities)
+        - chunk: number of timesteps of a chunk, default: 730
+        - workers: (optional) number of worker processes, default: 1
+        - threads: (optional) number of solver threads per worker; choose
+          workers * threads not larger than the number of cores, default:
+          solver default
+        - other arguments: see rolling_horizon
+
+    Returns:
+        the result (c.f. urbs.saveload.ResultContainer)
+    """
+    if 'aggregation' in data or 'segmentation' in data:
+        raise ValueError("Chunked dispatch needs the timeseries of all "
+                         "timesteps.")
+    if not has_fixed_capacities(data):
+        raise ValueError("Chunked dispatch needs fixed capacities (cap-up "
+                         "equal to inst-cap or cap-lo), c.f. "
+                         "fix_capacities.")
+    if timesteps is None:
+        timesteps = sorted(set(data['demand'].index.get_level_values('t')))
+    timesteps = list(timesteps)
+    history = _history_steps(data, dt)
+    steps = timesteps[1:]
+    chunks = [steps[i:i + chunk] for i in range(0, len(steps), chunk)]
+    targets = None
+    if not data['storage'].empty:
+        targets = (get_entity(reference, 'e_sto_con').unstack('t') *
+                   (1 - TOLERANCE))
+    emissions = _emissions(reference)
+
+    args = []
+    for number, kept in enumerate(chunks):
+        first = max(kept[0] - history - 1, timesteps[0])
+        last = min(kept[-1] + history, timesteps[-1])
+        chunk_data = data
+        if emissions is not None:
+            chunk_data = _limit_emissions(
+                data, emissions.loc[first + 1:last].sum(),
+                8760.0 / ((last - first) * dt))
+        fixed = future = end = None
+        if number > 0:
+            fixed = _reference_history(reference, first, kept[0] - 1)
+        if last > kept[-1]:
+            future = _reference_history(reference, kept[-1] + 1, last)
+        if targets is not None:
+            end = targets[kept[-1]].to_dict()
+        keep = set(kept) if number > 0 else set(kept) | {first}
+        name = 'Chunk {}/{} (timesteps {} to {})'.format(
+            number + 1, len(chunks), kept[0], kept[-1])
+        args.append((chunk_data, solver, dt, first, last, keep, objective,
+                     fixed, future, end, name, threads, tee, kwargs))
+
+    if workers <= 1:
+        solved = [_solve_chunk(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_solve_chunk, *arg) for arg in args]
+            solved = [future.result() for future in futures]
+
+    results = [result for result, costs, mode in solved]
+    costs = [costs for result, costs, mode in solved]
+    return _stitch(data, solved[-1][2], timesteps, dt, results, costs)
+
+
+def _solve_chunk(data, solver, dt, first, last, keep, objective, fixed,
+                 future, end, name, threads, tee, kwargs):
+    """Solve a chunk of chunked_dispatch and return its kept results and
+    costs (c.f. _kept_results and _kept_costs) and its mode"""
+    started = time.perf_counter()
+    prob = create_model(data, dt, range(first, last + 1), objective,
+                        cost_breakdown=False, **kwargs)
+    if fixed is not None:
+        _fix_history(prob, fixed, min(keep))
+        _link_storage(prob)
+    if future is not None:
+        _fix_future(prob, future, max(keep))
+    if end is not None:
+        _target_storage(prob, end, max(keep))
+    optim = SolverFactory(solver)
+    if threads is not None and 'glpk' not in solver:
+        optim.options['threads'] = threads
+    _solve(prob, optim, tee, name)
+    print('{} solved in {:.1f}s'.format(name, time.perf_counter() - started))
+    return _kept_results(prob, keep), _kept_costs(prob, keep), prob.mode
+
+
+def _solve(m, optim, tee, name):
+    """Solve a model and load its solution, if it is optimal"""
+    result = optim.solve(m, tee=tee, load_solutions=False)
+    if str(result.solver.termination_condition) != 'optimal':
+        raise RuntimeError("{} could not be solved: termination condition "
+                           "{}.".format(name,
+                                        result.solver.termination_condition))
+    m.solutions.load_from(result)
+
+
+def _history_steps(data, dt):
+    """Number of timesteps before a window which DSM may shift energy from
+    or to, i.e. the longest DSM delay or recovery time"""
+    dsm = data.get('dsm')
+    if dsm is None or dsm.empty:
+        return 0
+    hours = dsm[['delay', 'recov']].dropna(how='all').fillna(0).max().max()
+    return max(int(hours / dt), 1)
+
+
+def _emissions(result):
+    """CO2 emissions of a result by timestep (rows) and support timeframe
+    (columns)"""
+    emissions = []
+    for name, sign in (('e_pro_out', 1), ('e_pro_in', -1)):
+        flow = get_entity(result, name)
+        if 'CO2' in flow.index.get_level_values('com'):
+            emissions.append(sign * flow.xs('CO2', level='com')
+                             .groupby(level=['tm', 'stf']).sum())
+    if not emissions:
+        return None
+    return pd.concat(emissions).groupby(level=['tm', 'stf']).sum().unstack()
+
+
+def _limit_emissions(data, emissions, weight):
+    """Data whose CO2 limits are the emissions of a model's timesteps,
+    scaled to a year by its weight (c.f. res_global_co2_limit_rule)"""
+    global_prop = data['global_prop'].copy()
+    for stf, emission in emissions.items():
+        key = (stf, 'CO2 limit')
+        if (key in global_prop.index and
+                0 <= global_prop.loc[key, 'value'] < np.inf):
+            global_prop.loc[key, 'value'] = (max(emission, 0) * weight *
+                                             (1 + TOLERANCE))
+    data = dict(data)
+    data['global_prop'] = global_prop
+    return data
+
+
+def _time_positions(component, m):
+    """Positions of the timesteps in the indices of a component"""
+    if not component.is_indexed():
+        return []
+    positions = []
+    position = 0
+    for subset in component.index_set().subsets():
+        domain = getattr(subset, 'domain', None) if subset.dimen > 1 \
+            else None
+        parts = (domain.subsets() if domain is not None and
+                 len(list(domain.subsets())) == subset.dimen else [subset])
+        for part in parts:
+            if part is m.t or part is m.tm:
+                positions.append(position)
+            position += part.dimen
+    return positions
+
+
+def _time_components(m, ctype):
+    """Components of a type with timesteps in their indices, and the
+    positions of these"""
+    for component in m.component_objects(ctype, descend_into=True):
+        positions = _time_positions(component, m)
+        if positions:
+            yield component, positions
+
+
+def _history_values(m, first, last):
+    """Values of all variables with a timestep from first to last"""
+    values = {}
+    for var, positions in _time_components(m, pyomo.Var):
+        values[var.name] = {
+            index: data.value for index, data in var.items()
+            if any(first <= index[p] <= last for p in positions)}
+    return values
+
+
+def _reference_history(reference, first, last):
+    """Values of all variables of a reference result with a timestep from
+    first to last, like the ones of _history_values"""
+    if not hasattr(reference, '_result'):
+        reference._result = create_result_cache(reference)
+    values = {}
+    for name, entity in reference._result.items():
+        if not isinstance(entity, pd.Series) or entity.empty:
+            continue
+        positions = [p for p, level in enumerate(entity.index.names)
+                     if level in TIME_LEVELS]
+        if not positions:
+            continue
+        inside = np.zeros(len(entity), dtype=bool)
+        for p in positions:
+            steps = entity.index.get_level_values(p)
+            inside |= (steps >= first) & (steps <= last)
+        values[name] = entity[inside].to_dict()
+    return values
+
+
+def _fix_history(m, fixed, start):
+    """Fix all variables with a timestep before start to the values of the
+    previous window (to zero, if it had no such variable) and deactivate
+    the constraints which have only fixed variables"""
+    _fix_variables(m, fixed, lambda step: step < start)
+
+
+def _fix_future(m, fixed, end):
+    """Fix all variables with a timestep after end to the values of the
+    reference, so that DSM shifts over end follow it, and deactivate the
+    constraints which have only fixed variables"""
+    _fix_variables(m, fixed, lambda step: step > end)
+
+
+def _fix_variables(m, fixed, outside):
+    """Fix all variables with a timestep outside the solved timesteps to
+    the given values (to zero, if the value is None or NaN, i.e. the
+    variable had no value) and deactivate the constraints outside them which
+    have only fixed variables; a variable without given value is an error"""
+    for var, positions in _time_components(m, pyomo.Var):
+        values = fixed.get(var.name, {})
+        for index, data in var.items():
+            if any(outside(index[p]) for p in positions):
+                if index not in values:
+                    raise ValueError("No value to fix {} to: the previous "
+                                     "window or the reference has no such "
+                                     "variable.".format(data.name))
+                value = values[index]
+                data.fix(0 if value is None or pd.isna(value) else value)
+    for con, positions in _time_components(m, pyomo.Constraint):
+        for index, data in con.items():
+            if (any(outside(index[p]) for p in positions) and
+                    all(var.fixed for var in identify_variables(data.body))):
+                data.deactivate()
+
+
+def _link_storage(m):
+    """Start a window with the storage content handed over instead of the
+    initial one (c.f. def_initial_storage_state)"""
+    if m.mode['sto']:
+        m.def_initial_storage_state.deactivate()
+
+
+def _target_storage(m, targets, step):
+    """The storage content at a timestep has to reach a target content of
+    each storage; this replaces the cyclicity of the content at the end of
+    the model (c.f. res_storage_state_cyclicity)"""
+    if not m.mode['sto']:
+        return
+    m.res_storage_state_cyclicity.deactivate()
+    for index in m.sto_tuples:
+        var = m.e_sto_con[(step,) + index]
+        var.setlb(max(var.lb or 0, targets.get(index, 0)))
+
+
+def _kept_results(m, keep):
+    """Result cache of a window, with only the kept timesteps of all
+    time-dependent entities"""
+    results = {}
+    for name, entity in create_result_cache(m).items():
+        if entity.index.nlevels and entity.index.names[0] in TIME_LEVELS:
+            entity = entity[entity.index.get_level_values(0).isin(keep)]
+        results[name] = entity
+    return results
+
+
+def _kept_costs(m, keep):
+    """Costs by type and cost breakdown of a window: the part without
+    timesteps and the part of the kept timesteps, which is scaled to a year
+    by the weight of the window (c.f. m.weight). Both are evaluated from the
+    cost terms (c.f. total_cost_by_type and get_cost_breakdown), summing up
+    the terms of the variables without timestep and, for the second part,
+    the ones of the variables of the kept timesteps."""
+    steps = {}
+    fixed = []
+    for var, positions in _time_components(m, pyomo.Var):
+        for index, data in var.items():
+            steps[id(data)] = index[positions[0]]
+            if data.fixed:
+                fixed.append(data)
+
+    def evaluate(kept):
+        def value(expression):
+            repn = generate_standard_repn(expression, quadratic=False)
+            return repn.constant + sum(
+                coefficient * pyomo.value(variable)
+                for coefficient, variable
+                in zip(repn.linear_coefs, repn.linear_vars)
+                if id(variable) not in steps or
+                (kept and steps[id(variable)] in keep))
+
+        costs = pd.Series({cost_type: value(total_cost_by_type(m, cost_type))
+                           for cost_type in m.cost_type})
+        return costs, get_cost_breakdown(m, value)
+
+    # fixed variables (c.f. _fix_variables) would be constants of the cost
+    # terms; unfix them while evaluating, keeping their values
+    for data in fixed:
+        data.unfix()
+    try:
+        return evaluate(False), evaluate(True), pyomo.value(m.weight)
+    finally:
+        for data in fixed:
+            data.fix()
+
+
+def _stitch(data, mode, timesteps, dt, results, costs):
+    """Result of all windows: time-dependent entities of all windows, other
+    ones of the last window, and the costs of all windows"""
+    weight = 8760.0 / ((len(timesteps) - 1) * dt)
+    (static_costs, static_breakdown), _, _ = costs[0]
+    total_costs = static_costs.copy()
+    breakdown = {name: entity.copy()
+                 for name, entity in static_breakdown.items()}
+    for (static_w, breakdown_w), (kept_w, kept_breakdown_w), weight_w \
+            in costs:
+        factor = weight / weight_w
+        total_costs += (kept_w - static_w) * factor
+        for name in breakdown:
+            breakdown[name] += ((kept_breakdown_w[name] - breakdown_w[name]) *
+                                factor)
+
+    result = {}
+    for name, entity in results[-1].items():
+        if entity.index.nlevels and entity.index.names[0] in TIME_LEVELS:
+            entity = pd.concat([r[name] for r in results])
+        result[name] = entity
+    result['costs'] = pd.Series(
+        total_costs.reindex(result['costs'].index).to_numpy(),
+        index=result['costs'].index, name=result['costs'].name)
+    result.update(breakdown)
+    result['weight'] = pd.Series(weight, index=result['weight'].index,
+                                 name=result['weight'].name)
+    prob = ResultContainer(data, result)
+    prob.mode = mode
+    return prob
@@ -1,6 +1,7 @@
 import math
 import pyomo.core as pyomo
 from .modelhelper import commodity_subset
+from .periods import duration, weight
 
 
 def add_buy_sell_price(m):
@@ -59,7 +60,7 @@ def res_sell_step_rule(m, tm, stf, sit, com, com_type):
         return pyomo.Constraint.Skip
     else:
         return (m.e_co_sell[tm, stf, sit, com, com_type] <=
-                m.dt * m.commodity_dict['maxperhour']
+                duration(m, tm) * m.commodity_dict['maxperhour']
                 [(stf, sit, com, com_type)])
 
 
@@ -73,8 +74,7 @@ def res_sell_total_rule(m, stf, sit, com, com_type):
         total_consumption = 0
         for tm in m.tm:
             total_consumption += (
-                m.e_co_sell[tm, stf, sit, com, com_type])
-        total_consumption *= m.weight
+                m.e_co_sell[tm, stf, sit, com, com_type] * weight(m, tm))
         return (total_consumption <=
                 m.commodity_dict['max'][(stf, sit, com, com_type)])
 
@@ -85,7 +85,7 @@ def res_buy_step_rule(m, tm, stf, sit, com, com_type):
         return pyomo.Constraint.Skip
     else:
         return (m.e_co_buy[tm, stf, sit, com, com_type] <=
-                m.dt * m.commodity_dict['maxperhour']
+                duration(m, tm) * m.commodity_dict['maxperhour']
                 [(stf, sit, com, com_type)])
 
 
@@ -99,8 +99,7 @@ def res_buy_total_rule(m, stf, sit, com, com_type):
         total_consumption = 0
         for tm in m.tm:
             total_consumption += (
-                m.e_co_buy[tm, stf, sit, com, com_type])
-        total_consumption *= m.weight
+                m.e_co_buy[tm, stf, sit, com, com_type] * weight(m, tm))
         return (total_consumption <=
                 m.commodity_dict['max'][(stf, sit, com, com_type)])
 
@@ -130,8 +129,8 @@ def search_sell_buy_tuple(m, stf, sit_in, pro_in, coin):
     Returns:
         a process
     """
-    pro_output_tuples = [x for x in list(m.pro_output_tuples.data()) if x[1] == sit_in]
-    pro_input_tuples = [x for x in list(m.pro_input_tuples.data()) if x[1] == sit_in]
+    pro_output_tuples = [x for x in m.pro_output_tuples if x[1] == sit_in]
+    pro_input_tuples = [x for x in m.pro_input_tuples if x[1] == sit_in]
     # search the output commodities for the "buy" process
     # buy_out = (stf, site, output_commodity)
     buy_out = set([(x[0], x[1], x[3])
@@ -174,7 +173,7 @@ def revenue_costs(m):
     try:
         return -sum(
             m.e_co_sell[(tm,) + c] *
-            m.buy_sell_price_dict[c[2]][(c[0], tm)] * m.weight *
+            m.buy_sell_price_dict[c[2]][(c[0], tm)] * weight(m, tm) *
             m.commodity_dict['price'][c] *
             m.commodity_dict['cost_factor'][c]
             for tm in m.tm
@@ -182,7 +181,7 @@ def revenue_costs(m):
     except KeyError:
         return -sum(
             m.e_co_sell[(tm,) + c] *
-            m.buy_sell_price_dict[c[2], ][(c[0], tm)] * m.weight *
+            m.buy_sell_price_dict[c[2], ][(c[0], tm)] * weight(m, tm) *
             m.commodity_dict['price'][c] *
             m.commodity_dict['cost_factor'][c]
             for tm in m.tm
@@ -194,7 +193,7 @@ def purchase_costs(m):
     try:
         return sum(
             m.e_co_buy[(tm,) + c] *
-            m.buy_sell_price_dict[c[2]][(c[0], tm)] * m.weight *
+            m.buy_sell_price_dict[c[2]][(c[0], tm)] * weight(m, tm) *
             m.commodity_dict['price'][c] *
             m.commodity_dict['cost_factor'][c]
             for tm in m.tm
@@ -202,7 +201,7 @@ def purchase_costs(m):
     except KeyError:
         return sum(
             m.e_co_buy[(tm,) + c] *
-            m.buy_sell_price_dict[c[2], ][(c[0], tm)] * m.weight *
+            m.buy_sell_price_dict[c[2], ][(c[0], tm)] * weight(m, tm) *
             m.commodity_dict['price'][c] *
             m.commodity_dict['cost_factor'][c]
             for tm in m.tm
@@ -1,5 +1,8 @@
 import math
 import pyomo.core as pyomo
+from .batch import add_batch_constraint, equalities, terms
+from .modelhelper import group_tuples
+from .periods import duration
 
 
 def add_time_variable_efficiency(m):
@@ -9,21 +12,23 @@ def add_time_variable_efficiency(m):
     # get all support timeframes for which time variable efficiency is enabled
     for key in m.eff_factor_dict[tuple(m.eff_factor_dict.keys())[0]]:
         tve_stflist.add(tuple(key)[0])
+    r_out_by_pro = group_tuples(m.r_out_dict.keys(), (0, 1))
     m.pro_timevar_output_tuples = pyomo.Set(
         within=m.stf * m.sit * m.pro * m.com,
         initialize=[(stf, site, process, commodity)
                     for stf in tve_stflist
                     for (site, process) in tuple(m.eff_factor_dict.keys())
-                    for (st, pro, commodity) in tuple(m.r_out_dict.keys())
-                    if process == pro and st == stf and commodity not in
-                    m.com_env],
+                    for (_, _, commodity)
+                    in r_out_by_pro.get((stf, process), ())
+                    if commodity not in m.com_env],
         doc='Outputs of processes with time dependent efficiency')
 
     # time variable efficiency rules
-    m.def_process_timevar_output = pyomo.Constraint(
-        m.tm, (m.pro_timevar_output_tuples -
-               (m.pro_partial_output_tuples & m.pro_timevar_output_tuples)),
-        rule=def_pro_timevar_output_rule,
+    add_batch_constraint(
+        m, 'def_process_timevar_output',
+        (m.pro_timevar_output_tuples -
+         (m.pro_partial_output_tuples & m.pro_timevar_output_tuples)),
+        def_pro_timevar_output_rule,
         doc='e_pro_out = tau_pro * r_out * eff_factor')
     m.def_process_partial_timevar_output = pyomo.Constraint(
         m.tm, m.pro_partial_output_tuples & m.pro_timevar_output_tuples,
@@ -39,10 +44,13 @@ def add_time_variable_efficiency(m):
 #                   efficiency factor
 
 
-def def_pro_timevar_output_rule(m, tm, stf, sit, pro, com):
-    return(m.e_pro_out[tm, stf, sit, pro, com] ==
-           m.tau_pro[tm, stf, sit, pro] * m.r_out_dict[(stf, pro, com)] *
-           m.eff_factor_dict[(sit, pro)][stf, tm])
+def def_pro_timevar_output_rule(m, stf, sit, pro, com):
+    factors = (m.r_out_dict[(stf, pro, com)] *
+               m.eff_factor_dict.timeseries((sit, pro), stf, m.tm)).tolist()
+    return equalities([
+        terms(1, [m.e_pro_out[tm, stf, sit, pro, com] for tm in m.tm]),
+        terms([-factor for factor in factors],
+              [m.tau_pro[tm, stf, sit, pro] for tm in m.tm])])
 
 
 def def_pro_partial_timevar_output_rule(m, tm, stf, sit, pro, coo):
@@ -55,6 +63,7 @@ def def_pro_partial_timevar_output_rule(m, tm, stf, sit, pro, coo):
     online_factor = min_fraction * (r - R) / (1 - min_fraction)
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
     return (m.e_pro_out[tm, stf, sit, pro, coo] ==
-            (m.dt * m.cap_pro[stf, sit, pro] * online_factor +
+            (duration(m, tm) * m.cap_pro[stf, sit, pro] *
+             online_factor +
              m.tau_pro[tm, stf, sit, pro] * throughput_factor) *
             m.eff_factor_dict[(sit, pro)][(stf, tm)])
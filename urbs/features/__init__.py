@@ -4,6 +4,7 @@
     Demand site management,
     Buy and sell,
     Time variable efficiency,
+    Representative periods and timesteps of different durations,
 """
 
 from .transmission import add_transmission, add_transmission_dc, \
@@ -12,4 +13,10 @@ from .storage import add_storage, storage_balance, storage_cost
 from .dsm import add_dsm, dsm_surplus
 from .BuySellPrice import add_buy_sell_price, bsp_surplus, revenue_costs, \
                           purchase_costs
-from .TimeVarEff import add_time_variable_efficiency
\ No newline at end of file
+from .TimeVarEff import add_time_variable_efficiency
+from .periods import add_periods, add_durations, modelled_steps, weight, \
+                     duration, previous_timestep
+from .mutable import MUTABLE_PARAMS, add_mutable_params, \
+                     mutable_param_name
+from .batch import add_batch_constraint, durations, capacity_columns, \
+                   terms, equalities, less_equals
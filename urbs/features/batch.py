@@ -0,0 +1,99 @@
+import pyomo.core as pyomo
+from pyomo.common.gc_manager import PauseGC
+from pyomo.core.expr.numeric_expr import LinearExpression, \
+                                          MonomialTermExpression
+from pyomo.core.expr.relational_expr import EqualityExpression, \
+                                            InequalityExpression
+from pyomo.repn import generate_standard_repn
+from .periods import duration
+
+
+def add_batch_constraint(m, name, tuples, rule, doc=None):
+    """Add a constraint over m.tm x tuples whose rows are built per tuple.
+
+    rule(m, *index) returns the relational expressions of all modelled
+    timesteps (in the order of m.tm) of one index tuple, so that all
+    coefficients which only depend on the tuple are looked up once and the
+    linear expressions are assembled directly (c.f. terms and equalities).
+    Pyomo gets a rule which only looks up the prepared expressions; a dict
+    initializer is slower, as Pyomo then validates every key against the
+    index set. Garbage collection is paused until the constraint is
+    constructed, as none of the new objects is garbage, but each collection
+    traverses the whole model.
+
+    Args:
+        - m: the model
+        - name: name of the constraint, e.g. 'def_process_output'
+        - tuples: the index set of the constraint besides m.tm
+        - rule: function returning the constraints of one index tuple
+        - doc: documentation of the constraint
+
+    Returns:
+        the model with the additional constraint
+    """
+    with PauseGC():
+        rows = {}
+        for index in tuples:
+            for tm, row in zip(m.tm, rule(m, *index)):
+                rows[(tm,) + index] = row
+        m.add_component(name, pyomo.Constraint(
+            m.tm, tuples, rule=lambda m, *key: rows[key], doc=doc))
+    return m
+
+
+def durations(m):
+    """Durations of all modelled timesteps in hours"""
+    return [pyomo.value(duration(m, tm)) for tm in m.tm]
+
+
+def capacity_columns(capacity, factors):
+    """Terms and constants of -factor * capacity for all timesteps.
+
+    Args:
+        - capacity: a linear capacity expression, e.g. m.cap_pro[stf, sit, pro]
+        - factors: list with one factor per timestep
+
+    Returns:
+        the terms of each capacity variable (c.f. terms) and the list of
+        constants, or None if the capacity has no constant part
+    """
+    repn = generate_standard_repn(capacity)
+    columns = [terms([-factor * coefficient for factor in factors], variable)
+               for coefficient, variable
+               in zip(repn.linear_coefs, repn.linear_vars)]
+    if not repn.constant:
+        return columns, None
+    return columns, [-factor * repn.constant for factor in factors]
+
+
+def terms(coefficients, variables):
+    """Linear terms coefficient * variable of all timesteps.
+
+    Either argument is a single value for all timesteps or a list with one
+    value per timestep, e.g. terms(-r_out, [m.tau_pro[tm, ...] for tm in
+    m.tm]) or terms(factors, m.cap_pro_new[stf, sit, pro]).
+    """
+    if not isinstance(variables, list):
+        return [MonomialTermExpression((c, variables)) for c in coefficients]
+    if not isinstance(coefficients, list):
+        return [MonomialTermExpression((coefficients, v)) for v in variables]
+    return [MonomialTermExpression((c, v))
+            for c, v in zip(coefficients, variables)]
+
+
+def equalities(columns, constants=None):
+    """sum(columns) + constants == 0 for all timesteps, where columns are the
+    terms of all timesteps (c.f. terms) and constants an optional list with
+    one value per timestep"""
+    if constants is not None:
+        columns = columns + [constants]
+    return [EqualityExpression((LinearExpression(list(args)), 0))
+            for args in zip(*columns)]
+
+
+def less_equals(columns, constants=None):
+    """sum(columns) + constants <= 0 for all timesteps (c.f. equalities)"""
+    if constants is not None:
+        columns = columns + [constants]
+    return [InequalityExpression((LinearExpression(list(args)), 0), False)
+            for args in zip(*columns)]
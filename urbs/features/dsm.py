@@ -1,5 +1,5 @@
-import math
 import pyomo.core as pyomo
+from .periods import duration, period_bounds, steps_until, steps_within
 
 
 def add_dsm(m):
@@ -18,32 +18,44 @@ def add_dsm(m):
         initialize=tuple(m.dsm_dict["delay"].keys()),
         doc='Combinations of possible dsm by site, e.g. '
             '(2020, Mid, Elec)')
-    m.dsm_down_tuples = pyomo.Set(
-        within=m.tm*m.tm*m.stf*m.sit*m.com,
-        initialize=[(t, tt, stf, site, commodity)
-                    for (t, tt, stf, site, commodity)
-                    in dsm_down_time_tuples(m.timesteps[1:],
-                                            m.dsm_site_tuples,
-                                            m)],
-        doc='Combinations of possible dsm_down combinations, e.g. '
-            '(5001,5003,2020,Mid,Elec)')
+
+    # DSM time windows: delay and recovery time in timesteps of each
+    # (stf, sit, com), c.f. dsm_window and dsm_recovery_window (for
+    # timesteps of different durations, the windows are found by hours)
+    m.dsm_delay = {d: dsm_steps(m, m.dsm_dict['delay'][d])
+                   for d in m.dsm_site_tuples}
+    m.dsm_recov = {d: dsm_steps(m, m.dsm_dict['recov'][d])
+                   for d in m.dsm_site_tuples}
 
     # Variables
     m.dsm_up = pyomo.Var(
         m.tm, m.dsm_site_tuples,
         within=pyomo.NonNegativeReals,
         doc='DSM upshift')
-    m.dsm_down = pyomo.Var(
-        m.dsm_down_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='DSM downshift')
 
-    # DSM rules
-    m.def_dsm_variables = pyomo.Constraint(
-        m.tm, m.dsm_site_tuples,
-        rule=def_dsm_variables_rule,
-        doc='DSMup * efficiency factor n == DSMdo (summed)')
+    if m.dsm_formulation == 'level':
+        add_dsm_level(m)
+    else:
+        m.dsm_down_tuples = pyomo.Set(
+            within=m.tm*m.tm*m.stf*m.sit*m.com,
+            initialize=[(t, tt, stf, site, commodity)
+                        for (t, tt, stf, site, commodity)
+                        in dsm_down_time_tuples(m.timesteps[1:],
+                                                m.dsm_site_tuples,
+                                                m)],
+            doc='Combinations of possible dsm_down combinations, e.g. '
+                '(5001,5003,2020,Mid,Elec)')
+        m.dsm_down = pyomo.Var(
+            m.dsm_down_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='DSM downshift')
+
+        m.def_dsm_variables = pyomo.Constraint(
+            m.tm, m.dsm_site_tuples,
+            rule=def_dsm_variables_rule,
+            doc='DSMup * efficiency factor n == DSMdo (summed)')
 
+    # DSM rules
     m.res_dsm_upward = pyomo.Constraint(
         m.tm, m.dsm_site_tuples,
         rule=res_dsm_upward_rule,
@@ -67,15 +79,45 @@ def add_dsm(m):
     return m
 
 
+def add_dsm_level(m):
+    """Compact DSM formulation with one downshift variable per timestep.
+
+    Instead of linking each downshift to its upshift, a shifted energy level
+    sums up all upshifts (multiplied by the efficiency) minus downshifts.
+    A positive level has to be compensated by downshifts, a negative one by
+    upshifts within the delay time. This allows the same up- and downshifts
+    as the downshift variables dsm_down[t, tt, ...] of the default
+    formulation, with two instead of 2 * delay + 1 variables per timestep.
+    """
+    m.dsm_downshift = pyomo.Var(
+        m.tm, m.dsm_site_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='DSM downshift (summed)')
+    m.dsm_level = pyomo.Var(
+        m.tm, m.dsm_site_tuples,
+        within=pyomo.Reals,
+        doc='DSM shifted energy (upshifts not yet compensated)')
+
+    m.def_dsm_level = pyomo.Constraint(
+        m.tm, m.dsm_site_tuples,
+        rule=def_dsm_level_rule,
+        doc='level = level(t-1) + DSMup * efficiency factor n - DSMdo')
+    m.res_dsm_level_upper = pyomo.Constraint(
+        m.tm, m.dsm_site_tuples,
+        rule=res_dsm_level_upper_rule,
+        doc='level <= DSMdo(t+1, t + delay time L)')
+    m.res_dsm_level_lower = pyomo.Constraint(
+        m.tm, m.dsm_site_tuples,
+        rule=res_dsm_level_lower_rule,
+        doc='-level <= DSMup(t+1, t + delay time L) * efficiency factor n')
+
+
 # demand side management (DSM) constraints
 
 # DSMup == DSMdo * efficiency factor n
 def def_dsm_variables_rule(m, tm, stf, sit, com):
     dsm_down_sum = 0
-    for tt in dsm_time_tuples(tm,
-                              m.timesteps[1:],
-                              max(int(1 / m.dt *
-                                  m.dsm_dict['delay'][(stf, sit, com)]), 1)):
+    for tt in dsm_window(m, tm, stf, sit, com):
         dsm_down_sum += m.dsm_down[tm, tt, stf, sit, com]
     return dsm_down_sum == (m.dsm_up[tm, stf, sit, com] *
                             m.dsm_dict['eff'][(stf, sit, com)])
@@ -83,63 +125,86 @@ def def_dsm_variables_rule(m, tm, stf, sit, com):
 
 # DSMup <= Cup (threshold capacity of DSMup)
 def res_dsm_upward_rule(m, tm, stf, sit, com):
-    return m.dsm_up[tm, stf, sit, com] <= (m.dt *
+    return m.dsm_up[tm, stf, sit, com] <= (duration(m, tm) *
                                            m.dsm_dict['cap-max-up']
                                            [(stf, sit, com)])
 
 
 # DSMdo <= Cdo (threshold capacity of DSMdo)
 def res_dsm_downward_rule(m, tm, stf, sit, com):
-    dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             max(int(1 / m.dt *
-                                 m.dsm_dict['delay'][(stf, sit, com)]), 1)):
-        dsm_down_sum += m.dsm_down[t, tm, stf, sit, com]
-    return dsm_down_sum <= (m.dt * m.dsm_dict['cap-max-do'][(stf, sit, com)])
+    dsm_down_sum = dsm_downshift(m, tm, stf, sit, com)
+    return dsm_down_sum <= (duration(m, tm) *
+                            m.dsm_dict['cap-max-do'][(stf, sit, com)])
 
 
 # DSMup + DSMdo <= max(Cup,Cdo)
 def res_dsm_maximum_rule(m, tm, stf, sit, com):
-    dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             max(int(1 / m.dt *
-                                 m.dsm_dict['delay'][(stf, sit, com)]), 1)):
-        dsm_down_sum += m.dsm_down[t, tm, stf, sit, com]
-
-    max_dsm_limit = m.dt * max(m.dsm_dict['cap-max-up'][(stf, sit, com)],
-                               m.dsm_dict['cap-max-do'][(stf, sit, com)])
+    dsm_down_sum = dsm_downshift(m, tm, stf, sit, com)
+
+    max_dsm_limit = duration(m, tm) * max(
+        m.dsm_dict['cap-max-up'][(stf, sit, com)],
+        m.dsm_dict['cap-max-do'][(stf, sit, com)])
     return m.dsm_up[tm, stf, sit, com] + dsm_down_sum <= max_dsm_limit
 
 
 # DSMup(t, t + recovery time R) <= Cup * delay time L
 def res_dsm_recovery_rule(m, tm, stf, sit, com):
     dsm_up_sum = 0
-    for t in dsm_recovery(tm,
-                          m.timesteps[1:],
-                          max(int(1 / m.dt *
-                              m.dsm_dict['recov'][(stf, sit, com)]), 1)):
+    for t in dsm_recovery_window(m, tm, stf, sit, com):
         dsm_up_sum += m.dsm_up[t, stf, sit, com]
     return dsm_up_sum <= (m.dsm_dict['cap-max-up'][(stf, sit, com)] *
                           m.dsm_dict['delay'][(stf, sit, com)])
 
 
+# level == level(t-1) + DSMup * efficiency factor n - DSMdo
+def def_dsm_level_rule(m, tm, stf, sit, com):
+    level = (m.dsm_up[tm, stf, sit, com] *
+             m.dsm_dict['eff'][(stf, sit, com)] -
+             m.dsm_downshift[tm, stf, sit, com])
+    if tm > period_bounds(m, tm)[0]:
+        level += m.dsm_level[tm - 1, stf, sit, com]
+    return m.dsm_level[tm, stf, sit, com] == level
+
+
+# level <= DSMdo(t+1, t + delay time L): upshifts are compensated in time
+def res_dsm_level_upper_rule(m, tm, stf, sit, com):
+    dsm_down_sum = 0
+    for t in dsm_window(m, tm, stf, sit, com):
+        if t > tm:
+            dsm_down_sum += m.dsm_downshift[t, stf, sit, com]
+    return m.dsm_level[tm, stf, sit, com] <= dsm_down_sum
+
+
+# -level <= DSMup(t+1, t + delay time L) * n: downshifts are compensated
+def res_dsm_level_lower_rule(m, tm, stf, sit, com):
+    dsm_up_sum = 0
+    for t in dsm_window(m, tm, stf, sit, com):
+        if t > tm:
+            dsm_up_sum += m.dsm_up[t, stf, sit, com]
+    return (- m.dsm_level[tm, stf, sit, com] <=
+            dsm_up_sum * m.dsm_dict['eff'][(stf, sit, com)])
+
+
 # DSM surplus
 def dsm_surplus(m, tm, stf, sit, com):
     """ called in vertex rule
         calculate dsm surplus"""
     if (stf, sit, com) in m.dsm_site_tuples:
         return (- m.dsm_up[tm, stf, sit, com] +
-                sum(m.dsm_down[t, tm, stf, sit, com]
-                    for t in dsm_time_tuples(
-                    tm, m.timesteps[1:],
-                    max(int(1 / m.dt *
-                        m.dsm_dict['delay'][(stf, sit, com)]), 1))))
+                dsm_downshift(m, tm, stf, sit, com))
     else:
         return 0
 
 
+def dsm_downshift(m, tm, stf, sit, com):
+    """ Total DSM downshift in timestep tm, i.e. the sum of all downshifts
+        which compensate upshifts within the delay time"""
+    if m.dsm_formulation == 'level':
+        return m.dsm_downshift[tm, stf, sit, com]
+    return sum(m.dsm_down[t, tm, stf, sit, com]
+               for t in dsm_window(m, tm, stf, sit, com))
+
+
 def dsm_down_time_tuples(time, sit_com_tuple, m):
     """ Dictionary for the two time instances of DSM_down
     Args:
@@ -150,65 +215,57 @@ def dsm_down_time_tuples(time, sit_com_tuple, m):
         A list of possible time tuples depending on site and commodity
     """
 
-    delay = m.dsm_dict['delay']
-    ub = max(time)
-    lb = min(time)
     time_list = []
 
     for (stf, site, commodity) in sit_com_tuple:
         for step1 in time:
-            for step2 in range(step1 -
-                               max(int(delay[stf, site, commodity] /
-                                   m.dt.value), 1),
-                               step1 +
-                               max(int(delay[stf, site, commodity] /
-                                   m.dt.value), 1) + 1):
-                if lb <= step2 <= ub:
-                    time_list.append((step1, step2, stf, site, commodity))
+            for step2 in dsm_window(m, step1, stf, site, commodity):
+                time_list.append((step1, step2, stf, site, commodity))
 
     return time_list
 
 
-def dsm_time_tuples(timestep, time, delay):
-    """ Tuples for the two time instances of DSM_down
+def dsm_steps(m, hours):
+    """ Number of timesteps (at least 1) of a DSM delay or recovery time"""
+    return max(int(hours / pyomo.value(m.dt)), 1)
+
+
+def dsm_window(m, timestep, stf, sit, com):
+    """ Time indices within the delay time of a timestep
     Args:
+        m: model instance
         timestep: current timestep
-        time: list with time indices
-        delay: allowed dsm delay in particular site and commodity
+        stf, sit, com: support timeframe, site and commodity of the DSM
     Returns:
-        A list of possible time tuples of a current time step in a specific
-        stf, site and commodity
+        A range of the time indices which are within the delay time and the
+        modelled time area (for representative periods, the period of
+        timestep)
     """
-
-    ub = max(time)
-    lb = min(time)
-
-    time_list = list()
-
-    for step in range(timestep - delay, timestep + delay + 1):
-        if step >= lb and step <= ub:
-            time_list.append(step)
-
-    return time_list
+    first, last = period_bounds(m, timestep)
+    if m.segmentation is not None:
+        lower, upper = steps_within(m, timestep,
+                                    m.dsm_dict['delay'][(stf, sit, com)])
+    else:
+        delay = m.dsm_delay[(stf, sit, com)]
+        lower, upper = timestep - delay, timestep + delay
+    return range(max(lower, first), min(upper, last) + 1)
 
 
-def dsm_recovery(timestep, time, recov):
+def dsm_recovery_window(m, timestep, stf, sit, com):
     """ Time frame for the allowed time indices in case of recovery
     Args:
+        m: model instance
         timestep: current timestep
-        time: list with time indices
-        recov: allowed dsm recovery in particular site and commodity
+        stf, sit, com: support timeframe, site and commodity of the DSM
     Returns:
-        A list of possible time indices which are within the modelled time
-        area
+        A range of the time indices from timestep on which are within the
+        recovery time and the modelled time area (for representative
+        periods, the period of timestep)
     """
-
-    ub = max(time)
-
-    time_list = list()
-
-    for step in range(timestep, timestep+recov):
-        if step <= ub:
-            time_list.append(step)
-
-    return time_list
+    last = period_bounds(m, timestep)[1]
+    if m.segmentation is not None:
+        last = min(steps_until(m, timestep,
+                               m.dsm_dict['recov'][(stf, sit, com)]), last)
+        return range(timestep, last + 1)
+    recov = m.dsm_recov[(stf, sit, com)]
+    return range(timestep, min(timestep + recov, last + 1))
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def stf_table(m):
+    """Years up to which units have to be operational in each support
+    timeframe to count as operational in intertemporal planning.
+
+    Returns:
+        dict of 'stf': the sorted support timeframes, and of arrays
+        'midpoint' (processes: midpoint to the next support timeframe) and
+        'next' (storages and transmissions: the next support timeframe);
+        for the last support timeframe, both are its last year, as given by
+        its 'Weight'
+    """
+    sorted_stf = sorted(m.stf)
+    years = np.array(sorted_stf, dtype=float)
+    last = (years[-1] +
+            m.global_prop.loc[(sorted_stf[-1], 'Weight'), 'value'] - 1)
+    return {
+        'stf': sorted_stf,
+        'midpoint': np.append((years[:-1] + years[1:]) / 2, last),
+        'next': np.append(years[1:], last)}
+
+
+def operational_stf(m, built, lifetime, limit, installed=False):
+    """Positions of the units and of the support timeframes through which
+    they are operational (c.f. op_pro_tuples).
+
+    Args:
+        - m: model with the stf_table (c.f. stf_table)
+        - built: array of the support timeframes the units are built in
+        - lifetime: array of their depreciation period or lifetime
+        - limit: 'midpoint' or 'next', c.f. stf_table
+        - installed: set True for already installed units, which have to be
+          operational for more than the last year of the last support
+          timeframe
+
+    Returns:
+        a tuple of two position arrays (unit, support timeframe), ordered
+        by unit and support timeframe
+    """
+    table = m.stf_table
+    years = np.array(table['stf'], dtype=float)
+    limits = table[limit]
+    end = (np.asarray(built, dtype=float) +
+           np.asarray(lifetime, dtype=float))[:, np.newaxis]
+    operational = limits <= end
+    if installed:
+        operational[:, -1] = limits[-1] < end[:, 0]
+    operational &= np.asarray(built, dtype=float)[:, np.newaxis] <= years
+    return np.nonzero(operational)
+
+
+def built_stfs(op_tuples):
+    """Support timeframes in which the operational units of each support
+    timeframe may have been built.
+
+    Args:
+        op_tuples: operational tuples (unit..., stf_built, stf), e.g.
+            (sit, pro, stf_built, stf), c.f. op_pro_tuples
+
+    Returns:
+        dict of (unit..., stf) to the list of stf_built
+    """
+    built = {}
+    for op in op_tuples:
+        built.setdefault(op[:-2] + op[-1:], []).append(op[-2])
+    return built
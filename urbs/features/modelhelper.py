@@ -1,3 +1,6 @@
+import numpy as np
+import pandas as pd
+from .lifetime import stf_table, operational_stf, built_stfs
 from .transmission import transmission_balance
 from .storage import storage_balance
 
@@ -6,45 +9,57 @@ def invcost_factor(dep_prd, interest, discount=None, year_built=None,
                    stf_min=None):
     """Investment cost factor formula.
     Evaluates the factor multiplied to the invest costs
-    for depreciation duration and interest rate.
+    for depreciation duration and interest rate. The arguments may be
+    arrays (e.g. DataFrame columns) to evaluate all factors at once; for
+    scalar arguments, the factor is a float.
     Args:
         dep_prd: depreciation period (years)
         interest: interest rate (e.g. 0.06 means 6 %)
         year_built: year utility is built
         discount: discount rate for intertmeporal planning
     """
-    # invcost factor for non intertemporal planning
-    if discount is None:
-        if interest == 0:
-            return 1 / dep_prd
-        else:
-            return ((1 + interest) ** dep_prd * interest /
-                    ((1 + interest) ** dep_prd - 1))
-    # invcost factor for intertemporal planning
-    elif discount == 0:
-        if interest == 0:
-            return 1
-        else:
-            return (dep_prd * ((1 + interest) ** dep_prd * interest) /
-                    ((1 + interest) ** dep_prd - 1))
-    else:
-        if interest == 0:
-            return ((1 + discount) ** (1 - (year_built-stf_min)) *
-                    ((1 + discount) ** dep_prd - 1) /
-                    (dep_prd * discount * (1 + discount) ** dep_prd))
-        else:
-            return ((1 + discount) ** (1 - (year_built-stf_min)) *
-                    (interest * (1 + interest) ** dep_prd *
-                    ((1 + discount) ** dep_prd - 1)) /
-                    (discount * (1 + discount) ** dep_prd *
-                    ((1+interest) ** dep_prd - 1)))
+    scalar = _is_scalar(dep_prd, interest, discount, year_built, stf_min)
+    dep_prd = np.asarray(dep_prd, dtype=float)
+    interest = np.asarray(interest, dtype=float)
+    # all cases are evaluated, np.where selects the valid one
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # invcost factor for non intertemporal planning
+        if discount is None:
+            factor = np.where(
+                interest == 0,
+                1 / dep_prd,
+                ((1 + interest) ** dep_prd * interest /
+                 ((1 + interest) ** dep_prd - 1)))
+            return float(factor) if scalar else factor
+        # invcost factor for intertemporal planning
+        discount = np.asarray(discount, dtype=float)
+        year_built = np.asarray(year_built, dtype=float)
+        without_discount = np.where(
+            interest == 0,
+            1,
+            (dep_prd * ((1 + interest) ** dep_prd * interest) /
+             ((1 + interest) ** dep_prd - 1)))
+        with_discount = np.where(
+            interest == 0,
+            ((1 + discount) ** (1 - (year_built-stf_min)) *
+             ((1 + discount) ** dep_prd - 1) /
+             (dep_prd * discount * (1 + discount) ** dep_prd)),
+            ((1 + discount) ** (1 - (year_built-stf_min)) *
+             (interest * (1 + interest) ** dep_prd *
+              ((1 + discount) ** dep_prd - 1)) /
+             (discount * (1 + discount) ** dep_prd *
+              ((1+interest) ** dep_prd - 1))))
+        factor = np.where(discount == 0, without_discount, with_discount)
+    return float(factor) if scalar else factor
 
 
 def overpay_factor(dep_prd, interest, discount, year_built, stf_min, stf_end):
     """Overpay value factor formula.
     Evaluates the factor multiplied to the invest costs
     for all annuity payments of a unit after the end of the
-    optimization period.
+    optimization period. The arguments may be arrays (e.g. DataFrame
+    columns) to evaluate all factors at once; for scalar arguments, the
+    factor is a float.
     Args:
         dep_prd: depreciation period (years)
         interest: interest rate (e.g. 0.06 means 6 %)
@@ -52,46 +67,70 @@ def overpay_factor(dep_prd, interest, discount, year_built, stf_min, stf_end):
         discount: discount rate for intertemporal planning
         k: operational time after simulation horizon
     """
+    scalar = _is_scalar(dep_prd, interest, discount, year_built, stf_min,
+                        stf_end)
+    dep_prd = np.asarray(dep_prd, dtype=float)
+    interest = np.asarray(interest, dtype=float)
+    discount = np.asarray(discount, dtype=float)
+    year_built = np.asarray(year_built, dtype=float)
 
     op_time = (year_built + dep_prd) - stf_end - 1
 
-    if discount == 0:
-        if interest == 0:
-            return op_time / dep_prd
-        else:
-            return (op_time * ((1 + interest) ** dep_prd * interest) /
-                    ((1 + interest) ** dep_prd - 1))
-    else:
-        if interest == 0:
-            return ((1 + discount) ** (1 - (year_built - stf_min)) *
-                    ((1 + discount) ** op_time - 1) /
-                    (dep_prd * discount * (1 + discount) ** dep_prd))
-        else:
-            return ((1 + discount) ** (1 - (year_built - stf_min)) *
-                    (interest * (1 + interest) ** dep_prd *
-                    ((1 + discount) ** op_time - 1)) /
-                    (discount * (1 + discount) ** dep_prd *
-                    ((1 + interest) ** dep_prd - 1)))
+    # all cases are evaluated, np.where selects the valid one
+    with np.errstate(divide='ignore', invalid='ignore'):
+        without_discount = np.where(
+            interest == 0,
+            op_time / dep_prd,
+            (op_time * ((1 + interest) ** dep_prd * interest) /
+             ((1 + interest) ** dep_prd - 1)))
+        with_discount = np.where(
+            interest == 0,
+            ((1 + discount) ** (1 - (year_built - stf_min)) *
+             ((1 + discount) ** op_time - 1) /
+             (dep_prd * discount * (1 + discount) ** dep_prd)),
+            ((1 + discount) ** (1 - (year_built - stf_min)) *
+             (interest * (1 + interest) ** dep_prd *
+              ((1 + discount) ** op_time - 1)) /
+             (discount * (1 + discount) ** dep_prd *
+              ((1 + interest) ** dep_prd - 1))))
+        factor = np.where(discount == 0, without_discount, with_discount)
+    return float(factor) if scalar else factor
+
+
+def _is_scalar(*args):
+    """True if none of the arguments is an array (e.g. a DataFrame column)"""
+    return all(np.ndim(arg) == 0 for arg in args)
 
 
 # Energy related costs
-def stf_dist(stf, m):
-    """Calculates the distance between the modeled support timeframes.
+def stf_distances(m):
+    """Calculates the distance between the modeled support timeframes,
+    i.e. the years until the next one; the last one lasts 'Weight' years.
+
+    Returns:
+        a dict of support timeframe to distance
     """
     sorted_stf = sorted(m.stf_list)
-    dist = []
+    dist = {stf: next_stf - stf
+            for stf, next_stf in zip(sorted_stf, sorted_stf[1:])}
+    dist[sorted_stf[-1]] = m.global_prop.loc[(sorted_stf[-1], 'Weight')][
+        'value']
+    return dist
 
-    for s in sorted_stf:
-        if s == max(sorted_stf):
-            dist.append(m.global_prop.loc[(s, 'Weight')]['value'])
-        else:
-            dist.append(sorted_stf[sorted_stf.index(s) + 1] - s)
 
-    return dist[sorted_stf.index(stf)]
+def stf_dist(stf, m):
+    """Calculates the distance between the modeled support timeframes.
+    Looks up a single support timeframe or a Series of them in
+    m.stf_dist_dict (c.f. stf_distances).
+    """
+    if isinstance(stf, pd.Series):
+        return stf.map(m.stf_dist_dict)
+    return m.stf_dist_dict[stf]
 
 
 def discount_factor(stf, m):
-    """Discount for any payment made in the year stf
+    """Discount for any payment made in the year stf; stf may be an array
+    (e.g. a DataFrame column) of years.
     """
     discount = (m.global_prop.xs('Discount rate', level=1)
                 .loc[m.global_prop.index.min()[0]]['value'])
@@ -101,7 +140,8 @@ def discount_factor(stf, m):
 
 def effective_distance(dist, m):
     """Factor for variable, fuel, purchase, sell, and fix costs.
-    Calculated by repetition of modeled stfs and discount utility.
+    Calculated by repetition of modeled stfs and discount utility; dist may
+    be an array (e.g. a DataFrame column) of distances.
     """
     discount = (m.global_prop.xs('Discount rate', level=1)
                 .loc[m.global_prop.index.min()[0]]['value'])
@@ -127,16 +167,13 @@ def commodity_balance(m, tm, stf, sit, com):
     Returns
         balance: net value of consumed (positive) or provided (negative) power
     """
-    balance = (sum(m.e_pro_in[(tm, stframe, site, process, com)]
+    balance = (sum(m.e_pro_in[(tm,) + p]
                    # usage as input for process increases balance
-                   for stframe, site, process in m.pro_tuples
-                   if site == sit and stframe == stf and
-                   (stframe, process, com) in m.r_in_dict) -
-               sum(m.e_pro_out[(tm, stframe, site, process, com)]
+                   for p in m.balance_index['pro_in'].get((stf, sit, com), ())) -
+               sum(m.e_pro_out[(tm,) + p]
                    # output from processes decreases balance
-                   for stframe, site, process in m.pro_tuples
-                   if site == sit and stframe == stf and
-                   (stframe, process, com) in m.r_out_dict))
+                   for p in m.balance_index['pro_out'].get((stf, sit, com),
+                                                           ())))
     if m.mode['tra']:
         balance += transmission_balance(m, tm, stf, sit, com)
     if m.mode['sto']:
@@ -145,6 +182,43 @@ def commodity_balance(m, tm, stf, sit, com):
     return balance
 
 
+def balance(m, tm, stf, sit, com):
+    """Return the commodity balance shared by all constraints.
+    The balance is built only once per (tm, stf, sit, com) as expression
+    m.e_balance. Combinations for which no balance expression exists (e.g.
+    a commodity not defined at a site) fall back to commodity_balance.
+    Args:
+        m: the model object
+        tm: the timestep
+        stf: the support timeframe
+        sit: the site
+        com: the commodity
+    Returns
+        balance: net value of consumed (positive) or provided (negative) power
+    """
+    if (stf, sit, com) in m.com_balance_tuples:
+        return m.e_balance[tm, stf, sit, com]
+    else:
+        return commodity_balance(m, tm, stf, sit, com)
+
+
+def group_tuples(tuples, key):
+    """Group index tuples by some of their elements.
+    Used to build the incidence index of the commodity balance once, so that
+    the balance helpers only look up the relevant tuples instead of scanning
+    all process, transmission and storage tuples for every timestep.
+    Args:
+        tuples: an iterable of index tuples
+        key: tuple of positions of the elements forming the group key
+    Returns:
+        dict mapping each group key to the list of tuples belonging to it
+    """
+    groups = {}
+    for t in tuples:
+        groups.setdefault(tuple(t[k] for k in key), []).append(t)
+    return groups
+
+
 def commodity_subset(com_tuples, type_name):
     """ Unique list of commodity names for given type.
     Args:
@@ -168,27 +242,18 @@ def op_pro_tuples(pro_tuple, m):
     """ Tuples for operational status of units (processes, transmissions,
     storages) for intertemporal planning.
     Only such tuples where the unit is still operational until the next
-    support time frame are valid.
+    support time frame are valid, i.e. the unit is built in or before
+    stf_later and operational up to the midpoint to the next support
+    timeframe (c.f. stf_table).
     """
-    op_pro = []
-    sorted_stf = sorted(list(m.stf))
-
-    for (stf, sit, pro) in pro_tuple:
-        for stf_later in sorted_stf:
-            index_helper = sorted_stf.index(stf_later)
-            if stf_later == max(sorted_stf):
-                if (stf_later +
-                    m.global_prop.loc[(max(sorted_stf), 'Weight'), 'value'] -
-                    1 <= stf + m.process_dict['depreciation'][
-                                              (stf, sit, pro)]):
-                    op_pro.append((sit, pro, stf, stf_later))
-            elif ((stf_later + sorted_stf[index_helper + 1])/2 <= stf + m.process_dict['depreciation'][(stf, sit, pro)]
-                  and stf <= stf_later):
-                op_pro.append((sit, pro, stf, stf_later))
-            else:
-                pass
-
-    return op_pro
+    pro_tuple = list(pro_tuple)
+    built = [stf for (stf, sit, pro) in pro_tuple]
+    depreciation = [m.process_dict['depreciation'][unit] for unit in pro_tuple]
+    units, stfs = operational_stf(m, built, depreciation, 'midpoint')
+    sorted_stf = m.stf_table['stf']
+
+    return [pro_tuple[u][1:] + (pro_tuple[u][0], sorted_stf[s])
+            for u, s in zip(units, stfs)]
 
 
 def inst_pro_tuples(m):
@@ -197,20 +262,10 @@ def inst_pro_tuples(m):
     Only such tuples where the unit is still operational until the next
     support time frame are valid.
     """
-    inst_pro = []
-    sorted_stf = sorted(list(m.stf))
-
-    for (stf, sit, pro) in m.inst_pro.index:
-        for stf_later in sorted_stf:
-            index_helper = sorted_stf.index(stf_later)
-            if stf_later == max(m.stf):
-                if (stf_later +
-                   m.global_prop.loc[(max(sorted_stf), 'Weight'), 'value'] -
-                   1 < min(m.stf) + m.process_dict['lifetime'][
-                                                   (stf, sit, pro)]):
-                    inst_pro.append((sit, pro, stf_later))
-            elif (stf_later + sorted_stf[index_helper + 1])/2 <= (min(m.stf)
-                                                                  + m.process_dict['lifetime'][(stf, sit, pro)]):
-                inst_pro.append((sit, pro, stf_later))
-
-    return inst_pro
+    inst_pro = list(m.inst_pro.index)
+    lifetime = [m.process_dict['lifetime'][unit] for unit in inst_pro]
+    units, stfs = operational_stf(m, [min(m.stf)] * len(inst_pro), lifetime,
+                                  'midpoint', installed=True)
+    sorted_stf = m.stf_table['stf']
+
+    return [inst_pro[u][1:] + (sorted_stf[s],) for u, s in zip(units, stfs)]
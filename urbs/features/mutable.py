@@ -0,0 +1,50 @@
+import pyomo.core as pyomo
+
+# input parameters which scenarios typically change (c.f. scenarios.py);
+# create_model(..., mutable=True) creates them as mutable Params, so that a
+# built model can be changed without rebuilding it (c.f. update_model)
+MUTABLE_PARAMS = {
+    'commodity_dict': ['price', 'max', 'maxperhour'],
+    'process_dict': ['inv-cost', 'fix-cost', 'var-cost', 'cap-lo', 'cap-up'],
+    'transmission_dict': ['inv-cost', 'fix-cost', 'var-cost', 'cap-lo',
+                          'cap-up'],
+    'storage_dict': ['inv-cost-p', 'inv-cost-c', 'fix-cost-p', 'fix-cost-c',
+                     'var-cost-p', 'var-cost-c', 'cap-lo-p', 'cap-up-p',
+                     'cap-lo-c', 'cap-up-c']}
+
+
+def mutable_param_name(dict_name, column):
+    """Name of the mutable Param of a column of an input dictionary,
+    e.g. 'process_cap_up' for column 'cap-up' of m.process_dict.
+    """
+    return '{}_{}'.format(dict_name[:-len('_dict')], column.replace('-', '_'))
+
+
+def add_mutable_params(m, dict_name, index):
+    '''Replace the MUTABLE_PARAMS columns of an input dictionary by
+    mutable Params, if the model is created with mutable=True.
+
+    The columns are replaced by the Params, so the rules use them unchanged,
+    e.g. m.process_dict['cap-up'] is the Param m.process_cap_up afterwards.
+
+    Args:
+        - m: the model object
+        - dict_name: name of the input dictionary, e.g. 'process_dict'
+        - index: the tuple set of the dictionary, e.g. m.pro_tuples
+
+    Returns:
+        the model with the additional Params
+    '''
+    if not m.mutable:
+        return m
+    input_dict = getattr(m, dict_name)
+    for column in MUTABLE_PARAMS[dict_name]:
+        param = pyomo.Param(
+            index,
+            initialize={key: input_dict[column][key] for key in index},
+            within=pyomo.Any,
+            mutable=True,
+            doc='{} {}'.format(dict_name[:-len('_dict')], column))
+        m.add_component(mutable_param_name(dict_name, column), param)
+        input_dict[column] = param
+    return m
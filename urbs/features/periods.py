@@ -0,0 +1,124 @@
+import numpy as np
+import pyomo.core as pyomo
+
+
+def add_periods(m):
+    """Representative periods of aggregated timeseries.
+
+    For data aggregated by urbs.aggregate_timeseries, the modelled timesteps
+    consist of representative periods. Each timestep is weighted by the
+    number of original periods its period represents (m.period_weight),
+    DSM shifts and gradients stay within a period, and the storage content
+    is linked across the original periods (c.f. add_storage_periods). For
+    all other data, m.periods is None.
+    """
+    if m.aggregation is None:
+        m.periods = None
+        return m
+
+    order = m.aggregation['representative']
+    bounds = m.aggregation.groupby('representative')[['first', 'last']].first()
+    m.periods = [(int(first), int(last))
+                 for first, last in zip(bounds['first'], bounds['last'])]
+    m.period_order = order.tolist()
+    m.period_of = {t: r for r, (first, last) in enumerate(m.periods)
+                   for t in range(first, last + 1)}
+    count = order.value_counts()
+
+    m.rep = pyomo.Set(
+        initialize=range(len(m.periods)),
+        ordered=True,
+        doc='Set of representative periods')
+    m.period = pyomo.Set(
+        initialize=range(len(m.period_order) + 1),
+        ordered=True,
+        doc='Set of original periods (their starts and the end)')
+    m.period_weight = pyomo.Param(
+        m.tm,
+        initialize={tm: int(count[m.period_of[tm]]) for tm in m.tm},
+        doc='Number of original periods represented by the period of tm')
+    return m
+
+
+def add_durations(m):
+    """Timesteps of different durations.
+
+    For data segmented by urbs.segment_timeseries, each modelled timestep
+    lasts a number of timesteps of the original data, i.e. a multiple of
+    dt. m.duration holds the duration of each timestep in hours (the
+    initial timestep lasts dt); m.hours and m.midpoints hold the hours from
+    the start of the initial timestep to the end and to the midpoint of
+    each timestep. For all other data, each timestep lasts dt (c.f.
+    duration).
+    """
+    if m.segmentation is None:
+        return m
+
+    length = m.segmentation['duration'].reindex(m.timesteps, fill_value=1)
+    hours = length.to_numpy(dtype=float) * pyomo.value(m.dt)
+    m.hours = np.cumsum(hours)
+    m.midpoints = m.hours - hours / 2
+    m.duration = pyomo.Param(
+        m.t,
+        initialize=dict(zip(m.timesteps, hours)),
+        doc='Duration of timestep t (in hours)')
+    return m
+
+
+def modelled_steps(m):
+    """Number of timesteps which the modelled timesteps represent."""
+    if m.segmentation is not None:
+        return int(m.segmentation['duration'].sum())
+    if m.aggregation is None:
+        return len(m.timesteps) - 1
+    return int((m.aggregation['last'] - m.aggregation['first'] + 1).sum())
+
+
+def weight(m, tm):
+    """Factor of timestep tm for annual costs and emissions (c.f. m.weight)"""
+    if m.periods is None:
+        return m.weight
+    return m.weight * m.period_weight[tm]
+
+
+def duration(m, tm):
+    """Duration of timestep tm in hours (c.f. m.dt and add_durations)"""
+    if m.segmentation is None:
+        return m.dt
+    return m.duration[tm]
+
+
+def steps_within(m, t, hours):
+    """First and last timestep whose midpoints are at most hours from the
+    one of timestep t, but at least t - 1 and t + 1 (c.f. add_durations)"""
+    first = m.timesteps[0]
+    midpoint = m.midpoints[t - first]
+    lower = np.searchsorted(m.midpoints, midpoint - hours, side='left')
+    upper = np.searchsorted(m.midpoints, midpoint + hours, side='right') - 1
+    return min(first + int(lower), t - 1), max(first + int(upper), t + 1)
+
+
+def steps_until(m, t, hours):
+    """Last timestep which ends at most hours after the start of timestep
+    t, but at least t (c.f. add_durations)"""
+    first = m.timesteps[0]
+    start = m.hours[t - first] - m.duration[t]
+    last = np.searchsorted(m.hours, start + hours, side='right') - 1
+    return max(first + int(last), t)
+
+
+def period_bounds(m, t):
+    """First and last modelled timestep of the period of timestep t"""
+    if m.periods is None:
+        return m.timesteps[1], m.timesteps[-1]
+    return m.periods[m.period_of[t]]
+
+
+def previous_timestep(m, t):
+    """Timestep before t; representative periods are cyclic, i.e. the last
+    timestep of a representative period precedes its first one"""
+    if m.periods is not None:
+        first, last = m.periods[m.period_of[t]]
+        if t == first:
+            return last
+    return t - 1
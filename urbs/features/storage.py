@@ -1,5 +1,9 @@
 import math
 import pyomo.core as pyomo
+from .batch import add_batch_constraint, durations, equalities, terms
+from .lifetime import operational_stf, built_stfs
+from .mutable import add_mutable_params
+from .periods import duration, period_bounds, weight
 
 
 def add_storage(m):
@@ -19,6 +23,7 @@ def add_storage(m):
         initialize=tuple(m.storage_dict["eff-in"].keys()),
         doc='Combinations of possible storage by site,'
             'e.g. (2020,Mid,Bat,Elec)')
+    m = add_mutable_params(m, 'storage_dict', m.sto_tuples)
 
     # tuples for intertemporal operation
     if m.mode['int']:
@@ -36,6 +41,7 @@ def add_storage(m):
                         for (sit, sto, com, stf)
                         in inst_sto_tuples(m)],
             doc='Installed storages that are still operational through stf')
+        m.sto_built_stfs = built_stfs(m.operational_sto_tuples)
 
     # storage tuples for storages with fixed initial state
     m.sto_init_bound_tuples = pyomo.Set(
@@ -77,21 +83,30 @@ def add_storage(m):
         m.tm, m.sto_tuples,
         within=pyomo.NonNegativeReals,
         doc='Power flow out of storage (MW) per timestep')
-    m.e_sto_con = pyomo.Var(
-        m.t, m.sto_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Energy content of storage (MWh) in timestep')
+    if m.periods is None:
+        m.e_sto_con = pyomo.Var(
+            m.t, m.sto_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Energy content of storage (MWh) in timestep')
+    else:
+        m.e_sto_con = pyomo.Var(
+            m.t, m.sto_tuples,
+            within=pyomo.Reals,
+            doc='Change of storage content (MWh) since the start of the '
+                'representative period')
+        add_storage_periods(m)
         
-    m.storage_costs = pyomo.Var(
-        m.sto_tuples,
-        m.cost_type,
-        within=pyomo.Reals,
-        doc='Costs of storages by type and site (EUR/a)')        
+    if m.cost_breakdown:
+        m.storage_costs = pyomo.Var(
+            m.sto_tuples,
+            m.cost_type,
+            within=pyomo.Reals,
+            doc='Costs of storages by type and site (EUR/a)')
 
     # storage rules
-    m.def_storage_state = pyomo.Constraint(
-        m.tm, m.sto_tuples,
-        rule=def_storage_state_rule,
+    add_batch_constraint(
+        m, 'def_storage_state', m.sto_tuples,
+        def_storage_state_rule,
         doc='storage[t] = (1 - sd) * storage[t-1] + in * eff_i - out / eff_o')
     m.res_storage_input_by_power = pyomo.Constraint(
         m.tm, m.sto_tuples,
@@ -101,10 +116,11 @@ def add_storage(m):
         m.tm, m.sto_tuples,
         rule=res_storage_output_by_power_rule,
         doc='storage output <= storage power')
-    m.res_storage_state_by_capacity = pyomo.Constraint(
-        m.t, m.sto_tuples,
-        rule=res_storage_state_by_capacity_rule,
-        doc='storage content <= storage capacity')
+    if m.periods is None:
+        m.res_storage_state_by_capacity = pyomo.Constraint(
+            m.t, m.sto_tuples,
+            rule=res_storage_state_by_capacity_rule,
+            doc='storage content <= storage capacity')
     m.res_storage_power = pyomo.Constraint(
         m.sto_tuples,
         rule=res_storage_power_rule,
@@ -125,29 +141,86 @@ def add_storage(m):
         m.sto_ep_ratio_tuples,
         rule=def_storage_energy_power_ratio_rule,
         doc='storage capacity = storage power * storage E2P ratio')
-    m.def_specific_storage_cost = pyomo.Constraint(
-        m.sto_tuples,
-        m.cost_type,
-        rule=specific_storage_cost,
-        doc='Break down of costs per storage unit to cost type and stf')    
+    if m.cost_breakdown:
+        m.def_specific_storage_cost = pyomo.Constraint(
+            m.sto_tuples,
+            m.cost_type,
+            rule=specific_storage_cost,
+            doc='Break down of costs per storage unit to cost type and stf')
 
     return m
 
 
+def add_storage_periods(m):
+    """Storage content across the original periods of representative
+    periods (c.f. urbs.features.periods).
+
+    Within a representative period, e_sto_con is the change of the storage
+    content since the start of the period. The content at the start of each
+    original period (e_sto_con_inter) follows from the one of the previous
+    period and the change over its representative period. Together with the
+    lowest and highest change within the representative period, it has to
+    stay between zero and the storage capacity. This allows storages to
+    shift energy between seasons although only representative periods are
+    modelled.
+    """
+    m.e_sto_con_inter = pyomo.Var(
+        m.period, m.sto_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Energy content of storage (MWh) at the start of each period')
+    m.e_sto_con_min = pyomo.Var(
+        m.rep, m.sto_tuples,
+        within=pyomo.NonPositiveReals,
+        doc='Lowest change of storage content (MWh) in the period')
+    m.e_sto_con_max = pyomo.Var(
+        m.rep, m.sto_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Highest change of storage content (MWh) in the period')
+
+    m.def_storage_state_inter = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=def_storage_state_inter_rule,
+        doc='storage[p+1] = (1 - sd) ** length * storage[p] + change over '
+            'the representative period of p')
+    m.res_storage_change_min = pyomo.Constraint(
+        m.tm, m.sto_tuples,
+        rule=res_storage_change_min_rule,
+        doc='lowest change <= change of storage content')
+    m.res_storage_change_max = pyomo.Constraint(
+        m.tm, m.sto_tuples,
+        rule=res_storage_change_max_rule,
+        doc='change of storage content <= highest change')
+    m.res_storage_inter_min = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=res_storage_inter_min_rule,
+        doc='0 <= (1 - sd) ** length * storage[p] + lowest change')
+    m.res_storage_inter_max = pyomo.Constraint(
+        m.period, m.sto_tuples,
+        rule=res_storage_inter_max_rule,
+        doc='storage[p] + highest change <= storage capacity')
+
+
 # constraints
 
 # storage content in timestep [t] == storage content[t-1] * (1-discharge)
 # + newly stored energy * input efficiency
 # - retrieved energy / output efficiency
-def def_storage_state_rule(m, t, stf, sit, sto, com):
-    return (m.e_sto_con[t, stf, sit, sto, com] ==
-            m.e_sto_con[t - 1, stf, sit, sto, com] *
-            (1 - m.storage_dict['discharge']
-             [(stf, sit, sto, com)]) ** m.dt.value +
-            m.e_sto_in[t, stf, sit, sto, com] *
-            m.storage_dict['eff-in'][(stf, sit, sto, com)] -
-            m.e_sto_out[t, stf, sit, sto, com] /
-            m.storage_dict['eff-out'][(stf, sit, sto, com)])
+# (representative periods start with no change of the storage content;
+# all modelled timesteps of one storage, c.f. add_batch_constraint)
+def def_storage_state_rule(m, stf, sit, sto, com):
+    discharge = m.storage_dict['discharge'][(stf, sit, sto, com)]
+    previous = terms([-(1 - discharge) ** hours for hours in durations(m)],
+                     [m.e_sto_con[t - 1, stf, sit, sto, com] for t in m.tm])
+    if m.periods is not None:
+        previous = [0 if t == period_bounds(m, t)[0] else term
+                    for t, term in zip(m.tm, previous)]
+    return equalities([
+        terms(1, [m.e_sto_con[t, stf, sit, sto, com] for t in m.tm]),
+        previous,
+        terms(-m.storage_dict['eff-in'][(stf, sit, sto, com)],
+              [m.e_sto_in[t, stf, sit, sto, com] for t in m.tm]),
+        terms(1 / m.storage_dict['eff-out'][(stf, sit, sto, com)],
+              [m.e_sto_out[t, stf, sit, sto, com] for t in m.tm])])
 
 
 # storage capacity (for m.cap_sto_c expression)
@@ -160,16 +233,14 @@ def def_storage_capacity_rule(m, stf, sit, sto, com):
             else:
                 cap_sto_c = (
                     sum(m.cap_sto_c_new[stf_built, sit, sto, com]
-                        for stf_built in m.stf
-                        if (sit, sto, com, stf_built, stf) in
-                        m.operational_sto_tuples) +
+                        for stf_built
+                        in m.sto_built_stfs.get((sit, sto, com, stf), ())) +
                     m.storage_dict['inst-cap-c'][(min(m.stf), sit, sto, com)])
         else:
             cap_sto_c = (
                 sum(m.cap_sto_c_new[stf_built, sit, sto, com]
-                    for stf_built in m.stf
-                    if (sit, sto, com, stf_built, stf) in
-                    m.operational_sto_tuples))
+                    for stf_built
+                    in m.sto_built_stfs.get((sit, sto, com, stf), ())))
     else:
         if (stf, sit, sto, com) in m.sto_const_cap_c_dict:
             cap_sto_c = m.storage_dict['inst-cap-c'][(stf, sit, sto, com)]
@@ -190,16 +261,14 @@ def def_storage_power_rule(m, stf, sit, sto, com):
             else:
                 cap_sto_p = (
                     sum(m.cap_sto_p_new[stf_built, sit, sto, com]
-                        for stf_built in m.stf
-                        if (sit, sto, com, stf_built, stf) in
-                        m.operational_sto_tuples) +
+                        for stf_built
+                        in m.sto_built_stfs.get((sit, sto, com, stf), ())) +
                     m.storage_dict['inst-cap-p'][(min(m.stf), sit, sto, com)])
         else:
             cap_sto_p = (
                 sum(m.cap_sto_p_new[stf_built, sit, sto, com]
-                    for stf_built in m.stf
-                    if (sit, sto, com, stf_built, stf)
-                    in m.operational_sto_tuples))
+                    for stf_built
+                    in m.sto_built_stfs.get((sit, sto, com, stf), ())))
     else:
         if (stf, sit, sto, com) in m.sto_const_cap_p_dict:
             cap_sto_p = m.storage_dict['inst-cap-p'][(stf, sit, sto, com)]
@@ -212,13 +281,13 @@ def def_storage_power_rule(m, stf, sit, sto, com):
 
 # storage input <= storage power
 def res_storage_input_by_power_rule(m, t, stf, sit, sto, com):
-    return (m.e_sto_in[t, stf, sit, sto, com] <= m.dt *
+    return (m.e_sto_in[t, stf, sit, sto, com] <= duration(m, t) *
             m.cap_sto_p[stf, sit, sto, com])
 
 
 # storage output <= storage power
 def res_storage_output_by_power_rule(m, t, stf, sit, sto, co):
-    return (m.e_sto_out[t, stf, sit, sto, co] <= m.dt *
+    return (m.e_sto_out[t, stf, sit, sto, co] <= duration(m, t) *
             m.cap_sto_p[stf, sit, sto, co])
 
 
@@ -245,17 +314,90 @@ def res_storage_capacity_rule(m, stf, sit, sto, com):
 # initialization of storage content in first timestep t[1]
 # forced minimun  storage content in final timestep t[len(m.t)]
 # content[t=1] == storage capacity * fraction <= content[t=final]
+# (for representative periods, at the start of the first and the end of the
+# last original period)
 def def_initial_storage_state_rule(m, stf, sit, sto, com):
-    return (m.e_sto_con[m.t.at(1), stf, sit, sto, com] ==
+    if m.periods is not None:
+        initial = m.e_sto_con_inter[m.period.first(), stf, sit, sto, com]
+    else:
+        initial = m.e_sto_con[m.t.at(1), stf, sit, sto, com]
+    return (initial ==
             m.cap_sto_c[stf, sit, sto, com] *
             m.storage_dict['init'][(stf, sit, sto, com)])
 
 
 def res_storage_state_cyclicity_rule(m, stf, sit, sto, com):
+    if m.periods is not None:
+        return (m.e_sto_con_inter[m.period.first(), stf, sit, sto, com] <=
+                m.e_sto_con_inter[m.period.last(), stf, sit, sto, com])
     return (m.e_sto_con[m.t.at(1), stf, sit, sto, com] <=
             m.e_sto_con[m.t.at(len(m.t)), stf, sit, sto, com])
 
 
+# storage content at the start of the next period == storage content at the
+# start of period p * (1-discharge) + change over its representative period
+def def_storage_state_inter_rule(m, p, stf, sit, sto, com):
+    if p == m.period.last():
+        return pyomo.Constraint.Skip
+    first, last = m.periods[m.period_order[p]]
+    return (m.e_sto_con_inter[p + 1, stf, sit, sto, com] ==
+            m.e_sto_con_inter[p, stf, sit, sto, com] *
+            period_discharge(m, stf, sit, sto, com, first, last) +
+            m.e_sto_con[last, stf, sit, sto, com])
+
+
+# lowest change <= change of storage content in timestep tm
+def res_storage_change_min_rule(m, tm, stf, sit, sto, com):
+    return (m.e_sto_con_min[m.period_of[tm], stf, sit, sto, com] <=
+            m.e_sto_con[tm, stf, sit, sto, com])
+
+
+# change of storage content in timestep tm <= highest change
+def res_storage_change_max_rule(m, tm, stf, sit, sto, com):
+    return (m.e_sto_con[tm, stf, sit, sto, com] <=
+            m.e_sto_con_max[m.period_of[tm], stf, sit, sto, com])
+
+
+# storage content within period p >= 0 (the discharge of the content at the
+# start applies to the whole period, which underestimates the content)
+def res_storage_inter_min_rule(m, p, stf, sit, sto, com):
+    if p == m.period.last():
+        return pyomo.Constraint.Skip
+    rep = m.period_order[p]
+    first, last = m.periods[rep]
+    return (0 <= m.e_sto_con_inter[p, stf, sit, sto, com] *
+            period_discharge(m, stf, sit, sto, com, first, last) +
+            m.e_sto_con_min[rep, stf, sit, sto, com])
+
+
+# storage content within period p <= storage capacity (the content at the
+# end is bounded by the one at the start of the next period)
+def res_storage_inter_max_rule(m, p, stf, sit, sto, com):
+    if p == m.period.last():
+        return (m.e_sto_con_inter[p, stf, sit, sto, com] <=
+                m.cap_sto_c[stf, sit, sto, com])
+    rep = m.period_order[p]
+    return (m.e_sto_con_inter[p, stf, sit, sto, com] +
+            m.e_sto_con_max[rep, stf, sit, sto, com] <=
+            m.cap_sto_c[stf, sit, sto, com])
+
+
+def storage_content_inter(m, stf, sit, sto, com):
+    """Storage content at the start of each original period, times the
+    number of its timesteps; i.e. the part of the storage content which
+    e_sto_con (the change since the start of the period) leaves out"""
+    return sum(m.e_sto_con_inter[p, stf, sit, sto, com] *
+               (m.periods[rep][1] - m.periods[rep][0] + 1)
+               for p, rep in enumerate(m.period_order))
+
+
+def period_discharge(m, stf, sit, sto, com, first, last):
+    """Share of the storage content which is left after the timesteps
+    first to last"""
+    return ((1 - m.storage_dict['discharge'][(stf, sit, sto, com)]) **
+            (m.dt.value * (last - first + 1)))
+
+
 def def_storage_energy_power_ratio_rule(m, stf, sit, sto, com):
     return (m.cap_sto_c[stf, sit, sto, com] == m.cap_sto_p[stf, sit, sto, com] *
             m.storage_dict['ep-ratio'][(stf, sit, sto, com)])
@@ -267,12 +409,10 @@ def storage_balance(m, tm, stf, sit, com):
     For a given commodity co and timestep tm, calculate the balance of
     storage input and output """
 
-    return sum(m.e_sto_in[(tm, stframe, site, storage, com)] -
-               m.e_sto_out[(tm, stframe, site, storage, com)]
+    return sum(m.e_sto_in[(tm,) + s] - m.e_sto_out[(tm,) + s]
                # usage as input for storage increases consumption
                # output from storage decreases consumption
-               for stframe, site, storage, commodity in m.sto_tuples
-               if site == sit and stframe == stf and commodity == com)
+               for s in m.balance_index['sto'].get((stf, sit, com), ()))
 
 
 # storage costs
@@ -301,17 +441,29 @@ def storage_cost(m, cost_type):
                    m.storage_dict['cost_factor'][s]
                    for s in m.sto_tuples)
     elif cost_type == 'Variable':
-        return sum(m.e_sto_con[(tm,) + s] * m.weight *
+        cost = sum(m.e_sto_con[(tm,) + s] * weight(m, tm) *
                    m.storage_dict['var-cost-c'][s] *
                    m.storage_dict['cost_factor'][s] +
                    (m.e_sto_in[(tm,) + s] + m.e_sto_out[(tm,) + s]) *
-                   m.weight * m.storage_dict['var-cost-p'][s] *
+                   weight(m, tm) * m.storage_dict['var-cost-p'][s] *
                    m.storage_dict['cost_factor'][s]
                    for tm in m.tm
                    for s in m.sto_tuples)
+        if m.periods is not None:
+            cost += sum(storage_content_inter(m, *s) * m.weight *
+                        m.storage_dict['var-cost-c'][s] *
+                        m.storage_dict['cost_factor'][s]
+                        for s in m.sto_tuples)
+        return cost
                    
                    
 def specific_storage_cost(m, stf, sit, sto, com, cost_type):
+    """returns the constraint of the storage costs of one cost type"""
+    return (m.storage_costs[stf, sit, sto, com, cost_type] ==
+            storage_cost_by_type(m, stf, sit, sto, com, cost_type))
+
+
+def storage_cost_by_type(m, stf, sit, sto, com, cost_type):
     """returns storage costs broke down to the different cost types"""
     if cost_type == 'Invest':
         cost_spec_storage = (m.cap_sto_p_new[stf, sit, sto, com] *
@@ -327,81 +479,64 @@ def specific_storage_cost(m, stf, sit, sto, com, cost_type):
                                   m.cap_sto_c_new[stf, sit, sto, com] *
                                   m.storage_dict['inv-cost-c'][stf, sit, sto, com] *
                                   m.storage_dict['overpay-factor'][stf, sit, sto, com])
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        return cost_spec_storage
     elif cost_type == 'Fixed':
         cost_spec_storage = ((m.cap_sto_p[stf, sit, sto, com] * m.storage_dict['fix-cost-p'][stf, sit, sto, com] +
                               m.cap_sto_c[stf, sit, sto, com] * m.storage_dict['fix-cost-c'][stf, sit, sto, com]) *
                              m.storage_dict['cost_factor'][stf, sit, sto, com])
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        return cost_spec_storage
     elif cost_type == 'Variable':
-        cost_spec_storage = sum(m.e_sto_con[tm, stf, sit, sto, com] * m.weight *
+        cost_spec_storage = sum(m.e_sto_con[tm, stf, sit, sto, com] * weight(m, tm) *
                              m.storage_dict['var-cost-c'][stf, sit, sto, com] *
                              m.storage_dict['cost_factor'][stf, sit, sto, com] +
                              (m.e_sto_in[tm, stf, sit, sto, com] + m.e_sto_out[tm, stf, sit, sto, com]) *
-                             m.weight * m.storage_dict['var-cost-p'][stf, sit, sto, com] *
+                             weight(m, tm) * m.storage_dict['var-cost-p'][stf, sit, sto, com] *
                              m.storage_dict['cost_factor'][stf, sit, sto, com]
                              for tm in m.tm)
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        if m.periods is not None:
+            cost_spec_storage += (storage_content_inter(m, stf, sit, sto, com) *
+                                  m.weight *
+                                  m.storage_dict['var-cost-c'][stf, sit, sto, com] *
+                                  m.storage_dict['cost_factor'][stf, sit, sto, com])
+        return cost_spec_storage
     elif cost_type == 'Fuel':
         cost_spec_storage=0
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        return cost_spec_storage
     elif cost_type == 'Environmental':
         cost_spec_storage = 0
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        return cost_spec_storage
     elif cost_type == 'Revenue':
         cost_spec_storage = 0
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        return cost_spec_storage
     elif cost_type == 'Purchase':
         cost_spec_storage = 0
-        return m.storage_costs[stf, sit, sto, com, cost_type] == cost_spec_storage
+        return cost_spec_storage
     else:
         raise NotImplementedError("Unknown cost type.")                   
 
 
 def op_sto_tuples(sto_tuple, m):
-    """ s.a. op_pro_tuples
+    """ s.a. op_pro_tuples, but operational up to the next support
+    timeframe
     """
-    op_sto = []
-    sorted_stf = sorted(list(m.stf))
-
-    for (stf, sit, sto, com) in sto_tuple:
-        for stf_later in sorted_stf:
-            index_helper = sorted_stf.index(stf_later)
-            if stf_later == max(sorted_stf):
-                if (stf_later +
-                    m.global_prop_dict['value'][(max(sorted_stf), 'Weight')] -
-                    1 <= stf +
-                        m.storage_dict['depreciation'][(stf, sit, sto, com)]):
-                    op_sto.append((sit, sto, com, stf, stf_later))
-            elif (sorted_stf[index_helper + 1] <=
-                  stf +
-                  m.storage_dict['depreciation'][(stf, sit, sto, com)] and
-                  stf <= stf_later):
-                op_sto.append((sit, sto, com, stf, stf_later))
-            else:
-                pass
+    sto_tuple = list(sto_tuple)
+    built = [stf for (stf, sit, sto, com) in sto_tuple]
+    depreciation = [m.storage_dict['depreciation'][unit] for unit in sto_tuple]
+    units, stfs = operational_stf(m, built, depreciation, 'next')
+    sorted_stf = m.stf_table['stf']
 
-    return op_sto
+    return [sto_tuple[u][1:] + (sto_tuple[u][0], sorted_stf[s])
+            for u, s in zip(units, stfs)]
 
 
 def inst_sto_tuples(m):
-    """ s.a. inst_pro_tuples
+    """ s.a. inst_pro_tuples, but operational up to the next support
+    timeframe
     """
-    inst_sto = []
-    sorted_stf = sorted(list(m.stf))
-
-    for (stf, sit, sto, com) in m.inst_sto.index:
-        for stf_later in sorted_stf:
-            index_helper = sorted_stf.index(stf_later)
-            if stf_later == max(m.stf):
-                if (stf_later +
-                    m.global_prop_dict['value'][(max(sorted_stf), 'Weight')] -
-                    1 < min(m.stf) +
-                        m.storage_dict['lifetime'][(stf, sit, sto, com)]):
-                    inst_sto.append((sit, sto, com, stf_later))
-            elif (sorted_stf[index_helper + 1] <=
-                  min(m.stf) + m.storage_dict['lifetime'][
-                                (stf, sit, sto, com)]):
-                inst_sto.append((sit, sto, com, stf_later))
-
-    return inst_sto
+    inst_sto = list(m.inst_sto.index)
+    lifetime = [m.storage_dict['lifetime'][unit] for unit in inst_sto]
+    units, stfs = operational_stf(m, [min(m.stf)] * len(inst_sto), lifetime,
+                                  'next', installed=True)
+    sorted_stf = m.stf_table['stf']
+
+    return [inst_sto[u][1:] + (sorted_stf[s],) for u, s in zip(units, stfs)]
@@ -1,5 +1,8 @@
 import math
 import pyomo.core as pyomo
+from .lifetime import operational_stf, built_stfs
+from .mutable import add_mutable_params
+from .periods import duration, weight
 
 def e_tra_domain_rule(m, tm, stf, sin, sout, tra, com):
     # assigning e_tra_in and e_tra_out variable domains for transport and DCPF
@@ -43,6 +46,7 @@ def add_transmission(m):
         initialize=tuple(m.transmission_dict["eff"].keys()),
         doc='Combinations of possible transmissions, e.g. '
             '(2020,South,Mid,hvac,Elec)')
+    m = add_mutable_params(m, 'transmission_dict', m.tra_tuples)
 
     if m.mode['int']:
         m.operational_tra_tuples = pyomo.Set(
@@ -60,6 +64,7 @@ def add_transmission(m):
                         in inst_tra_tuples(m)],
             doc='Installed transmissions that are still operational'
                 'through stf')
+        m.tra_built_stfs = built_stfs(m.operational_tra_tuples)
 
     # Variables
     m.cap_tra_new = pyomo.Var(
@@ -67,11 +72,12 @@ def add_transmission(m):
         within=pyomo.NonNegativeReals,
         doc='New transmission capacity (MW)')
         
-    m.transmission_costs = pyomo.Var(
-        m.tra_tuples,
-        m.cost_type,
-        within=pyomo.Reals,
-        doc='Costs of transmission by type and site (EUR/a)')    
+    if m.cost_breakdown:
+        m.transmission_costs = pyomo.Var(
+            m.tra_tuples,
+            m.cost_type,
+            within=pyomo.Reals,
+            doc='Costs of transmission by type and site (EUR/a)')
 
     # transmission capacity as expression object
     m.cap_tra = pyomo.Expression(
@@ -107,11 +113,13 @@ def add_transmission(m):
         rule=res_transmission_symmetry_rule,
         doc='total transmission capacity must be symmetric in both directions')
     
-    m.def_specific_transmission_cost = pyomo.Constraint(
-        m.tra_tuples,
-        m.cost_type,
-        rule=specific_transmission_cost,
-        doc='main cost function of transmission by cost type by process and stf')    
+    if m.cost_breakdown:
+        m.def_specific_transmission_cost = pyomo.Constraint(
+            m.tra_tuples,
+            m.cost_type,
+            rule=specific_transmission_cost,
+            doc='main cost function of transmission by cost type by process '
+                'and stf')
 
     return m
 
@@ -144,6 +152,7 @@ def add_transmission_dc(m):
         doc='Combinations of possible transmissions,'
             'without duplicate dc transmissions'
             ' e.g. (2020,South,Mid,hvac,Elec)')
+    m = add_mutable_params(m, 'transmission_dict', m.tra_tuples)
 
     # DCPF transmission tuples
     m.tra_tuples_dc = pyomo.Set(
@@ -175,6 +184,7 @@ def add_transmission_dc(m):
                         in inst_tra_tuples(m)],
             doc='Installed transmissions that are still operational'
                 'through stf')
+        m.tra_built_stfs = built_stfs(m.operational_tra_tuples)
 
     # Variables
     m.cap_tra_new = pyomo.Var(
@@ -182,11 +192,12 @@ def add_transmission_dc(m):
         within=pyomo.NonNegativeReals,
         doc='New transmission capacity (MW)')
         
-    m.transmission_costs = pyomo.Var(
-        m.tra_tuples,
-        m.cost_type,
-        within=pyomo.Reals,
-        doc='Costs of transmission by type and site (EUR/a)')    
+    if m.cost_breakdown:
+        m.transmission_costs = pyomo.Var(
+            m.tra_tuples,
+            m.cost_type,
+            within=pyomo.Reals,
+            doc='Costs of transmission by type and site (EUR/a)')
 
     # transmission capacity as expression object
     m.cap_tra = pyomo.Expression(
@@ -253,11 +264,13 @@ def add_transmission_dc(m):
         rule=res_transmission_symmetry_rule,
         doc='total transmission capacity must be symmetric in both directions')
         
-    m.def_specific_transmission_cost = pyomo.Constraint(
-        m.tra_tuples,
-        m.cost_type,
-        rule=specific_transmission_cost,
-        doc='main cost function of transmission by cost type by process and stf')    
+    if m.cost_breakdown:
+        m.def_specific_transmission_cost = pyomo.Constraint(
+            m.tra_tuples,
+            m.cost_type,
+            rule=specific_transmission_cost,
+            doc='main cost function of transmission by cost type by process '
+                'and stf')
 
     return m
 
@@ -274,17 +287,15 @@ def def_transmission_capacity_rule(m, stf, sin, sout, tra, com):
             else:
                 cap_tra = (
                     sum(m.cap_tra_new[stf_built, sin, sout, tra, com]
-                        for stf_built in m.stf
-                        if (sin, sout, tra, com, stf_built, stf) in
-                        m.operational_tra_tuples) +
+                        for stf_built in m.tra_built_stfs.get(
+                            (sin, sout, tra, com, stf), ())) +
                     m.transmission_dict['inst-cap']
                     [(min(m.stf), sin, sout, tra, com)])
         else:
             cap_tra = (
                 sum(m.cap_tra_new[stf_built, sin, sout, tra, com]
-                    for stf_built in m.stf
-                    if (sin, sout, tra, com, stf_built, stf) in
-                    m.operational_tra_tuples))
+                    for stf_built in m.tra_built_stfs.get(
+                        (sin, sout, tra, com, stf), ())))
     else:
         if (stf, sin, sout, tra, com) in m.tra_const_cap_dict:
             cap_tra = \
@@ -332,13 +343,13 @@ def e_tra_abs_rule2(m, tm, stf, sin, sout, tra, com):
 # transmission input <= transmission capacity
 def res_transmission_input_by_capacity_rule(m, tm, stf, sin, sout, tra, com):
     return (m.e_tra_in[tm, stf, sin, sout, tra, com] <=
-            m.dt * m.cap_tra[stf, sin, sout, tra, com])
+            duration(m, tm) * m.cap_tra[stf, sin, sout, tra, com])
 
 
 # - dc transmission input <= transmission capacity
 def res_transmission_dc_input_by_capacity_rule(m, tm, stf, sin, sout, tra, com):
     return (- m.e_tra_in[tm, stf, sin, sout, tra, com] <=
-            m.dt * m.cap_tra[stf, sin, sout, tra, com])
+            duration(m, tm) * m.cap_tra[stf, sin, sout, tra, com])
 
 
 # lower bound <= transmission capacity <= upper bound
@@ -360,20 +371,12 @@ def transmission_balance(m, tm, stf, sit, com):
     For a given commodity co and timestep tm, calculate the balance of
     import and export """
 
-    return (sum(m.e_tra_in[(tm, stframe, site_in, site_out,
-                            transmission, com)]
+    return (sum(m.e_tra_in[(tm,) + t]
                 # exports increase balance
-                for stframe, site_in, site_out, transmission, commodity
-                in m.tra_tuples
-                if (site_in == sit and stframe == stf and
-                    commodity == com)) -
-            sum(m.e_tra_out[(tm, stframe, site_in, site_out,
-                             transmission, com)]
+                for t in m.balance_index['tra_in'].get((stf, sit, com), ())) -
+            sum(m.e_tra_out[(tm,) + t]
                 # imports decrease balance
-                for stframe, site_in, site_out, transmission, commodity
-                in m.tra_tuples
-                if (site_out == sit and stframe == stf and
-                    commodity == com)))
+                for t in m.balance_index['tra_out'].get((stf, sit, com), ())))
 
 
 # transmission cost function
@@ -396,18 +399,18 @@ def transmission_cost(m, cost_type):
                    for t in m.tra_tuples)
     elif cost_type == 'Variable':
         if m.mode['dpf']:
-            return sum(m.e_tra_in[(tm,) + t] * m.weight *
+            return sum(m.e_tra_in[(tm,) + t] * weight(m, tm) *
                        m.transmission_dict['var-cost'][t] *
                        m.transmission_dict['cost_factor'][t]
                        for tm in m.tm
                        for t in m.tra_tuples_tp) + \
-                   sum(m.e_tra_abs[(tm,) + t] * m.weight *
+                   sum(m.e_tra_abs[(tm,) + t] * weight(m, tm) *
                        m.transmission_dict['var-cost'][t] *
                        m.transmission_dict['cost_factor'][t]
                        for tm in m.tm
                        for t in m.tra_tuples_dc)
         else:
-            return sum(m.e_tra_in[(tm,) + t] * m.weight *
+            return sum(m.e_tra_in[(tm,) + t] * weight(m, tm) *
                        m.transmission_dict['var-cost'][t] *
                        m.transmission_dict['cost_factor'][t]
                        for tm in m.tm
@@ -416,6 +419,12 @@ def transmission_cost(m, cost_type):
 
 # transmission cost function broke down to the individual cost types and links
 def specific_transmission_cost(m, stf, sit, sit_, tra, com, cost_type):
+    """returns the constraint of the transmission costs of one cost type"""
+    return (m.transmission_costs[stf, sit, sit_, tra, com, cost_type] ==
+            transmission_cost_by_type(m, stf, sit, sit_, tra, com, cost_type))
+
+
+def transmission_cost_by_type(m, stf, sit, sit_, tra, com, cost_type):
     """returns transmission costs broke down to the different cost types"""
     if cost_type == 'Invest':
         cost_spec_transmission = (m.cap_tra_new[stf, sit, sit_, tra, com] *
@@ -425,86 +434,66 @@ def specific_transmission_cost(m, stf, sit, sit_, tra, com, cost_type):
             cost_spec_transmission -= (m.cap_tra_new[stf, sit, sit_, tra, com] *
                                        m.transmission_dict['inv-cost'][stf, sit, sit_, tra, com] *
                                        m.transmission_dict['overpay-factor'][stf, sit, sit_, tra, com])
-        return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+        return cost_spec_transmission
     elif cost_type == 'Fixed':
         cost_spec_transmission = (
                 m.cap_tra[stf, sit, sit_, tra, com] * m.transmission_dict['fix-cost'][stf, sit, sit_, tra, com] *
                 m.transmission_dict['cost_factor'][stf, sit, sit_, tra, com])
-        return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+        return cost_spec_transmission
 
     elif cost_type == 'Variable':
         if m.mode['dpf']:
-            cost_spec_transmission = sum(m.e_tra_in[tm, stf, sit, sit_, tra, com] * m.weight *
+            cost_spec_transmission = sum(m.e_tra_in[tm, stf, sit, sit_, tra, com] * weight(m, tm) *
                                          m.transmission_dict['var-cost'][stf, sit, sit_, tra, com] *
                                          m.transmission_dict['cost_factor'][stf, sit, sit_, tra, com]
                                          for tm in m.tm) + \
-                                     (m.e_tra_abs[tm, stf, sit, sit_, tra, com] * m.weight *
+                                     (m.e_tra_abs[tm, stf, sit, sit_, tra, com] * weight(m, tm) *
                                       m.transmission_dict['var-cost'][stf, sit, sit_, tra, com] *
                                       m.transmission_dict['cost_factor'][stf, sit, sit_, tra, com]
                                       for tm in m.tm)
-            return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+            return cost_spec_transmission
         else:
-            cost_spec_transmission = sum(m.e_tra_in[tm, stf, sit, sit_, tra, com] * m.weight *
+            cost_spec_transmission = sum(m.e_tra_in[tm, stf, sit, sit_, tra, com] * weight(m, tm) *
                                          m.transmission_dict['var-cost'][stf, sit, sit_, tra, com] *
                                          m.transmission_dict['cost_factor'][stf, sit, sit_, tra, com]
                                          for tm in m.tm)
-            return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+            return cost_spec_transmission
     elif cost_type == 'Fuel':
         cost_spec_transmission = 0
-        return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+        return cost_spec_transmission
     elif cost_type == 'Environmental':
         cost_spec_transmission = 0
-        return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+        return cost_spec_transmission
     elif cost_type == 'Revenue':
         cost_spec_transmission = 0
-        return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+        return cost_spec_transmission
     elif cost_type == 'Purchase':
         cost_spec_transmission = 0
-        return m.transmission_costs[stf, sit, sit_, tra, com, cost_type] == cost_spec_transmission
+        return cost_spec_transmission
 
 def op_tra_tuples(tra_tuple, m):
-    """ s.a. op_pro_tuples
+    """ s.a. op_pro_tuples, but operational up to the next support
+    timeframe
     """
-    op_tra = []
-    sorted_stf = sorted(list(m.stf))
-
-    for (stf, sit1, sit2, tra, com) in tra_tuple:
-        for stf_later in sorted_stf:
-            index_helper = sorted_stf.index(stf_later)
-            if stf_later == max(sorted_stf):
-                if (stf_later +
-                    m.global_prop_dict['value'][(max(sorted_stf), 'Weight')] -
-                    1 <= stf + m.transmission_dict['depreciation'][
-                        (stf, sit1, sit2, tra, com)]):
-                    op_tra.append((sit1, sit2, tra, com, stf, stf_later))
-            elif (sorted_stf[index_helper + 1] <=
-                  stf + m.transmission_dict['depreciation'][
-                      (stf, sit1, sit2, tra, com)] and stf <= stf_later):
-                op_tra.append((sit1, sit2, tra, com, stf, stf_later))
-            else:
-                pass
+    tra_tuple = list(tra_tuple)
+    built = [stf for (stf, sit1, sit2, tra, com) in tra_tuple]
+    depreciation = [m.transmission_dict['depreciation'][unit]
+                    for unit in tra_tuple]
+    units, stfs = operational_stf(m, built, depreciation, 'next')
+    sorted_stf = m.stf_table['stf']
 
-    return op_tra
+    return [tra_tuple[u][1:] + (tra_tuple[u][0], sorted_stf[s])
+            for u, s in zip(units, stfs)]
 
 
 def inst_tra_tuples(m):
-    """ s.a. inst_pro_tuples
+    """ s.a. inst_pro_tuples, but operational up to the next support
+    timeframe
     """
-    inst_tra = []
-    sorted_stf = sorted(list(m.stf))
-
-    for (stf, sit1, sit2, tra, com) in m.inst_tra.index:
-        for stf_later in sorted_stf:
-            index_helper = sorted_stf.index(stf_later)
-            if stf_later == max(m.stf):
-                if (stf_later +
-                    m.global_prop_dict['value'][(max(sorted_stf), 'Weight')] -
-                    1 < min(m.stf) + m.transmission_dict['lifetime'][
-                        (stf, sit1, sit2, tra, com)]):
-                    inst_tra.append((sit1, sit2, tra, com, stf_later))
-            elif (sorted_stf[index_helper + 1] <= min(m.stf) +
-                  m.transmission_dict['lifetime'][
-                      (stf, sit1, sit2, tra, com)]):
-                inst_tra.append((sit1, sit2, tra, com, stf_later))
-
-    return inst_tra
+    inst_tra = list(m.inst_tra.index)
+    lifetime = [m.transmission_dict['lifetime'][unit] for unit in inst_tra]
+    units, stfs = operational_stf(m, [min(m.stf)] * len(inst_tra), lifetime,
+                                  'next', installed=True)
+    sorted_stf = m.stf_table['stf']
+
+    return [inst_tra[u][1:] + (sorted_stf[s],) for u, s in zip(units, stfs)]
@@ -1,30 +1,51 @@
+import functools
 import pandas as pd
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from xlrd import XLRDError
 import pyomo.core as pyomo
+from .cache import cached
+from .paramstore import ParamStore, TimeSeriesStore
 from .features.modelhelper import *
 from .identify import *
 
 
-def read_input(input_files, year):
+def read_input(input_files, year, cache_dir=None, workers=1):
     """Read Excel input file and prepare URBS input dict.
 
     Reads the Excel spreadsheets that adheres to the structure shown in
     mimo-example.xlsx. Column titles in 'Demand' and 'SupIm' are split, so that
     'Site.Commodity' becomes the MultiIndex column ('Site', 'Commodity').
+    If the input cache is enabled, the sheets of each spreadsheet are
+    cached, so only new or changed spreadsheets are parsed again (c.f.
+    urbs.cache). Instead of a
+    spreadsheet, a sheet directory with one CSV or Parquet file per sheet
+    can be used (c.f. SheetDirectory).
 
     Args:
-        - filename: filename to Excel spreadsheets
+        - filename: filename to Excel spreadsheets or sheet directory, or a
+          folder of them for intertemporal problems
         - year: current year for non-intertemporal problems
+        - cache_dir: (optional) directory of the input cache, default: the
+          environment variable URBS_CACHE_DIR; without both, the
+          spreadsheets are always parsed
+        - workers: (optional) number of processes parsing the files of a
+          folder in parallel, default: 1
 
     Returns:
         a dict of up to 12 DataFrames
     """
 
-    if os.path.isdir(input_files):
+    if is_sheet_directory(input_files):
+        input_files = [input_files]
+    elif os.path.isdir(input_files):
         glob_input = os.path.join(input_files, '*.xlsx')
-        input_files = sorted(glob.glob(glob_input))
+        sheet_directories = [
+            path for path in glob.glob(os.path.join(input_files, '*'))
+            if is_sheet_directory(path)]
+        input_files = sorted(glob.glob(glob_input) + sheet_directories)
     else:
         input_files = [input_files]
 
@@ -41,104 +62,29 @@ def read_input(input_files, year):
     ds = []
     ef = []
 
-    for filename in input_files:
-        with pd.ExcelFile(filename) as xls:
-
-            global_prop = xls.parse('Global').set_index(['Property'])
-            # create support timeframe index
-            if ('Support timeframe' in
-                    global_prop.value):
-                support_timeframe = (
-                    global_prop.loc['Support timeframe']['value'])
-                global_prop = (
-                    global_prop.drop(['Support timeframe'])
-                    .drop(['description'], axis=1))
-            else:
-                support_timeframe = year
-            global_prop = pd.concat([global_prop], keys=[support_timeframe],
-                                    names=['support_timeframe'])
-            gl.append(global_prop)
-            site = xls.parse('Site').set_index(['Name'])
-            site = pd.concat([site], keys=[support_timeframe],
-                             names=['support_timeframe'])
-            sit.append(site)
-            commodity = (
-                xls.parse('Commodity')
-                   .set_index(['Site', 'Commodity', 'Type']))
-            commodity = pd.concat([commodity], keys=[support_timeframe],
-                                  names=['support_timeframe'])
-            com.append(commodity)
-            process = xls.parse('Process').set_index(['Site', 'Process'])
-            process = pd.concat([process], keys=[support_timeframe],
-                                names=['support_timeframe'])
-            pro.append(process)
-            process_commodity = (
-                xls.parse('Process-Commodity')
-                   .set_index(['Process', 'Commodity', 'Direction']))
-            process_commodity = pd.concat([process_commodity],
-                                          keys=[support_timeframe],
-                                          names=['support_timeframe'])
-            pro_com.append(process_commodity)
-            demand = xls.parse('Demand').set_index(['t'])
-            demand = pd.concat([demand], keys=[support_timeframe],
-                               names=['support_timeframe'])
-            # split columns by dots '.', so that 'DE.Elec' becomes
-            # the two-level column index ('DE', 'Elec')
-            demand.columns = split_columns(demand.columns, '.')
-            dem.append(demand)
-            supim = xls.parse('SupIm').set_index(['t'])
-            supim = pd.concat([supim], keys=[support_timeframe],
-                              names=['support_timeframe'])
-            supim.columns = split_columns(supim.columns, '.')
-            sup.append(supim)
-
-            # collect data for the additional features
-            # Transmission, Storage, DSM
-            if 'Transmission' in xls.sheet_names:
-                transmission = (
-                    xls.parse('Transmission')
-                    .set_index(['Site In', 'Site Out',
-                                'Transmission', 'Commodity']))
-                transmission = (
-                    pd.concat([transmission], keys=[support_timeframe],
-                              names=['support_timeframe']))
-            else:
-                transmission = pd.DataFrame()
-            tra.append(transmission)
-            if 'Storage' in xls.sheet_names:
-                storage = (
-                    xls.parse('Storage')
-                    .set_index(['Site', 'Storage', 'Commodity']))
-                storage = pd.concat([storage], keys=[support_timeframe],
-                                    names=['support_timeframe'])
-            else:
-                storage = pd.DataFrame()
-            sto.append(storage)
-            if 'DSM' in xls.sheet_names:
-                dsm = xls.parse('DSM').set_index(['Site', 'Commodity'])
-                dsm = pd.concat([dsm], keys=[support_timeframe],
-                                names=['support_timeframe'])
-            else:
-                dsm = pd.DataFrame()
-            ds.append(dsm)
-            if 'Buy-Sell-Price'in xls.sheet_names:
-                buy_sell_price = xls.parse('Buy-Sell-Price').set_index(['t'])
-                buy_sell_price = pd.concat([buy_sell_price],
-                                           keys=[support_timeframe],
-                                           names=['support_timeframe'])
-                buy_sell_price.columns = \
-                    split_columns(buy_sell_price.columns, '.')
-            else:
-                buy_sell_price = pd.DataFrame()
-            bsp.append(buy_sell_price)
-            if 'TimeVarEff' in xls.sheet_names:
-                eff_factor = (xls.parse('TimeVarEff').set_index(['t']))
-                eff_factor = pd.concat([eff_factor], keys=[support_timeframe],
-                                       names=['support_timeframe'])
-                eff_factor.columns = split_columns(eff_factor.columns, '.')
-            else:
-                eff_factor = pd.DataFrame()
-            ef.append(eff_factor)
+    workers = min(workers, len(input_files))
+    if workers > 1:
+        # map returns the sheets in the order of input_files
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            workbooks = list(executor.map(
+                read_sheets, input_files, repeat(year), repeat(cache_dir)))
+    else:
+        workbooks = [read_sheets(filename, year, cache_dir)
+                     for filename in input_files]
+
+    for sheets in workbooks:
+        gl.append(sheets['global_prop'])
+        sit.append(sheets['site'])
+        com.append(sheets['commodity'])
+        pro.append(sheets['process'])
+        pro_com.append(sheets['process_commodity'])
+        dem.append(sheets['demand'])
+        sup.append(sheets['supim'])
+        tra.append(sheets['transmission'])
+        sto.append(sheets['storage'])
+        ds.append(sheets['dsm'])
+        bsp.append(sheets['buy_sell_price'])
+        ef.append(sheets['eff_factor'])
 
     # prepare input data
     try:
@@ -179,6 +125,210 @@ def read_input(input_files, year):
     return data
 
 
+def read_sheets(filename, year, cache_dir=None):
+    """Read the sheets of one input file, using the input cache for
+    Excel spreadsheets (c.f. read_input).
+    """
+    if is_sheet_directory(filename):
+        return read_workbook(filename, year)  # fast enough uncached
+    return cached(read_workbook, filename, year, cache_dir=cache_dir)
+
+
+def read_workbook(filename, year):
+    """Read the sheets of one Excel input file or sheet directory.
+
+    Args:
+        - filename: filename of an Excel spreadsheet or sheet directory
+        - year: current year for non-intertemporal problems
+
+    Returns:
+        a dict of DataFrames, indexed by support timeframe
+    """
+    with open_workbook(filename) as xls:
+
+        global_prop = xls.parse('Global').set_index(['Property'])
+        # create support timeframe index
+        if ('Support timeframe' in
+                global_prop.value):
+            support_timeframe = (
+                global_prop.loc['Support timeframe']['value'])
+            global_prop = (
+                global_prop.drop(['Support timeframe'])
+                .drop(['description'], axis=1))
+        else:
+            support_timeframe = year
+        global_prop = pd.concat([global_prop], keys=[support_timeframe],
+                                names=['support_timeframe'])
+        site = xls.parse('Site').set_index(['Name'])
+        site = pd.concat([site], keys=[support_timeframe],
+                         names=['support_timeframe'])
+        commodity = (
+            xls.parse('Commodity')
+               .set_index(['Site', 'Commodity', 'Type']))
+        commodity = pd.concat([commodity], keys=[support_timeframe],
+                              names=['support_timeframe'])
+        process = xls.parse('Process').set_index(['Site', 'Process'])
+        process = pd.concat([process], keys=[support_timeframe],
+                            names=['support_timeframe'])
+        process_commodity = (
+            xls.parse('Process-Commodity')
+               .set_index(['Process', 'Commodity', 'Direction']))
+        process_commodity = pd.concat([process_commodity],
+                                      keys=[support_timeframe],
+                                      names=['support_timeframe'])
+        demand = xls.parse('Demand').set_index(['t'])
+        demand = pd.concat([demand], keys=[support_timeframe],
+                           names=['support_timeframe'])
+        # split columns by dots '.', so that 'DE.Elec' becomes
+        # the two-level column index ('DE', 'Elec')
+        demand.columns = split_columns(demand.columns, '.')
+        supim = xls.parse('SupIm').set_index(['t'])
+        supim = pd.concat([supim], keys=[support_timeframe],
+                          names=['support_timeframe'])
+        supim.columns = split_columns(supim.columns, '.')
+
+        # collect data for the additional features
+        # Transmission, Storage, DSM
+        if 'Transmission' in xls.sheet_names:
+            transmission = (
+                xls.parse('Transmission')
+                .set_index(['Site In', 'Site Out',
+                            'Transmission', 'Commodity']))
+            transmission = (
+                pd.concat([transmission], keys=[support_timeframe],
+                          names=['support_timeframe']))
+        else:
+            transmission = pd.DataFrame()
+        if 'Storage' in xls.sheet_names:
+            storage = (
+                xls.parse('Storage')
+                .set_index(['Site', 'Storage', 'Commodity']))
+            storage = pd.concat([storage], keys=[support_timeframe],
+                                names=['support_timeframe'])
+        else:
+            storage = pd.DataFrame()
+        if 'DSM' in xls.sheet_names:
+            dsm = xls.parse('DSM').set_index(['Site', 'Commodity'])
+            dsm = pd.concat([dsm], keys=[support_timeframe],
+                            names=['support_timeframe'])
+        else:
+            dsm = pd.DataFrame()
+        if 'Buy-Sell-Price'in xls.sheet_names:
+            buy_sell_price = xls.parse('Buy-Sell-Price').set_index(['t'])
+            buy_sell_price = pd.concat([buy_sell_price],
+                                       keys=[support_timeframe],
+                                       names=['support_timeframe'])
+            buy_sell_price.columns = \
+                split_columns(buy_sell_price.columns, '.')
+        else:
+            buy_sell_price = pd.DataFrame()
+        if 'TimeVarEff' in xls.sheet_names:
+            eff_factor = (xls.parse('TimeVarEff').set_index(['t']))
+            eff_factor = pd.concat([eff_factor], keys=[support_timeframe],
+                                   names=['support_timeframe'])
+            eff_factor.columns = split_columns(eff_factor.columns, '.')
+        else:
+            eff_factor = pd.DataFrame()
+
+    return {
+        'global_prop': global_prop,
+        'site': site,
+        'commodity': commodity,
+        'process': process,
+        'process_commodity': process_commodity,
+        'demand': demand,
+        'supim': supim,
+        'transmission': transmission,
+        'storage': storage,
+        'dsm': dsm,
+        'buy_sell_price': buy_sell_price,
+        'eff_factor': eff_factor
+    }
+
+
+# file types of sheet directories, in order of preference; CSV files are
+# read with exactly the values written by convert_input
+SHEET_FILE_TYPES = {
+    '.parquet': pd.read_parquet,
+    '.csv': functools.partial(pd.read_csv, float_precision='round_trip')}
+
+
+class SheetDirectory(object):
+    """ A directory with one file per input sheet, read like pd.ExcelFile.
+
+    Each sheet of an Excel input file, e.g. 'Process-Commodity', is stored
+    as a CSV or Parquet file of the same name and with the same columns,
+    e.g. Process-Commodity.csv. Parquet files need pyarrow or fastparquet.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        for extension in SHEET_FILE_TYPES:
+            pattern = os.path.join(path, '*' + extension)
+            for filename in sorted(glob.glob(pattern)):
+                sheet_name = os.path.basename(filename)[:-len(extension)]
+                self.files.setdefault(sheet_name, filename)
+        self.sheet_names = list(self.files)
+
+    def parse(self, sheet_name):
+        filename = self.files[sheet_name]
+        return SHEET_FILE_TYPES[os.path.splitext(filename)[1]](filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def is_sheet_directory(path):
+    """Check whether path is a sheet directory (c.f. SheetDirectory)."""
+    return os.path.isdir(path) and any(
+        os.path.isfile(os.path.join(path, 'Global' + extension))
+        for extension in SHEET_FILE_TYPES)
+
+
+def open_workbook(filename):
+    """Open an Excel input file or a sheet directory."""
+    if os.path.isdir(filename):
+        return SheetDirectory(filename)
+    return pd.ExcelFile(filename)
+
+
+def convert_input(input_files, output_dir, file_type='.csv'):
+    """Convert Excel input files to sheet directories.
+
+    Args:
+        - input_files: filename of an Excel spreadsheet or a folder of them
+        - output_dir: the sheet directory, or for a folder of spreadsheets,
+          the folder of sheet directories named after the spreadsheets
+        - file_type: '.csv' (default) or '.parquet'
+
+    Returns:
+        list of the created sheet directories
+    """
+    if os.path.isdir(input_files):
+        glob_input = os.path.join(input_files, '*.xlsx')
+        workbooks = [
+            (filename, os.path.join(
+                output_dir, os.path.splitext(os.path.basename(filename))[0]))
+            for filename in sorted(glob.glob(glob_input))]
+    else:
+        workbooks = [(input_files, output_dir)]
+
+    for filename, sheet_dir in workbooks:
+        os.makedirs(sheet_dir, exist_ok=True)
+        with pd.ExcelFile(filename) as xls:
+            for sheet_name in xls.sheet_names:
+                sheet = xls.parse(sheet_name)
+                path = os.path.join(sheet_dir, sheet_name + file_type)
+                if file_type == '.parquet':
+                    sheet.to_parquet(path, index=False)
+                else:
+                    sheet.to_csv(path, index=False)
+    return [sheet_dir for _, sheet_dir in workbooks]
+
+
 # preparing the pyomo model
 def pyomo_model_prep(data, timesteps):
     '''Performs calculations on the data frames in dictionary "data" for
@@ -204,6 +354,10 @@ def pyomo_model_prep(data, timesteps):
 
     m.mode = identify_mode(data)
     m.timesteps = timesteps
+    # representative periods of aggregated timeseries (c.f. aggregation.py)
+    m.aggregation = data.get('aggregation')
+    # timesteps of different durations (c.f. segment_timeseries)
+    m.segmentation = data.get('segmentation')
     m.global_prop = data['global_prop']
     commodity = data['commodity']
     process = data['process']
@@ -219,8 +373,8 @@ def pyomo_model_prep(data, timesteps):
     # Converting Data frames to dict
     # Data frames that need to be modified will be converted after modification
     m.site_dict = data['site'].to_dict()
-    m.demand_dict = data['demand'].to_dict()
-    m.supim_dict = data['supim'].to_dict()
+    m.demand_dict = TimeSeriesStore(data['demand'])
+    m.supim_dict = TimeSeriesStore(data['supim'])
 
     # additional features
     if m.mode['tra']:
@@ -238,13 +392,13 @@ def pyomo_model_prep(data, timesteps):
     if m.mode['dsm']:
         m.dsm_dict = data["dsm"].dropna(axis=0, how='all').to_dict()
     if m.mode['bsp']:
-        m.buy_sell_price_dict = \
-            data["buy_sell_price"].dropna(axis=0, how='all').to_dict()
+        m.buy_sell_price_dict = TimeSeriesStore(
+            data["buy_sell_price"].dropna(axis=0, how='all'))
         # adding Revenue and Purchase to cost types
         m.cost_type_list.extend(['Revenue', 'Purchase'])
     if m.mode['tve']:
-        m.eff_factor_dict = \
-            data["eff_factor"].dropna(axis=0, how='all').to_dict()
+        m.eff_factor_dict = TimeSeriesStore(
+            data["eff_factor"].dropna(axis=0, how='all'))
 
     # Create columns of support timeframe values
     commodity['support_timeframe'] = (commodity.index.
@@ -276,6 +430,30 @@ def pyomo_model_prep(data, timesteps):
     m.r_out_dict = (data['process_commodity'].xs('Out', level='Direction')
                     ['ratio'].to_dict())
 
+    # incidence index of the commodity balance: for each (stf, sit, com)
+    # the process inputs/outputs, transmission exports/imports and storages
+    # which consume or provide that commodity
+    r_in_by_pro = group_tuples(m.r_in_dict.keys(), (0, 1))
+    r_out_by_pro = group_tuples(m.r_out_dict.keys(), (0, 1))
+    m.balance_index = {
+        'pro_in': group_tuples(
+            ((stf, sit, pro, com)
+             for (stf, sit, pro) in process.index
+             for (_, _, com) in r_in_by_pro.get((stf, pro), ())),
+            (0, 1, 3)),
+        'pro_out': group_tuples(
+            ((stf, sit, pro, com)
+             for (stf, sit, pro) in process.index
+             for (_, _, com) in r_out_by_pro.get((stf, pro), ())),
+            (0, 1, 3))}
+    if m.mode['tra']:
+        m.balance_index['tra_in'] = group_tuples(transmission.index,
+                                                 (0, 1, 4))
+        m.balance_index['tra_out'] = group_tuples(transmission.index,
+                                                  (0, 2, 4))
+    if m.mode['sto']:
+        m.balance_index['sto'] = group_tuples(storage.index, (0, 1, 3))
+
     # process areas
     proc_area = data["process"]['area-per-cap']
     proc_area = proc_area[proc_area >= 0]
@@ -314,6 +492,8 @@ def pyomo_model_prep(data, timesteps):
 
     # derive invcost factor from WACC and depreciation duration
     if m.mode['int']:
+        m.stf_dist_dict = stf_distances(m)
+
         # modify pro_const_cap for intertemporal mode
         for index in tuple(pro_const_cap.index):
             stf_process = process.xs((index[1], index[2]), level=(1, 2))
@@ -330,44 +510,31 @@ def pyomo_model_prep(data, timesteps):
                               (max(commodity.index.get_level_values
                                    ('support_timeframe').unique()),
                                'Weight')]['value'] - 1)
-        process['invcost-factor'] = (process.apply(
-                                     lambda x: invcost_factor(
-                                         x['depreciation'],
-                                         x['wacc'],
-                                         x['discount'],
-                                         x['support_timeframe'],
-                                         x['stf_min']),
-                                     axis=1))
+        process['invcost-factor'] = invcost_factor(
+            process['depreciation'], process['wacc'], process['discount'],
+            process['support_timeframe'], process['stf_min'])
 
         # derive overpay-factor from WACC, depreciation and discount untility
-        process['overpay-factor'] = (process.apply(
-                                     lambda x: overpay_factor(
-                                         x['depreciation'],
-                                         x['wacc'],
-                                         x['discount'],
-                                         x['support_timeframe'],
-                                         x['stf_min'],
-                                         x['stf_end']),
-                                     axis=1))
+        process['overpay-factor'] = overpay_factor(
+            process['depreciation'], process['wacc'], process['discount'],
+            process['support_timeframe'], process['stf_min'],
+            process['stf_end'])
         process.loc[(process['overpay-factor'] < 0) |
                     (process['overpay-factor']
                      .isnull()), 'overpay-factor'] = 0
 
         # Derive multiplier for all energy based costs
-        commodity['stf_dist'] = (commodity['support_timeframe'].
-                                 apply(stf_dist, m=m))
-        commodity['discount-factor'] = (commodity['support_timeframe'].
-                                        apply(discount_factor, m=m))
-        commodity['eff-distance'] = (commodity['stf_dist'].
-                                     apply(effective_distance, m=m))
+        commodity['stf_dist'] = stf_dist(commodity['support_timeframe'], m)
+        commodity['discount-factor'] = discount_factor(
+            commodity['support_timeframe'], m)
+        commodity['eff-distance'] = effective_distance(
+            commodity['stf_dist'], m)
         commodity['cost_factor'] = (commodity['discount-factor'] *
                                     commodity['eff-distance'])
-        process['stf_dist'] = (process['support_timeframe'].
-                               apply(stf_dist, m=m))
-        process['discount-factor'] = (process['support_timeframe'].
-                                      apply(discount_factor, m=m))
-        process['eff-distance'] = (process['stf_dist'].
-                                   apply(effective_distance, m=m))
+        process['stf_dist'] = stf_dist(process['support_timeframe'], m)
+        process['discount-factor'] = discount_factor(
+            process['support_timeframe'], m)
+        process['eff-distance'] = effective_distance(process['stf_dist'], m)
         process['cost_factor'] = (process['discount-factor'] *
                                   process['eff-distance'])
 
@@ -392,35 +559,26 @@ def pyomo_model_prep(data, timesteps):
                                        (max(commodity.index.get_level_values
                                             ('support_timeframe').unique()),
                                         'Weight')]['value'] - 1)
-            transmission['invcost-factor'] = (
-                transmission.apply(lambda x: invcost_factor(
-                    x['depreciation'],
-                    x['wacc'],
-                    x['discount'],
-                    x['support_timeframe'],
-                    x['stf_min']),
-                    axis=1))
+            transmission['invcost-factor'] = invcost_factor(
+                transmission['depreciation'], transmission['wacc'],
+                transmission['discount'], transmission['support_timeframe'],
+                transmission['stf_min'])
             # derive overpay-factor from WACC, depreciation and
             # discount untility
-            transmission['overpay-factor'] = (
-                transmission.apply(lambda x: overpay_factor(
-                    x['depreciation'],
-                    x['wacc'],
-                    x['discount'],
-                    x['support_timeframe'],
-                    x['stf_min'],
-                    x['stf_end']),
-                    axis=1))
+            transmission['overpay-factor'] = overpay_factor(
+                transmission['depreciation'], transmission['wacc'],
+                transmission['discount'], transmission['support_timeframe'],
+                transmission['stf_min'], transmission['stf_end'])
             # Derive multiplier for all energy based costs
             transmission.loc[(transmission['overpay-factor'] < 0) |
                              (transmission['overpay-factor'].isnull()),
                              'overpay-factor'] = 0
-            transmission['stf_dist'] = (transmission['support_timeframe'].
-                                        apply(stf_dist, m=m))
-            transmission['discount-factor'] = (
-                transmission['support_timeframe'].apply(discount_factor, m=m))
-            transmission['eff-distance'] = (transmission['stf_dist'].
-                                            apply(effective_distance, m=m))
+            transmission['stf_dist'] = stf_dist(
+                transmission['support_timeframe'], m)
+            transmission['discount-factor'] = discount_factor(
+                transmission['support_timeframe'], m)
+            transmission['eff-distance'] = effective_distance(
+                transmission['stf_dist'], m)
             transmission['cost_factor'] = (transmission['discount-factor'] *
                                            transmission['eff-distance'])
         # storage mode
@@ -448,45 +606,29 @@ def pyomo_model_prep(data, timesteps):
                                   (max(commodity.index.get_level_values
                                        ('support_timeframe').unique()),
                                    'Weight')]['value'] - 1)
-            storage['invcost-factor'] = (
-                storage.apply(
-                    lambda x: invcost_factor(
-                        x['depreciation'],
-                        x['wacc'],
-                        x['discount'],
-                        x['support_timeframe'],
-                        x['stf_min']),
-                    axis=1))
-            storage['overpay-factor'] = (
-                storage.apply(lambda x: overpay_factor(
-                    x['depreciation'],
-                    x['wacc'],
-                    x['discount'],
-                    x['support_timeframe'],
-                    x['stf_min'],
-                    x['stf_end']),
-                    axis=1))
+            storage['invcost-factor'] = invcost_factor(
+                storage['depreciation'], storage['wacc'], storage['discount'],
+                storage['support_timeframe'], storage['stf_min'])
+            storage['overpay-factor'] = overpay_factor(
+                storage['depreciation'], storage['wacc'], storage['discount'],
+                storage['support_timeframe'], storage['stf_min'],
+                storage['stf_end'])
 
             storage.loc[(storage['overpay-factor'] < 0) |
                         (storage['overpay-factor'].isnull()),
                         'overpay-factor'] = 0
 
-            storage['stf_dist'] = (storage['support_timeframe']
-                                   .apply(stf_dist, m=m))
-            storage['discount-factor'] = (storage['support_timeframe']
-                                          .apply(discount_factor, m=m))
-            storage['eff-distance'] = (storage['stf_dist']
-                                       .apply(effective_distance, m=m))
+            storage['stf_dist'] = stf_dist(storage['support_timeframe'], m)
+            storage['discount-factor'] = discount_factor(
+                storage['support_timeframe'], m)
+            storage['eff-distance'] = effective_distance(
+                storage['stf_dist'], m)
             storage['cost_factor'] = (storage['discount-factor'] *
                                       storage['eff-distance'])
     else:
         # for one year problems
-        process['invcost-factor'] = (
-            process.apply(
-                lambda x: invcost_factor(
-                    x['depreciation'],
-                    x['wacc']),
-                axis=1))
+        process['invcost-factor'] = invcost_factor(
+            process['depreciation'], process['wacc'])
 
         # cost factor will be set to 1 for non intertemporal problems
         commodity['cost_factor'] = 1
@@ -494,39 +636,34 @@ def pyomo_model_prep(data, timesteps):
 
         # additional features
         if m.mode['tra']:
-            transmission['invcost-factor'] = (
-                transmission.apply(lambda x:
-                                   invcost_factor(x['depreciation'],
-                                                  x['wacc']),
-                                   axis=1))
+            transmission['invcost-factor'] = invcost_factor(
+                transmission['depreciation'], transmission['wacc'])
             transmission['cost_factor'] = 1
         if m.mode['sto']:
-            storage['invcost-factor'] = (
-                storage.apply(lambda x:
-                              invcost_factor(x['depreciation'],
-                                             x['wacc']),
-                              axis=1))
+            storage['invcost-factor'] = invcost_factor(
+                storage['depreciation'], storage['wacc'])
             storage['cost_factor'] = 1
 
-    # Converting Data frames to dictionaries
+    # Converting Data frames to dictionaries; the large technology tables
+    # become array-backed ParamStores with the same interface
     m.global_prop_dict = m.global_prop.to_dict()
-    m.commodity_dict = commodity.to_dict()
-    m.process_dict = process.to_dict()
+    m.commodity_dict = ParamStore(commodity)
+    m.process_dict = ParamStore(process)
 
     # dictionaries for additional features
     if m.mode['tra']:
-        m.transmission_dict = transmission.to_dict()
+        m.transmission_dict = ParamStore(transmission)
         # DCPF transmission lines are bidirectional and do not have symmetry
         # fix-cost and inv-cost should be multiplied by 2
         if m.mode['dpf']:
             transmission_dc = transmission[transmission['reactance'] > 0]
-            m.transmission_dc_dict = transmission_dc.to_dict()
+            m.transmission_dc_dict = ParamStore(transmission_dc)
             for t in m.transmission_dc_dict['reactance']:
                 m.transmission_dict['inv-cost'][t] = 2 * m.transmission_dict['inv-cost'][t]
                 m.transmission_dict['fix-cost'][t] = 2 * m.transmission_dict['fix-cost'][t]
 
     if m.mode['sto']:
-        m.storage_dict = storage.to_dict()
+        m.storage_dict = ParamStore(storage)
 
     # update m.mode['exp'] and write dictionaries with constant capacities
     m.mode['exp']['pro'] = identify_expansion(pro_const_cap['inst-cap'],
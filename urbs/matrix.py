@@ -0,0 +1,1459 @@
+"""Matrix backend: build the urbs linear program without Pyomo rule callbacks.
+
+create_model(..., backend='matrix') assembles the same linear program as the
+Pyomo model of create_model directly as sparse coordinate (COO) arrays. The
+coefficients of all timestep-indexed equations are generated with NumPy for
+the whole time axis at once, so the Python overhead scales with the number of
+processes, storages, transmissions etc. instead of their number times the
+number of timesteps.
+
+The resulting MatrixModel can be written to a (free) MPS file for any solver
+or solved directly with HiGHS (package highspy). After solving, it carries a
+result cache (prob._result) with the same entity names and index levels as
+the Pyomo model, so that get_entity, report, result_figures and save work
+unchanged.
+
+The rules of model.py and urbs.features are written a second time here; any
+change to them has to be made in both places. test/test_backends.py checks
+that both backends reach the same objective for the example input files.
+DC power flow transmission (dpf mode), mutable parameters,
+cost_breakdown=False, presolve, the DSM level formulation, representative
+periods and timesteps of different durations are not supported;
+create_model rejects them before building.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from .features.lifetime import stf_table, built_stfs
+from .features.modelhelper import commodity_subset, group_tuples, \
+                                  op_pro_tuples, inst_pro_tuples, stf_dist
+from .features.transmission import op_tra_tuples, inst_tra_tuples
+from .features.storage import op_sto_tuples, inst_sto_tuples
+from .features.BuySellPrice import search_sell_buy_tuple
+from .identify import identify_mode
+from .input import pyomo_model_prep
+
+
+class _Expr(object):
+    """Affine expression const + sum(coefs * x[cols]) in column space.
+
+    Used for the capacity expressions (cap_pro, cap_tra, ...) and all
+    equations which are not indexed over time.
+    """
+    __slots__ = ('const', 'cols', 'coefs')
+
+    def __init__(self, const=0.0, cols=(), coefs=()):
+        self.const = const
+        cols = np.asarray(cols, dtype=np.int64)
+        self.coefs = np.broadcast_to(np.asarray(coefs, dtype=float),
+                                     cols.shape).ravel()
+        self.cols = cols.ravel()
+
+    def __add__(self, other):
+        if isinstance(other, _Expr):
+            return _Expr(self.const + other.const,
+                         np.concatenate((self.cols, other.cols)),
+                         np.concatenate((self.coefs, other.coefs)))
+        return _Expr(self.const + other, self.cols, self.coefs)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return _Expr(-self.const, self.cols, -self.coefs)
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __mul__(self, factor):
+        return _Expr(self.const * factor, self.cols, self.coefs * factor)
+
+    __rmul__ = __mul__
+
+    def is_constant(self):
+        return len(self.cols) == 0
+
+    @staticmethod
+    def sum(exprs):
+        """Sum of many expressions, concatenated in one go."""
+        exprs = list(exprs)
+        if not exprs:
+            return _Expr()
+        return _Expr(sum(e.const for e in exprs),
+                     np.concatenate([e.cols for e in exprs]),
+                     np.concatenate([e.coefs for e in exprs]))
+
+
+class _Block(object):
+    """Contiguous range of columns (variables) or rows (constraints).
+
+    The entries of index tuple number i occupy positions offset + i * width
+    to offset + (i + 1) * width - 1, i.e. one position per timestep if the
+    block is indexed over the modelled timesteps 'tm' or all timesteps 't'.
+    """
+
+    def __init__(self, name, index, labels, offset, time, n_tm):
+        self.name = name
+        self.index = list(index)
+        self.labels = labels
+        self.offset = offset
+        self.time = time
+        self.width = {None: 1, 'tm': n_tm, 't': n_tm + 1}[time]
+        self.pos = {idx: i for i, idx in enumerate(self.index)}
+
+    def __len__(self):
+        return len(self.index) * self.width
+
+    def __getitem__(self, idx):
+        """Position(s) of index tuple idx, an array over time if indexed."""
+        start = self.offset + self.pos[idx] * self.width
+        if self.time is None:
+            return start
+        return np.arange(start, start + self.width)
+
+    def tm(self, idx):
+        """Positions of index tuple idx over the modelled timesteps."""
+        start = self.offset + self.pos[idx] * self.width
+        if self.time == 't':
+            start += 1
+        return np.arange(start, start + self.width - (self.time == 't'))
+
+    def prev(self, idx):
+        """Positions of index tuple idx at the timesteps preceding tm."""
+        return self.tm(idx) - 1
+
+    def local(self, idx):
+        """Slice of index tuple idx relative to the block offset."""
+        start = self.pos[idx] * self.width
+        return slice(start, start + self.width)
+
+
+class _LinearProgram(object):
+    """Assembly buffer for columns, rows and coefficients of the LP."""
+
+    def __init__(self, n_tm):
+        self.n_tm = n_tm
+        self.n_col = 0
+        self.n_row = 0
+        self.variables = {}
+        self.constraints = {}
+        self.col_lower = []
+        self.row_lower = []
+        self.row_upper = []
+        self.entries = []
+        self.objective = []
+
+    def add_variable(self, name, index, labels, time=None, lower=0.0):
+        block = _Block(name, index, labels, self.n_col, time, self.n_tm)
+        self.n_col += len(block)
+        self.col_lower.append(np.full(len(block), lower))
+        self.variables[name] = block
+        return block
+
+    def add_constraint(self, name, index, labels, time=None):
+        block = _Block(name, index, labels, self.n_row, time, self.n_tm)
+        self.n_row += len(block)
+        block.lower = np.full(len(block), -np.inf)
+        block.upper = np.full(len(block), np.inf)
+        self.row_lower.append(block.lower)
+        self.row_upper.append(block.upper)
+        self.constraints[name] = block
+        return block
+
+    def add_relations(self, name, labels, relations):
+        """Add one row per (idx, lhs, rhs, sense) relation of expressions.
+
+        The rows are oriented like Pyomo normalizes the relational expression
+        lhs == rhs or lhs <= rhs, so that the duals match those of the Pyomo
+        model. Relations without variables are trivial and skipped.
+        """
+        rows = []
+        for idx, lhs, rhs, sense in relations:
+            if rhs.is_constant():
+                body, bound, flip = lhs, rhs.const - lhs.const, False
+            elif lhs.is_constant():
+                body, bound, flip = rhs, lhs.const - rhs.const, True
+            else:
+                body, bound, flip = lhs - rhs, rhs.const - lhs.const, False
+            if body.is_constant():
+                continue
+            if sense == '==':
+                lower = upper = bound
+            elif flip:
+                lower, upper = bound, np.inf
+            else:
+                lower, upper = -np.inf, bound
+            rows.append((idx, body, lower, upper))
+
+        block = self.add_constraint(name, [r[0] for r in rows], labels)
+        for k, (idx, body, lower, upper) in enumerate(rows):
+            self.add(block.offset + k, body.cols, body.coefs)
+            block.lower[k] = lower
+            block.upper[k] = upper
+        return block
+
+    def add(self, rows, cols, vals):
+        """Add coefficients vals at (rows, cols), broadcasting all three."""
+        rows, cols, vals = np.broadcast_arrays(rows, cols, vals)
+        self.entries.append((rows.ravel(), cols.ravel(),
+                             vals.astype(float).ravel()))
+
+    def add_expr(self, rows, expr, factor=1.0):
+        """Add factor * expr to rows and return the constant part of it."""
+        rows = np.asarray(rows)
+        factor = np.asarray(factor, dtype=float)
+        if not expr.is_constant():
+            vals = np.multiply.outer(np.broadcast_to(factor, rows.shape),
+                                     expr.coefs)
+            self.add(rows[..., np.newaxis], expr.cols, vals)
+        return expr.const * factor
+
+    def add_objective(self, expr):
+        self.objective.append((expr.cols, expr.coefs))
+
+
+class MatrixModel(object):
+    """urbs linear program in matrix form (c.f. create_matrix_model).
+
+    Attributes (besides the input data attributes used for reporting):
+        - c: objective coefficients of the columns
+        - col_lower, col_upper: column bounds
+        - row_lower, row_upper: row bounds
+        - A: constraint matrix as tuple (start, index, value) in compressed
+          sparse column format
+    """
+
+    def write(self, filename):
+        """Write the linear program to a file in free MPS format.
+
+        Columns and rows are named x<number> and c<number>; the mapping to
+        the model entities is kept in the matrix model itself.
+        """
+        start, index, value = self.A
+        rows = ['c{}'.format(i) for i in range(len(self.row_lower))]
+        with open(filename, 'w') as f:
+            f.write('NAME {}\n'.format(self.name))
+            f.write('ROWS\n N  obj\n')
+            senses = np.where(
+                self.row_lower == self.row_upper, 'E',
+                np.where(np.isinf(self.row_lower), 'L',
+                         np.where(np.isinf(self.row_upper), 'G', 'L')))
+            for row, sense in zip(rows, senses):
+                f.write(' {}  {}\n'.format(sense, row))
+
+            f.write('COLUMNS\n')
+            for j in range(len(self.c)):
+                if self.c[j] != 0:
+                    f.write(' x{} obj {!r}\n'.format(j, self.c[j]))
+                for k in range(start[j], start[j + 1]):
+                    f.write(' x{} {} {!r}\n'.format(j, rows[index[k]],
+                                                    value[k]))
+
+            f.write('RHS\n')
+            for i, sense in enumerate(senses):
+                rhs = self.row_upper[i] if sense in 'EL' else self.row_lower[i]
+                if rhs != 0:
+                    f.write(' rhs {} {!r}\n'.format(rows[i], rhs))
+
+            f.write('RANGES\n')
+            for i, sense in enumerate(senses):
+                if (sense == 'L' and not np.isinf(self.row_lower[i])):
+                    f.write(' rng {} {!r}\n'.format(
+                        rows[i], self.row_upper[i] - self.row_lower[i]))
+
+            f.write('BOUNDS\n')
+            for j in range(len(self.c)):
+                lower, upper = self.col_lower[j], self.col_upper[j]
+                if np.isinf(lower) and np.isinf(upper):
+                    f.write(' FR bnd x{}\n'.format(j))
+                    continue
+                if np.isinf(lower):
+                    f.write(' MI bnd x{}\n'.format(j))
+                elif lower != 0:
+                    f.write(' LO bnd x{} {!r}\n'.format(j, lower))
+                if not np.isinf(upper):
+                    f.write(' UP bnd x{} {!r}\n'.format(j, upper))
+            f.write('ENDATA\n')
+
+    def solve(self, solver='highs', tee=False, logfile=None, **options):
+        """Solve the linear program and store the result cache.
+
+        Args:
+            - solver: only 'highs' (package highspy) is supported directly;
+              for other solvers, write an MPS file with method write
+            - tee: print the solver log to the console
+            - logfile: optional filename for the solver log
+            - options: further HiGHS options, e.g. time_limit=3600
+
+        Returns:
+            the model status in lower case, e.g. 'optimal'
+        """
+        if solver != 'highs':
+            raise NotImplementedError("The matrix backend solves with "
+                                      "'highs' only. Use method write to "
+                                      "create an MPS file for other solvers.")
+        import highspy
+
+        h = highspy.Highs()
+        h.setOptionValue('log_to_console', tee)
+        if logfile:
+            h.setOptionValue('log_file', logfile)
+        elif not tee:
+            h.setOptionValue('output_flag', False)
+        for key, value in options.items():
+            h.setOptionValue(key, value)
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = len(self.c)
+        lp.num_row_ = len(self.row_lower)
+        lp.col_cost_ = self.c
+        lp.col_lower_ = self.col_lower
+        lp.col_upper_ = self.col_upper
+        lp.row_lower_ = self.row_lower
+        lp.row_upper_ = self.row_upper
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = self.A[0]
+        lp.a_matrix_.index_ = self.A[1]
+        lp.a_matrix_.value_ = self.A[2]
+        h.passModel(lp)
+        h.run()
+
+        status = h.modelStatusToString(h.getModelStatus()).lower()
+        if status == 'optimal':
+            solution = h.getSolution()
+            self.objective_value = h.getInfo().objective_function_value
+            self._result = _result_cache(self,
+                                         np.asarray(solution.col_value),
+                                         np.asarray(solution.row_dual))
+        return status
+
+
+def create_matrix_model(data, dt=1, timesteps=None, objective='cost',
+                        dual=True):
+    """Create the urbs linear program in matrix form from given input data.
+
+    Takes the same arguments as create_model and creates the identical linear
+    program, but without Pyomo components and rule callbacks.
+
+    Args:
+        - data: a dict of up to 12
+        - dt: timestep duration in hours (default: 1)
+        - timesteps: optional list of timesteps, default: demand timeseries
+        - objective: Either "cost" or "CO2" for choice of objective function,
+          default: "cost"
+        - dual: set True to add dual variables to the result cache
+
+    Returns:
+        a MatrixModel object
+    """
+    if identify_mode(data)['dpf']:
+        raise NotImplementedError("The matrix backend does not support DC "
+                                  "power flow transmission.")
+    if not timesteps:
+        timesteps = sorted(set(data['demand'].index.get_level_values('t')))
+    timesteps = list(timesteps)
+    if any(b - a != 1 for a, b in zip(timesteps, timesteps[1:])):
+        raise ValueError("The matrix backend needs consecutive integer "
+                         "timesteps.")
+    if objective not in ('cost', 'CO2'):
+        raise NotImplementedError("Non-implemented objective quantity. Set "
+                                  "either 'cost' or 'CO2' as the objective in "
+                                  "runme.py!")
+
+    m = pyomo_model_prep(data, timesteps)  # preparing input dictionaries
+
+    # Parameters and sets as plain Python objects
+    m.dt = dt
+    m.weight = float(8760) / ((len(timesteps) - 1) * dt)
+    m.tm = timesteps[1:]
+    m.stf = list(dict.fromkeys(key[0] for key in m.commodity_dict['price']))
+    if m.mode['int']:
+        m.stf_table = stf_table(m)
+    m.sit = list(dict.fromkeys(key[1] for key in m.commodity_dict['price']))
+    m.com_tuples = list(m.commodity_dict['price'].keys())
+    m.pro_tuples = list(m.process_dict['inv-cost'].keys())
+    m.com_stock = commodity_subset(m.com_tuples, 'Stock')
+    m.com_supim = commodity_subset(m.com_tuples, 'SupIm')
+    m.com_demand = commodity_subset(m.com_tuples, 'Demand')
+    m.com_env = commodity_subset(m.com_tuples, 'Env')
+    m.com_by_sit = group_tuples(m.com_tuples, (0, 1))
+
+    lp = _LinearProgram(len(m.tm))
+    m.balance_terms = {}
+
+    lp.add_variable('costs', m.cost_type_list, ['cost_type'],
+                    lower=-np.inf)
+    lp.add_variable('process_costs',
+                    [p + (ct,) for p in m.pro_tuples
+                     for ct in m.cost_type_list],
+                    ['stf', 'sit', 'pro', 'cost_type'], lower=-np.inf)
+    lp.add_variable('e_co_stock', m.com_tuples,
+                    ['tm', 'stf', 'sit', 'com', 'com_type'], time='tm')
+
+    _add_process(m, lp)
+    if m.mode['tra']:
+        _add_transmission(m, lp)
+    if m.mode['sto']:
+        _add_storage(m, lp)
+    if m.mode['dsm']:
+        _add_dsm(m, lp)
+    if m.mode['bsp']:
+        _add_buy_sell_price(m, lp)
+    _add_process_output(m, lp)
+    _add_commodity(m, lp)
+    _add_costs(m, lp)
+    _add_global(m, lp, objective)
+
+    prob = _finalize(lp)
+    prob.name = 'urbs'
+    prob.created = datetime.now().strftime('%Y%m%dT%H%M')
+    prob.mode = m.mode
+    prob.obj = objective
+    prob.dt = dt
+    prob.weight = m.weight
+    prob.timesteps = timesteps
+    prob._data = data
+    prob._dual = dual
+    prob._expressions = m.capacities
+    return prob
+
+
+# helper functions
+
+def _timeseries(m, name, stf, column, default=None):
+    """Values of an input timeseries column for all modelled timesteps.
+
+    Returns default (if not None) for a missing column; missing timesteps
+    then count as zero, like the demand term in res_vertex_rule.
+    """
+    store = getattr(m, name + '_dict')
+    if default is not None:
+        if column not in store:
+            return default
+        return store.timeseries(column, stf, m.tm, missing=0)
+    return store.timeseries(column, stf, m.tm)
+
+
+def _capacity(m, units, new, inst_cap, const_cap, const_key, op_tuples,
+              inst_tuples):
+    """Total capacity expressions of units (c.f. def_process_capacity_rule).
+
+    Args:
+        - units: unit tuples (stf, ...)
+        - new: column block of the new capacity variable
+        - inst_cap, const_cap: installed capacity and constant capacity dicts
+        - const_key: function (stf, stf_min, unit without stf) returning
+          the key looked up in const_cap and the key of the constant
+          installed capacity in intertemporal mode
+        - op_tuples, inst_tuples: operational and installed tuples
+          (intertemporal mode only)
+
+    Returns:
+        dict of unit tuple to _Expr
+    """
+    caps = {}
+    if m.mode['int']:
+        stf_min = min(m.stf)
+        built = built_stfs(op_tuples)
+        inst_tuples = set(inst_tuples)
+        for unit in units:
+            stf, rest = unit[0], unit[1:]
+            expr = _Expr(0.0, [new[(stf_built,) + rest]
+                               for stf_built in built.get(rest + (stf,), ())],
+                         1.0)
+            if rest + (stf,) in inst_tuples:
+                key, inst_key = const_key(stf, stf_min, rest)
+                if key in const_cap:
+                    expr = _Expr(inst_cap[inst_key])
+                else:
+                    expr += inst_cap[(stf_min,) + rest]
+            caps[unit] = expr
+    else:
+        for unit in units:
+            if unit in const_cap:
+                caps[unit] = _Expr(inst_cap[unit])
+            else:
+                caps[unit] = _Expr(inst_cap[unit], [new[unit]], 1.0)
+    return caps
+
+
+def _capacity_bounds(m, lp, name, labels, caps, lower, upper):
+    """lower <= capacity <= upper (c.f. res_process_capacity_rule)."""
+    rows = []
+    for unit, expr in caps.items():
+        if expr.is_constant():
+            continue
+        rows.append((unit, expr, lower[unit] - expr.const,
+                     upper[unit] - expr.const))
+    block = lp.add_constraint(name, [r[0] for r in rows], labels)
+    for k, (unit, expr, lo, up) in enumerate(rows):
+        lp.add(block.offset + k, expr.cols, expr.coefs)
+        block.lower[k] = lo
+        block.upper[k] = up
+
+
+def _balance(m, lp, stf, sit, com):
+    """Commodity balance over all modelled timesteps (c.f. commodity_balance).
+
+    Returns:
+        (cols, coefs) tuple: an array of shape (terms, timesteps) of columns
+        and an array of the coefficients of the terms
+    """
+    key = (stf, sit, com)
+    if key not in m.balance_terms:
+        terms = []
+        for name, sign in (('pro_in', 1), ('pro_out', -1)):
+            block = lp.variables['e_' + name]
+            terms.extend((block.tm(p), sign)
+                         for p in m.balance_index[name].get(key, ()))
+        if m.mode['tra']:
+            for name, sign in (('tra_in', 1), ('tra_out', -1)):
+                block = lp.variables['e_' + name]
+                terms.extend((block.tm(t), sign)
+                             for t in m.balance_index[name].get(key, ()))
+        if m.mode['sto']:
+            for s in m.balance_index['sto'].get(key, ()):
+                terms.append((lp.variables['e_sto_in'].tm(s), 1))
+                terms.append((lp.variables['e_sto_out'].tm(s), -1))
+        m.balance_terms[key] = (
+            np.array([t[0] for t in terms], dtype=np.int64).reshape(
+                len(terms), lp.n_tm),
+            np.array([t[1] for t in terms], dtype=float))
+    return m.balance_terms[key]
+
+
+def _balance_expr(m, lp, stf, sit, com, factor):
+    """Sum of the commodity balance over time, each step times factor."""
+    cols, coefs = _balance(m, lp, stf, sit, com)
+    return _Expr(0.0, cols, np.multiply.outer(coefs, np.broadcast_to(
+        np.asarray(factor, dtype=float), (lp.n_tm,))))
+
+
+def _sum_tm(block, idx, factor):
+    """Sum of a timestep-indexed variable over tm, each step times factor."""
+    cols = block.tm(idx)
+    return _Expr(0.0, cols, np.broadcast_to(factor, cols.shape))
+
+
+def _not_in(tuples, other):
+    other = set(other)
+    return [t for t in tuples if t not in other]
+
+
+# process
+
+def _add_process(m, lp):
+    pro_tuples = m.pro_tuples
+    r_in_by_pro = group_tuples(m.r_in_dict.keys(), (0, 1))
+    r_out_by_pro = group_tuples(m.r_out_dict.keys(), (0, 1))
+    m.pro_input_tuples = [(stf, sit, pro, com)
+                          for (stf, sit, pro) in pro_tuples
+                          for (_, _, com) in r_in_by_pro.get((stf, pro), ())]
+    m.pro_output_tuples = [(stf, sit, pro, com)
+                           for (stf, sit, pro) in pro_tuples
+                           for (_, _, com) in r_out_by_pro.get((stf, pro),
+                                                               ())]
+    r_in_min = group_tuples(m.r_in_min_fraction_dict.keys(), (0, 1))
+    r_out_min = group_tuples(m.r_out_min_fraction_dict.keys(), (0, 1))
+    m.pro_partial_tuples = list(dict.fromkeys(
+        (stf, sit, pro) for (stf, sit, pro) in pro_tuples
+        for _ in r_in_min.get((stf, pro), ())))
+    m.pro_partial_input_tuples = [
+        (stf, sit, pro, com) for (stf, sit, pro) in m.pro_partial_tuples
+        for (_, _, com) in r_in_min.get((stf, pro), ())]
+    m.pro_partial_output_tuples = [
+        (stf, sit, pro, com) for (stf, sit, pro) in m.pro_partial_tuples
+        for (_, _, com) in r_out_min.get((stf, pro), ())]
+
+    if m.mode['int']:
+        m.operational_pro_tuples = op_pro_tuples(pro_tuples, m)
+        m.inst_pro_tuples = inst_pro_tuples(m)
+    else:
+        m.operational_pro_tuples = m.inst_pro_tuples = []
+
+    cap_pro_new = lp.add_variable('cap_pro_new', pro_tuples,
+                                  ['stf', 'sit', 'pro'])
+    tau_pro = lp.add_variable('tau_pro', pro_tuples,
+                              ['t', 'stf', 'sit', 'pro'], time='t')
+    e_pro_in = lp.add_variable('e_pro_in', m.pro_input_tuples,
+                               ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    lp.add_variable('e_pro_out', m.pro_output_tuples,
+                    ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+
+    m.cap_pro = _capacity(
+        m, pro_tuples, cap_pro_new, m.process_dict['inst-cap'],
+        m.pro_const_cap_dict,
+        # same key as def_process_capacity_rule
+        lambda stf, stf_min, rest: (rest + (stf_min,), (stf,) + rest),
+        m.operational_pro_tuples, m.inst_pro_tuples)
+    m.capacities = {'cap_pro': (['stf', 'sit', 'pro'], m.cap_pro)}
+
+    dt = m.dt
+    ones = np.ones(lp.n_tm)
+
+    # process input power == process throughput * input ratio
+    index = _not_in(m.pro_input_tuples, m.pro_partial_input_tuples)
+    block = lp.add_constraint('def_process_input', index,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in index:
+        rows = block[stf, sit, pro, com]
+        lp.add(rows, e_pro_in.tm((stf, sit, pro, com)), 1.0)
+        lp.add(rows, tau_pro.tm((stf, sit, pro)),
+               -m.r_in_dict[(stf, pro, com)])
+        block.lower[block.local((stf, sit, pro, com))] = 0.0
+        block.upper[block.local((stf, sit, pro, com))] = 0.0
+
+    # process input (for supim commodity) = process capacity * timeseries
+    index = [p for p in m.pro_input_tuples if p[3] in m.com_supim]
+    block = lp.add_constraint('def_intermittent_supply', index,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in index:
+        rows = block[stf, sit, pro, com]
+        factor = _timeseries(m, 'supim', stf, (sit, com)) * dt
+        lp.add(rows, e_pro_in.tm((stf, sit, pro, com)), 1.0)
+        const = lp.add_expr(rows, m.cap_pro[stf, sit, pro], -factor)
+        block.lower[block.local((stf, sit, pro, com))] = -const
+        block.upper[block.local((stf, sit, pro, com))] = -const
+
+    # process throughput <= process capacity
+    block = lp.add_constraint('res_process_throughput_by_capacity',
+                              pro_tuples, ['tm', 'stf', 'sit', 'pro'],
+                              time='tm')
+    for p in pro_tuples:
+        rows = block[p]
+        lp.add(rows, tau_pro.tm(p), 1.0)
+        const = lp.add_expr(rows, m.cap_pro[p], -dt * ones)
+        block.upper[block.local(p)] = -const
+
+    # maximum gradient
+    index = [p for p in pro_tuples
+             if m.process_dict['max-grad'][p] < 1.0 / dt]
+    lower = lp.add_constraint('res_process_maxgrad_lower', index,
+                              ['tm', 'stf', 'sit', 'pro'], time='tm')
+    upper = lp.add_constraint('res_process_maxgrad_upper', index,
+                              ['tm', 'stf', 'sit', 'pro'], time='tm')
+    for p in index:
+        factor = m.process_dict['max-grad'][p] * dt * ones
+        rows = lower[p]
+        lp.add(rows, tau_pro.prev(p), 1.0)
+        lp.add(rows, tau_pro.tm(p), -1.0)
+        const = lp.add_expr(rows, m.cap_pro[p], -factor)
+        lower.upper[lower.local(p)] = -const
+        rows = upper[p]
+        lp.add(rows, tau_pro.tm(p), 1.0)
+        lp.add(rows, tau_pro.prev(p), -1.0)
+        const = lp.add_expr(rows, m.cap_pro[p], -factor)
+        upper.upper[upper.local(p)] = -const
+
+    # lower bound <= process capacity <= upper bound
+    _capacity_bounds(m, lp, 'res_process_capacity', ['stf', 'sit', 'pro'],
+                     m.cap_pro, m.process_dict['cap-lo'],
+                     m.process_dict['cap-up'])
+
+    # used process area <= maximal process area
+    area_tuples = group_tuples(m.proc_area_dict.keys(), (0, 1))
+    relations = []
+    for (stf, sit) in m.site_dict['area'].keys():
+        tuples = area_tuples.get((stf, sit), ())
+        if (m.site_dict['area'][stf, sit] >= 0 and
+                sum(m.process_dict['area-per-cap'][p] for p in tuples) > 0):
+            relations.append((
+                (stf, sit),
+                _Expr.sum(m.cap_pro[p] * m.process_dict['area-per-cap'][p]
+                          for p in tuples),
+                _Expr(m.site_dict['area'][stf, sit]), '<='))
+    lp.add_relations('res_area', ['stf', 'sit'], relations)
+
+    # cap_pro * min-fraction <= tau_pro
+    block = lp.add_constraint('res_throughput_by_capacity_min',
+                              m.pro_partial_tuples,
+                              ['tm', 'stf', 'sit', 'pro'], time='tm')
+    for p in m.pro_partial_tuples:
+        rows = block[p]
+        factor = m.process_dict['min-fraction'][p] * dt * ones
+        if m.cap_pro[p].is_constant():
+            # Pyomo turns "tau_pro >= constant" into a lower bound on tau_pro
+            lp.add(rows, tau_pro.tm(p), 1.0)
+            block.lower[block.local(p)] = m.cap_pro[p].const * factor
+        else:
+            lp.add(rows, tau_pro.tm(p), -1.0)
+            const = lp.add_expr(rows, m.cap_pro[p], factor)
+            block.upper[block.local(p)] = -const
+
+    # partial input
+    block = lp.add_constraint('def_partial_process_input',
+                              m.pro_partial_input_tuples,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in m.pro_partial_input_tuples:
+        _add_partial(m, lp, block, e_pro_in, (stf, sit, pro, com),
+                     m.r_in_dict[(stf, pro, com)],
+                     m.r_in_min_fraction_dict[stf, pro, com], ones)
+
+
+def _add_partial(m, lp, block, flow, idx, R, r, eff_factor):
+    """flow == (dt * cap_pro * online_factor + tau_pro * throughput_factor)
+    * eff_factor (c.f. def_partial_process_input_rule)"""
+    stf, sit, pro, com = idx
+    min_fraction = m.process_dict['min-fraction'][(stf, sit, pro)]
+    online_factor = min_fraction * (r - R) / (1 - min_fraction)
+    throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
+
+    rows = block[idx]
+    lp.add(rows, flow.tm(idx), 1.0)
+    lp.add(rows, lp.variables['tau_pro'].tm((stf, sit, pro)),
+           -throughput_factor * eff_factor)
+    const = lp.add_expr(rows, m.cap_pro[stf, sit, pro],
+                        -m.dt * online_factor * eff_factor)
+    block.lower[block.local(idx)] = -const
+    block.upper[block.local(idx)] = -const
+
+
+def _add_process_output(m, lp):
+    tau_pro = lp.variables['tau_pro']
+    e_pro_out = lp.variables['e_pro_out']
+    ones = np.ones(lp.n_tm)
+
+    if m.mode['tve']:
+        tve_stflist = set(key[0] for key in
+                          m.eff_factor_dict[tuple(m.eff_factor_dict)[0]])
+        r_out_by_pro = group_tuples(m.r_out_dict.keys(), (0, 1))
+        timevar = [(stf, site, process, commodity)
+                   for stf in tve_stflist
+                   for (site, process) in tuple(m.eff_factor_dict.keys())
+                   for (_, _, commodity) in r_out_by_pro.get((stf, process),
+                                                             ())
+                   if commodity not in m.com_env]
+    else:
+        timevar = []
+    partial_timevar = set(m.pro_partial_output_tuples) & set(timevar)
+
+    # process output power = process throughput * output ratio
+    index = _not_in(_not_in(m.pro_output_tuples,
+                            m.pro_partial_output_tuples), timevar)
+    block = lp.add_constraint('def_process_output', index,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in index:
+        rows = block[stf, sit, pro, com]
+        lp.add(rows, e_pro_out.tm((stf, sit, pro, com)), 1.0)
+        lp.add(rows, tau_pro.tm((stf, sit, pro)),
+               -m.r_out_dict[(stf, pro, com)])
+        block.lower[block.local((stf, sit, pro, com))] = 0.0
+        block.upper[block.local((stf, sit, pro, com))] = 0.0
+
+    # partial output
+    index = _not_in(m.pro_partial_output_tuples, partial_timevar)
+    block = lp.add_constraint('def_partial_process_output', index,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in index:
+        _add_partial(m, lp, block, e_pro_out, (stf, sit, pro, com),
+                     m.r_out_dict[stf, pro, com],
+                     m.r_out_min_fraction_dict[stf, pro, com], ones)
+
+    if not m.mode['tve']:
+        return
+
+    # time variable efficiency
+    index = _not_in(timevar, partial_timevar)
+    block = lp.add_constraint('def_process_timevar_output', index,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in index:
+        rows = block[stf, sit, pro, com]
+        eff_factor = _timeseries(m, 'eff_factor', stf, (sit, pro))
+        lp.add(rows, e_pro_out.tm((stf, sit, pro, com)), 1.0)
+        lp.add(rows, tau_pro.tm((stf, sit, pro)),
+               -m.r_out_dict[(stf, pro, com)] * eff_factor)
+        block.lower[block.local((stf, sit, pro, com))] = 0.0
+        block.upper[block.local((stf, sit, pro, com))] = 0.0
+
+    index = [p for p in m.pro_partial_output_tuples if p in partial_timevar]
+    block = lp.add_constraint('def_process_partial_timevar_output', index,
+                              ['tm', 'stf', 'sit', 'pro', 'com'], time='tm')
+    for (stf, sit, pro, com) in index:
+        _add_partial(m, lp, block, e_pro_out, (stf, sit, pro, com),
+                     m.r_out_dict[stf, pro, com],
+                     m.r_out_min_fraction_dict[stf, pro, com],
+                     _timeseries(m, 'eff_factor', stf, (sit, pro)))
+
+
+# transmission
+
+def _add_transmission(m, lp):
+    m.tra_tuples = list(m.transmission_dict['eff'].keys())
+    if m.mode['int']:
+        m.operational_tra_tuples = op_tra_tuples(m.tra_tuples, m)
+        m.inst_tra_tuples = inst_tra_tuples(m)
+    else:
+        m.operational_tra_tuples = m.inst_tra_tuples = []
+    labels = ['stf', 'sit', 'sit_', 'tra', 'com']
+
+    cap_tra_new = lp.add_variable('cap_tra_new', m.tra_tuples, labels)
+    lp.add_variable('transmission_costs',
+                    [t + (ct,) for t in m.tra_tuples
+                     for ct in m.cost_type_list],
+                    labels + ['cost_type'], lower=-np.inf)
+    e_tra_in = lp.add_variable('e_tra_in', m.tra_tuples, ['tm'] + labels,
+                               time='tm')
+    e_tra_out = lp.add_variable('e_tra_out', m.tra_tuples, ['tm'] + labels,
+                                time='tm')
+
+    m.cap_tra = _capacity(
+        m, m.tra_tuples, cap_tra_new, m.transmission_dict['inst-cap'],
+        m.tra_const_cap_dict,
+        lambda stf, stf_min, rest: ((stf_min,) + rest,) * 2,
+        m.operational_tra_tuples, m.inst_tra_tuples)
+    m.capacities['cap_tra'] = (labels, m.cap_tra)
+
+    # transmission output == transmission input * efficiency
+    block = lp.add_constraint('def_transmission_output', m.tra_tuples,
+                              ['tm'] + labels, time='tm')
+    for t in m.tra_tuples:
+        rows = block[t]
+        lp.add(rows, e_tra_out.tm(t), 1.0)
+        lp.add(rows, e_tra_in.tm(t), -m.transmission_dict['eff'][t])
+        block.lower[block.local(t)] = 0.0
+        block.upper[block.local(t)] = 0.0
+
+    # transmission input <= transmission capacity
+    block = lp.add_constraint('res_transmission_input_by_capacity',
+                              m.tra_tuples, ['tm'] + labels, time='tm')
+    for t in m.tra_tuples:
+        rows = block[t]
+        lp.add(rows, e_tra_in.tm(t), 1.0)
+        const = lp.add_expr(rows, m.cap_tra[t], -m.dt * np.ones(lp.n_tm))
+        block.upper[block.local(t)] = -const
+
+    # lower bound <= transmission capacity <= upper bound
+    _capacity_bounds(m, lp, 'res_transmission_capacity', labels, m.cap_tra,
+                     m.transmission_dict['cap-lo'],
+                     m.transmission_dict['cap-up'])
+
+    # transmission capacity from A to B == transmission capacity from B to A
+    lp.add_relations('res_transmission_symmetry', labels, [
+        ((stf, sin, sout, tra, com), m.cap_tra[stf, sin, sout, tra, com],
+         m.cap_tra[stf, sout, sin, tra, com], '==')
+        for (stf, sin, sout, tra, com) in m.tra_tuples])
+
+
+# storage
+
+def _add_storage(m, lp):
+    m.sto_tuples = list(m.storage_dict['eff-in'].keys())
+    if m.mode['int']:
+        m.operational_sto_tuples = op_sto_tuples(m.sto_tuples, m)
+        m.inst_sto_tuples = inst_sto_tuples(m)
+    else:
+        m.operational_sto_tuples = m.inst_sto_tuples = []
+    labels = ['stf', 'sit', 'sto', 'com']
+
+    cap_sto_c_new = lp.add_variable('cap_sto_c_new', m.sto_tuples, labels)
+    cap_sto_p_new = lp.add_variable('cap_sto_p_new', m.sto_tuples, labels)
+    e_sto_in = lp.add_variable('e_sto_in', m.sto_tuples, ['tm'] + labels,
+                               time='tm')
+    e_sto_out = lp.add_variable('e_sto_out', m.sto_tuples, ['tm'] + labels,
+                                time='tm')
+    e_sto_con = lp.add_variable('e_sto_con', m.sto_tuples, ['t'] + labels,
+                                time='t')
+    lp.add_variable('storage_costs',
+                    [s + (ct,) for s in m.sto_tuples
+                     for ct in m.cost_type_list],
+                    labels + ['cost_type'], lower=-np.inf)
+
+    const_key = (lambda stf, stf_min, rest: ((stf_min,) + rest,) * 2)
+    m.cap_sto_c = _capacity(
+        m, m.sto_tuples, cap_sto_c_new, m.storage_dict['inst-cap-c'],
+        m.sto_const_cap_c_dict, const_key,
+        m.operational_sto_tuples, m.inst_sto_tuples)
+    m.cap_sto_p = _capacity(
+        m, m.sto_tuples, cap_sto_p_new, m.storage_dict['inst-cap-p'],
+        m.sto_const_cap_p_dict, const_key,
+        m.operational_sto_tuples, m.inst_sto_tuples)
+    m.capacities['cap_sto_c'] = (labels, m.cap_sto_c)
+    m.capacities['cap_sto_p'] = (labels, m.cap_sto_p)
+
+    dt = m.dt
+    ones = np.ones(lp.n_tm)
+
+    # storage content in timestep [t] == storage content[t-1] * (1-discharge)
+    # + newly stored energy * input efficiency
+    # - retrieved energy / output efficiency
+    block = lp.add_constraint('def_storage_state', m.sto_tuples,
+                              ['tm'] + labels, time='tm')
+    for s in m.sto_tuples:
+        rows = block[s]
+        lp.add(rows, e_sto_con.tm(s), 1.0)
+        lp.add(rows, e_sto_con.prev(s),
+               -(1 - m.storage_dict['discharge'][s]) ** dt)
+        lp.add(rows, e_sto_in.tm(s), -m.storage_dict['eff-in'][s])
+        lp.add(rows, e_sto_out.tm(s), 1 / m.storage_dict['eff-out'][s])
+        block.lower[block.local(s)] = 0.0
+        block.upper[block.local(s)] = 0.0
+
+    # storage input/output <= storage power
+    for name, flow in (('res_storage_input_by_power', e_sto_in),
+                       ('res_storage_output_by_power', e_sto_out)):
+        block = lp.add_constraint(name, m.sto_tuples, ['tm'] + labels,
+                                  time='tm')
+        for s in m.sto_tuples:
+            rows = block[s]
+            lp.add(rows, flow.tm(s), 1.0)
+            const = lp.add_expr(rows, m.cap_sto_p[s], -dt * ones)
+            block.upper[block.local(s)] = -const
+
+    # storage content <= storage capacity
+    block = lp.add_constraint('res_storage_state_by_capacity', m.sto_tuples,
+                              ['t'] + labels, time='t')
+    for s in m.sto_tuples:
+        rows = block[s]
+        lp.add(rows, e_sto_con[s], 1.0)
+        const = lp.add_expr(rows, m.cap_sto_c[s], -np.ones(len(rows)))
+        block.upper[block.local(s)] = -const
+
+    # lower bound <= storage power/capacity <= upper bound
+    _capacity_bounds(m, lp, 'res_storage_power', labels, m.cap_sto_p,
+                     m.storage_dict['cap-lo-p'], m.storage_dict['cap-up-p'])
+    _capacity_bounds(m, lp, 'res_storage_capacity', labels, m.cap_sto_c,
+                     m.storage_dict['cap-lo-c'], m.storage_dict['cap-up-c'])
+
+    # content[t=1] == storage capacity * fraction <= content[t=final]
+    first = e_sto_con.offset
+    last = e_sto_con.width - 1
+    lp.add_relations('def_initial_storage_state', labels, [
+        (s, _Expr(0.0, [e_sto_con[s][0]], 1.0),
+         m.cap_sto_c[s] * m.storage_dict['init'][s], '==')
+        for s in m.stor_init_bound_dict.keys()])
+    lp.add_relations('res_storage_state_cyclicity', labels, [
+        (s, _Expr(0.0, [e_sto_con[s][0]], 1.0),
+         _Expr(0.0, [e_sto_con[s][last]], 1.0), '<=')
+        for s in m.sto_tuples])
+
+    # storage capacity = storage power * storage E2P ratio
+    lp.add_relations('def_storage_energy_power_ratio', labels, [
+        (s, m.cap_sto_c[s], m.cap_sto_p[s] * m.storage_dict['ep-ratio'][s],
+         '==')
+        for s in m.sto_ep_ratio_dict.keys()])
+
+
+# demand side management
+
+def _add_dsm(m, lp):
+    """DSM variables and constraints (c.f. add_dsm).
+
+    The downshift variables dsm_down[t, tt] of each (stf, sit, com) lie in a
+    band around the diagonal t == tt; their columns are addressed by the
+    timestep position k of t and the offset o = tt - t.
+    """
+    n_tm = lp.n_tm
+    dt = m.dt
+    steps = np.arange(n_tm)
+    m.dsm_site_tuples = list(m.dsm_dict['delay'].keys())
+    labels = ['stf', 'sit', 'com']
+    dsm_up = lp.add_variable('dsm_up', m.dsm_site_tuples, ['tm'] + labels,
+                             time='tm')
+
+    # downshift tuples, c.f. dsm_down_time_tuples
+    down_index = []
+    m.dsm_down_cols = {}
+    for (stf, sit, com) in m.dsm_site_tuples:
+        delay = max(int(m.dsm_dict['delay'][stf, sit, com] / dt), 1)
+        first = np.maximum(steps - delay, 0)
+        count = np.minimum(steps + delay, n_tm - 1) - first + 1
+        start = len(down_index) + np.concatenate(([0], np.cumsum(count)[:-1]))
+        m.dsm_down_cols[stf, sit, com] = (start, first, count)
+        for k in range(n_tm):
+            down_index.extend((m.tm[k], m.tm[kk], stf, sit, com)
+                              for kk in range(first[k], first[k] + count[k]))
+    dsm_down = lp.add_variable('dsm_down', down_index,
+                               ['tm', 'tm_'] + labels)
+    m.dsm_down_offset = dsm_down.offset
+
+    def _delay(stf, sit, com, key='delay'):
+        return max(int(m.dsm_dict[key][(stf, sit, com)] / dt), 1)
+
+    def_variables = lp.add_constraint('def_dsm_variables', m.dsm_site_tuples,
+                                      ['tm'] + labels, time='tm')
+    upward = lp.add_constraint('res_dsm_upward', m.dsm_site_tuples,
+                               ['tm'] + labels, time='tm')
+    downward = lp.add_constraint('res_dsm_downward', m.dsm_site_tuples,
+                                 ['tm'] + labels, time='tm')
+    maximum = lp.add_constraint('res_dsm_maximum', m.dsm_site_tuples,
+                                ['tm'] + labels, time='tm')
+    recovery = lp.add_constraint('res_dsm_recovery', m.dsm_site_tuples,
+                                 ['tm'] + labels, time='tm')
+    for d in m.dsm_site_tuples:
+        delay = _delay(*d)
+        cap_up = m.dsm_dict['cap-max-up'][d]
+        cap_do = m.dsm_dict['cap-max-do'][d]
+
+        # DSMup * efficiency factor n == DSMdo (summed)
+        rows = def_variables[d]
+        for k, kk in _dsm_window(n_tm, delay):
+            lp.add(rows[k], _dsm_down_col(m, d, k, kk), 1.0)
+        lp.add(rows, dsm_up.tm(d), -m.dsm_dict['eff'][d])
+        def_variables.lower[def_variables.local(d)] = 0.0
+        def_variables.upper[def_variables.local(d)] = 0.0
+
+        # DSMup <= Cup
+        lp.add(upward[d], dsm_up.tm(d), 1.0)
+        upward.upper[upward.local(d)] = dt * cap_up
+
+        # DSMdo (summed) <= Cdo; DSMup + DSMdo (summed) <= max(Cup, Cdo)
+        rows = downward[d]
+        for k, kk in _dsm_window(n_tm, delay):
+            lp.add(rows[kk], _dsm_down_col(m, d, k, kk), 1.0)
+        downward.upper[downward.local(d)] = dt * cap_do
+        rows = maximum[d]
+        for k, kk in _dsm_window(n_tm, delay):
+            lp.add(rows[kk], _dsm_down_col(m, d, k, kk), 1.0)
+        lp.add(rows, dsm_up.tm(d), 1.0)
+        maximum.upper[maximum.local(d)] = dt * max(cap_up, cap_do)
+
+        # DSMup(t, t + recovery time R) <= Cup * delay time L
+        rows = recovery[d]
+        cols = dsm_up.tm(d)
+        for o in range(_delay(*d, key='recov')):
+            lp.add(rows[:n_tm - o], cols[o:], 1.0)
+        recovery.upper[recovery.local(d)] = (cap_up *
+                                             m.dsm_dict['delay'][d])
+
+
+def _dsm_window(n_tm, delay):
+    """Pairs of timestep positions (k, kk) with |k - kk| <= delay.
+
+    Yields one array pair per offset kk - k, c.f. dsm_time_tuples.
+    """
+    steps = np.arange(n_tm)
+    for o in range(-delay, delay + 1):
+        k = steps[(steps + o >= 0) & (steps + o < n_tm)]
+        yield k, k + o
+
+
+def _dsm_down_col(m, d, k, kk):
+    """Columns of dsm_down[tm[k], tm[kk], d] for position arrays k, kk."""
+    start, first, count = m.dsm_down_cols[d]
+    return m.dsm_down_offset + start[k] + kk - first[k]
+
+
+def _dsm_surplus(m, lp, rows, d):
+    """Add the DSM surplus of d to the rows (c.f. dsm_surplus)."""
+    lp.add(rows, lp.variables['dsm_up'].tm(d), -1.0)
+    delay = max(int(m.dsm_dict['delay'][d] / m.dt), 1)
+    for k, kk in _dsm_window(lp.n_tm, delay):
+        lp.add(rows[kk], _dsm_down_col(m, d, k, kk), 1.0)
+
+
+# buy and sell
+
+def _add_buy_sell_price(m, lp):
+    m.com_sell = commodity_subset(m.com_tuples, 'Sell')
+    m.com_buy = commodity_subset(m.com_tuples, 'Buy')
+    labels = ['stf', 'sit', 'com', 'com_type']
+    lp.add_variable('e_co_sell', m.com_tuples, ['tm'] + labels, time='tm')
+    lp.add_variable('e_co_buy', m.com_tuples, ['tm'] + labels, time='tm')
+
+    for kind, coms in (('sell', m.com_sell), ('buy', m.com_buy)):
+        flow = lp.variables['e_co_' + kind]
+        index = [c for c in m.com_tuples if c[2] in coms]
+        block = lp.add_constraint('res_{}_step'.format(kind), index,
+                                  ['tm'] + labels, time='tm')
+        for c in index:
+            lp.add(block[c], flow.tm(c), 1.0)
+            block.upper[block.local(c)] = (m.dt *
+                                           m.commodity_dict['maxperhour'][c])
+        lp.add_relations('res_{}_total'.format(kind), labels, [
+            (c, _sum_tm(flow, c, 1.0) * m.weight,
+             _Expr(m.commodity_dict['max'][c]), '<=')
+            for c in index])
+
+    # power connection capacity: Sell == Buy
+    relations = []
+    for (stf, sit, pro, com) in m.pro_input_tuples:
+        if com in m.com_buy:
+            sell_pro = search_sell_buy_tuple(m, stf, sit, pro, com)
+            if sell_pro is not None:
+                relations.append(((stf, sit, pro, com),
+                                  m.cap_pro[stf, sit, pro],
+                                  m.cap_pro[stf, sit, sell_pro], '=='))
+    lp.add_relations('res_sell_buy_symmetry', ['stf', 'sit', 'pro', 'com'],
+                     relations)
+
+
+def _bsp_costs(m, lp, kind):
+    """Purchase (kind 'buy') or negative revenue (kind 'sell') costs."""
+    flow = lp.variables['e_co_' + kind]
+    coms = m.com_buy if kind == 'buy' else m.com_sell
+    sign = 1 if kind == 'buy' else -1
+    return _Expr.sum(
+        _sum_tm(flow, c, sign *
+                _timeseries(m, 'buy_sell_price', c[0], (c[2],)) *
+                m.weight * m.commodity_dict['price'][c] *
+                m.commodity_dict['cost_factor'][c])
+        for c in m.com_tuples if c[2] in coms)
+
+
+# commodity
+
+def _add_commodity(m, lp):
+    labels = ['stf', 'sit', 'com', 'com_type']
+    e_co_stock = lp.variables['e_co_stock']
+    dsm_sites = set(m.dsm_site_tuples) if m.mode['dsm'] else set()
+
+    # vertex equation
+    index = [c for c in m.com_tuples
+             if c[2] not in m.com_env and c[2] not in m.com_supim]
+    block = lp.add_constraint('res_vertex', index, ['tm'] + labels,
+                              time='tm')
+    for (stf, sit, com, com_type) in index:
+        c = (stf, sit, com, com_type)
+        rows = block[c]
+        cols, coefs = _balance(m, lp, stf, sit, com)
+        lp.add(rows, cols, -coefs[:, np.newaxis])
+        if com in m.com_stock:
+            lp.add(rows, e_co_stock.tm(c), 1.0)
+        if m.mode['bsp']:
+            if com in m.com_sell:
+                lp.add(rows, lp.variables['e_co_sell'].tm(c), -1.0)
+            if com in m.com_buy:
+                lp.add(rows, lp.variables['e_co_buy'].tm(c), 1.0)
+        demand = 0.0
+        if com in m.com_demand:
+            demand = _timeseries(m, 'demand', stf, (sit, com),
+                                 default=0.0)
+        if (stf, sit, com) in dsm_sites:
+            _dsm_surplus(m, lp, rows, (stf, sit, com))
+        block.lower[block.local(c)] = demand
+        block.upper[block.local(c)] = demand
+
+    # stock commodity use per time step and in total
+    index = [c for c in m.com_tuples if c[2] in m.com_stock]
+    block = lp.add_constraint('res_stock_step', index, ['tm'] + labels,
+                              time='tm')
+    for c in index:
+        lp.add(block[c], e_co_stock.tm(c), 1.0)
+        block.upper[block.local(c)] = (m.dt *
+                                       m.commodity_dict['maxperhour'][c])
+    lp.add_relations('res_stock_total', labels, [
+        (c, _sum_tm(e_co_stock, c, 1.0) * m.weight,
+         _Expr(m.commodity_dict['max'][c]), '<=')
+        for c in index])
+
+    # environmental commodity output per time step and in total
+    index = [c for c in m.com_tuples if c[2] in m.com_env]
+    block = lp.add_constraint('res_env_step', index, ['tm'] + labels,
+                              time='tm')
+    for c in index:
+        cols, coefs = _balance(m, lp, *c[:3])
+        lp.add(block[c], cols, -coefs[:, np.newaxis])
+        block.upper[block.local(c)] = (m.dt *
+                                       m.commodity_dict['maxperhour'][c])
+    lp.add_relations('res_env_total', labels, [
+        (c, _balance_expr(m, lp, c[0], c[1], c[2], -m.weight),
+         _Expr(m.commodity_dict['max'][c]), '<=')
+        for c in index])
+
+
+# costs
+
+def _add_costs(m, lp):
+    costs = lp.variables['costs']
+    w = m.weight
+    tau_pro = lp.variables['tau_pro']
+    cap_pro_new = lp.variables['cap_pro_new']
+    e_co_stock = lp.variables['e_co_stock']
+    pd_ = m.process_dict
+    cd = m.commodity_dict
+
+    def cost_of(p, cost_type):
+        """process cost expression, c.f. def_specific_process_costs_rule"""
+        if cost_type == 'Invest':
+            cost = _Expr(0.0, [cap_pro_new[p]],
+                         pd_['inv-cost'][p] * pd_['invcost-factor'][p])
+            if m.mode['int']:
+                cost -= _Expr(0.0, [cap_pro_new[p]],
+                              pd_['inv-cost'][p] * pd_['overpay-factor'][p])
+            return cost
+        elif cost_type == 'Fixed':
+            return m.cap_pro[p] * (pd_['fix-cost'][p] * pd_['cost_factor'][p])
+        elif cost_type == 'Variable':
+            return _sum_tm(tau_pro, p, w * pd_['var-cost'][p] *
+                           pd_['cost_factor'][p])
+        elif cost_type in ('Fuel', 'Environmental'):
+            flow, co_type, tuples = (
+                ('e_pro_in', 'Stock', pro_inputs) if cost_type == 'Fuel'
+                else ('e_pro_out', 'Env', pro_outputs))
+            stf, sit, pro = p
+            return _Expr.sum(
+                _sum_tm(lp.variables[flow], (stf, sit, pro, co),
+                        w * cd['price'][c] * cd['cost_factor'][c])
+                for c in m.com_by_sit.get((stf, sit), ())
+                for co in (c[2],)
+                if (stf, sit, pro, co) in tuples and c[3] == co_type)
+        elif cost_type == 'Revenue':
+            return revenue
+        elif cost_type == 'Purchase':
+            return purchase
+        else:
+            raise NotImplementedError("Unknown cost type.")
+
+    pro_inputs = set(m.pro_input_tuples)
+    pro_outputs = set(m.pro_output_tuples)
+    if m.mode['bsp']:
+        revenue = _bsp_costs(m, lp, 'sell')
+        purchase = _bsp_costs(m, lp, 'buy')
+
+    # main cost function by cost type
+    relations = []
+    for cost_type in m.cost_type_list:
+        if cost_type in ('Invest', 'Fixed', 'Variable'):
+            cost = _Expr.sum(cost_of(p, cost_type) for p in m.pro_tuples)
+            if cost_type == 'Invest' and not m.pro_tuples:
+                cost = _Expr()
+            if m.mode['tra']:
+                cost += _Expr.sum(_transmission_cost(m, lp, t, cost_type)
+                                  for t in m.tra_tuples)
+            if m.mode['sto']:
+                cost += _Expr.sum(_storage_cost(m, lp, s, cost_type)
+                                  for s in m.sto_tuples)
+        elif cost_type == 'Fuel':
+            cost = _Expr.sum(
+                _sum_tm(e_co_stock, c,
+                        w * cd['price'][c] * cd['cost_factor'][c])
+                for c in m.com_tuples if c[2] in m.com_stock)
+        elif cost_type == 'Environmental':
+            cost = _Expr.sum(
+                _balance_expr(m, lp, c[0], c[1], c[2],
+                              -w * cd['price'][c] * cd['cost_factor'][c])
+                for c in m.com_tuples if c[2] in m.com_env)
+        else:
+            cost = cost_of(None, cost_type)
+        relations.append((cost_type, _Expr(0.0, [costs[cost_type]], 1.0),
+                          cost, '=='))
+    lp.add_relations('def_costs', ['cost_type'], relations)
+
+    # cost break down per process, transmission and storage
+    process_costs = lp.variables['process_costs']
+    lp.add_relations('def_specific_process_costs',
+                     ['stf', 'sit', 'pro', 'cost_type'], [
+        (p + (ct,), _Expr(0.0, [process_costs[p + (ct,)]], 1.0),
+         cost_of(p, ct), '==')
+        for p in m.pro_tuples for ct in m.cost_type_list])
+    if m.mode['tra']:
+        var = lp.variables['transmission_costs']
+        lp.add_relations('def_specific_transmission_cost',
+                         var.labels, [
+            (t + (ct,), _Expr(0.0, [var[t + (ct,)]], 1.0),
+             _transmission_cost(m, lp, t, ct), '==')
+            for t in m.tra_tuples for ct in m.cost_type_list])
+    if m.mode['sto']:
+        var = lp.variables['storage_costs']
+        lp.add_relations('def_specific_storage_cost', var.labels, [
+            (s + (ct,), _Expr(0.0, [var[s + (ct,)]], 1.0),
+             _storage_cost(m, lp, s, ct), '==')
+            for s in m.sto_tuples for ct in m.cost_type_list])
+
+
+def _transmission_cost(m, lp, t, cost_type):
+    """c.f. specific_transmission_cost"""
+    td = m.transmission_dict
+    if cost_type == 'Invest':
+        col = lp.variables['cap_tra_new'][t]
+        cost = _Expr(0.0, [col], td['inv-cost'][t] * td['invcost-factor'][t])
+        if m.mode['int']:
+            cost -= _Expr(0.0, [col],
+                          td['inv-cost'][t] * td['overpay-factor'][t])
+        return cost
+    elif cost_type == 'Fixed':
+        return m.cap_tra[t] * (td['fix-cost'][t] * td['cost_factor'][t])
+    elif cost_type == 'Variable':
+        return _sum_tm(lp.variables['e_tra_in'], t,
+                       m.weight * td['var-cost'][t] * td['cost_factor'][t])
+    return _Expr()
+
+
+def _storage_cost(m, lp, s, cost_type):
+    """c.f. specific_storage_cost"""
+    sd = m.storage_dict
+    if cost_type == 'Invest':
+        cost = _Expr(0.0, [lp.variables['cap_sto_p_new'][s],
+                           lp.variables['cap_sto_c_new'][s]],
+                     [sd['inv-cost-p'][s] * sd['invcost-factor'][s],
+                      sd['inv-cost-c'][s] * sd['invcost-factor'][s]])
+        if m.mode['int']:
+            cost -= _Expr(0.0, [lp.variables['cap_sto_p_new'][s],
+                                lp.variables['cap_sto_c_new'][s]],
+                          [sd['inv-cost-p'][s] * sd['overpay-factor'][s],
+                           sd['inv-cost-c'][s] * sd['overpay-factor'][s]])
+        return cost
+    elif cost_type == 'Fixed':
+        return (m.cap_sto_p[s] * sd['fix-cost-p'][s] +
+                m.cap_sto_c[s] * sd['fix-cost-c'][s]) * sd['cost_factor'][s]
+    elif cost_type == 'Variable':
+        factor = m.weight * sd['cost_factor'][s]
+        return (_sum_tm(lp.variables['e_sto_con'], s,
+                        factor * sd['var-cost-c'][s]) +
+                _sum_tm(lp.variables['e_sto_in'], s,
+                        factor * sd['var-cost-p'][s]) +
+                _sum_tm(lp.variables['e_sto_out'], s,
+                        factor * sd['var-cost-p'][s]))
+    return _Expr()
+
+
+# objective and global constraints
+
+def _add_global(m, lp, objective):
+    costs = lp.variables['costs']
+    total_costs = _Expr(0.0, [costs[ct] for ct in m.cost_type_list], 1.0)
+    value = m.global_prop_dict['value']
+
+    def co2_output(stf, factor):
+        return _Expr.sum(_balance_expr(m, lp, stf, sit, 'CO2', -factor)
+                         for sit in m.sit)
+
+    def co2_limit():
+        lp.add_relations('res_global_co2_limit', ['stf'], [
+            (stf, co2_output(stf, m.weight), _Expr(value[stf, 'CO2 limit']),
+             '<=')
+            for stf in m.stf
+            if not math.isinf(value[stf, 'CO2 limit']) and
+            value[stf, 'CO2 limit'] >= 0])
+
+    def cost_limit():
+        lp.add_relations('res_global_cost_limit', ['stf'], [
+            (stf, total_costs, _Expr(value[stf, 'Cost limit']), '<=')
+            for stf in m.stf
+            if not math.isinf(value[stf, 'Cost limit']) and
+            value[stf, 'Cost limit'] >= 0])
+
+    def budget(name, key, expr):
+        limit = value[min(m.stf), key]
+        lp.add_relations(name, ['None'], [
+            (None, expr(), _Expr(limit), '<=')
+            for _ in [None] if not math.isinf(limit) and limit >= 0])
+
+    if objective == 'cost':
+        co2_limit()
+        if m.mode['int']:
+            budget('res_global_co2_budget', 'CO2 budget', lambda: _Expr.sum(
+                co2_output(stf, m.weight * stf_dist(stf, m))
+                for stf in m.stf))
+            cost_limit()
+        lp.add_objective(total_costs)
+    else:
+        cost_limit()
+        if m.mode['int']:
+            budget('res_global_cost_budget', 'Cost budget',
+                   lambda: total_costs)
+            co2_limit()
+        lp.add_objective(_Expr.sum(
+            co2_output(stf, m.weight * (stf_dist(stf, m)
+                                        if m.mode['int'] else 1))
+            for stf in m.stf))
+
+
+# matrix assembly and results
+
+def _finalize(lp):
+    """Merge the coefficients into a compressed sparse column matrix.
+
+    Duplicate entries are summed up, zero entries and rows without finite
+    bounds are dropped.
+    """
+    prob = MatrixModel()
+    n_col = lp.n_col
+    rows, cols, vals = (np.concatenate([e[i] for e in lp.entries])
+                        if lp.entries else np.zeros(0)
+                        for i in range(3))
+    row_lower = (np.concatenate(lp.row_lower) if lp.row_lower
+                 else np.zeros(0))
+    row_upper = (np.concatenate(lp.row_upper) if lp.row_upper
+                 else np.zeros(0))
+
+    # drop free rows
+    kept = ~(np.isneginf(row_lower) & np.isposinf(row_upper))
+    row_map = np.full(len(row_lower), -1, dtype=np.int64)
+    row_map[kept] = np.arange(kept.sum())
+    rows = row_map[rows.astype(np.int64)]
+    n_row = int(kept.sum())
+
+    # sum up duplicates in column major order
+    key = cols.astype(np.int64) * max(n_row, 1) + rows
+    valid = (rows >= 0) & (vals != 0)
+    key, vals = key[valid], vals[valid]
+    order = np.argsort(key, kind='stable')
+    key, vals = key[order], vals[order]
+    key, first = np.unique(key, return_index=True)
+    vals = np.add.reduceat(vals, first) if len(vals) else vals
+    nonzero = vals != 0
+    key, vals = key[nonzero], vals[nonzero]
+    cols, rows = np.divmod(key, max(n_row, 1))
+    start = np.searchsorted(cols, np.arange(n_col + 1))
+
+    prob.A = (start.astype(np.int32), rows.astype(np.int32), vals)
+    prob.c = np.zeros(n_col)
+    for obj_cols, obj_coefs in lp.objective:
+        np.add.at(prob.c, obj_cols, obj_coefs)
+    prob.col_lower = np.concatenate(lp.col_lower)
+    prob.col_upper = np.full(n_col, np.inf)
+    prob.row_lower = row_lower[kept]
+    prob.row_upper = row_upper[kept]
+    prob._row_map = row_map
+    prob._variables = lp.variables
+    prob._constraints = lp.constraints
+    return prob
+
+
+def _series(name, index, labels, values, times=None):
+    """Series of values per index tuple (and time), like get_entity."""
+    if times is not None:
+        # time-major order of the values, like Pyomo's index order
+        values = np.asarray(values).reshape(len(index), len(times)).T.ravel()
+        arrays = [np.repeat(np.asarray(times), len(index))]
+        tuples = [idx if isinstance(idx, tuple) else (idx,) for idx in index]
+        for level in zip(*tuples) if tuples else [[]] * (len(labels) - 1):
+            arrays.append(np.tile(np.array(level, dtype=object), len(times)))
+    else:
+        tuples = [idx if isinstance(idx, tuple) else (idx,) for idx in index]
+        arrays = [np.array(level, dtype=object)
+                  for level in (zip(*tuples) if tuples
+                                else [[]] * len(labels))]
+    if not len(values):
+        return pd.Series(name=name)
+    if len(labels) == 1:
+        idx = pd.Index(arrays[0], name=labels[0])
+    else:
+        idx = pd.MultiIndex.from_arrays(arrays, names=labels)
+    return pd.Series(np.asarray(values, dtype=float), index=idx, name=name)
+
+
+def _result_cache(prob, x, row_dual):
+    """Result cache of variables, capacity expressions and duals."""
+    times = {None: None, 'tm': prob.timesteps[1:], 't': prob.timesteps}
+    result = {}
+    for name, block in prob._variables.items():
+        result[name] = _series(name, block.index, block.labels,
+                               x[block.offset:block.offset + len(block)],
+                               times[block.time])
+    for name, (labels, caps) in prob._expressions.items():
+        result[name] = _series(name, list(caps.keys()), labels, [
+            expr.const + np.dot(expr.coefs, x[expr.cols])
+            for expr in caps.values()])
+    if prob._dual:
+        dual = np.where(prob._row_map >= 0,
+                        row_dual[np.maximum(prob._row_map, 0)], 0.0)
+        for name, block in prob._constraints.items():
+            result[name] = _series(name, block.index, block.labels,
+                                   dual[block.offset:block.offset +
+                                        len(block)],
+                                   times[block.time])
+
+    result['t'] = pd.Series(1, index=pd.Index(prob.timesteps, name='t'),
+                            name='t_')
+    result['tm'] = pd.Series(1, index=pd.Index(prob.timesteps[1:],
+                                               name='tm'),
+                             name='tm_')
+    result['dt'] = pd.Series([prob.dt], index=pd.Index([None], name='None'),
+                             name='dt')
+    result['weight'] = pd.Series([prob.weight],
+                                 index=pd.Index([None], name='None'),
+                                 name='weight')
+    return result
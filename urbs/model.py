@@ -3,29 +3,92 @@ import pyomo.core as pyomo
 from datetime import datetime
 from .features import *
 from .input import *
+from .matrix import create_matrix_model
+from .presolve import presolve_bounds, remove_units_without_capacity
 
 
 def create_model(data, dt=1, timesteps=None, objective='cost',
-                 dual=True):
+                 dual=True, backend='pyomo', mutable=False,
+                 cost_breakdown=True, dsm_formulation='window',
+                 presolve=False):
     """Create a pyomo ConcreteModel urbs object from given input data.
 
     Args:
         - data: a dict of up to 12
-        - dt: timestep duration in hours (default: 1)
-        - timesteps: optional list of timesteps, default: demand timeseries
+        - dt: timestep duration in hours (default: 1); for segmented data
+          (c.f. segment_timeseries), the one of the original timesteps
+        - timesteps: optional list of timesteps, default: demand timeseries;
+          for aggregated data (c.f. urbs.aggregate_timeseries), always all
+          timesteps of the representative periods
         - objective: Either "cost" or "CO2" for choice of objective function,
           default: "cost"
         - dual: set True to add dual variables to model output
           (marginally slower), default: True
+        - backend: "pyomo" (default) or "matrix" to assemble the same
+          linear program directly in matrix form (see urbs.matrix)
+        - mutable: set True to create prices, capacity bounds and cost
+          coefficients as mutable Params, which allows to apply scenarios
+          without rebuilding the model (see update_model), default: False
+        - cost_breakdown: set False to leave the costs by type of each
+          process, transmission and storage (process_costs, ...) out of the
+          model; they are then computed from the solution instead (see
+          urbs.output.get_cost_breakdown), default: True
+        - dsm_formulation: "window" (default) to link each DSM downshift to
+          its upshift, or "level" for the smaller, equivalent formulation
+          with a shifted energy level (see urbs.features.dsm.add_dsm_level)
+        - presolve: set True to remove processes, storages and transmissions
+          which can have no capacity, to turn capacity limits into variable
+          bounds and to fix unused capacity variables (see urbs.presolve);
+          prints the number of removed units, bounds and fixed variables,
+          default: False
 
     Returns:
-        a pyomo ConcreteModel object
+        a pyomo ConcreteModel object, or a MatrixModel for backend "matrix"
     """
+    if dsm_formulation not in ('window', 'level'):
+        raise ValueError("Unknown DSM formulation '{}'. Use either 'window' "
+                         "or 'level'.".format(dsm_formulation))
+    if backend == 'matrix':
+        if mutable:
+            raise ValueError("The matrix backend has no mutable "
+                             "parameters.")
+        if not cost_breakdown:
+            raise ValueError("The matrix backend always includes the cost "
+                             "breakdown.")
+        if dsm_formulation != 'window':
+            raise ValueError("The matrix backend only supports the 'window' "
+                             "DSM formulation.")
+        if presolve:
+            raise ValueError("The matrix backend has no presolve stage.")
+        if 'aggregation' in data:
+            raise ValueError("The matrix backend does not support "
+                             "representative periods.")
+        if 'segmentation' in data:
+            raise ValueError("The matrix backend does not support "
+                             "timesteps of different durations.")
+        return create_matrix_model(data, dt, timesteps, objective, dual)
+    elif backend != 'pyomo':
+        raise ValueError("Unknown model backend '{}'. Use either 'pyomo' or "
+                         "'matrix'.".format(backend))
+    if presolve and mutable:
+        raise ValueError("Presolved capacity limits are not mutable.")
 
     # Optional
-    if not timesteps:
-        timesteps = data['demand'].index.tolist()
-    m = pyomo_model_prep(data, timesteps)  # preparing pyomo model
+    if 'aggregation' in data:
+        timesteps = range(data['demand'].index.get_level_values('t').min(),
+                          data['aggregation']['last'].max() + 1)
+    elif 'segmentation' in data:
+        timesteps = range(data['demand'].index.get_level_values('t').min(),
+                          data['segmentation'].index.max() + 1)
+    elif not timesteps:
+        timesteps = sorted(set(data['demand'].index.get_level_values('t')))
+    model_data, removed_units = data, 0
+    if presolve:
+        model_data, removed_units = remove_units_without_capacity(model_data)
+    m = pyomo_model_prep(model_data, timesteps)  # preparing pyomo model
+    m.mutable = mutable
+    m.cost_breakdown = cost_breakdown
+    m.dsm_formulation = dsm_formulation
     m.name = 'urbs'
     m.created = datetime.now().strftime('%Y%m%dT%H%M')
     m._data = data
@@ -36,15 +99,18 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
     # weight scales costs and emissions from length of simulation to a full
     # year, making comparisons among cost types (invest is annualized, fixed
     # costs are annual by default, variable costs are scaled by weight) and
-    # among different simulation durations meaningful.
+    # among different simulation durations meaningful. For representative
+    # periods, the length of simulation is the one of the original periods
+    # (c.f. modelled_steps and weight).
     m.weight = pyomo.Param(
         within=pyomo.Reals,
-        initialize=float(8760) / ((len(m.timesteps) - 1) * dt),
+        initialize=float(8760) / (modelled_steps(m) * dt),
         doc='Pre-factor for variable costs and emissions for an annual result')
 
     # dt = spacing between timesteps. Required for storage equation that
     # converts between energy (storage content, e_sto_con) and power (all other
-    # quantities that start with "e_")
+    # quantities that start with "e_"); for segmented timeseries, the
+    # timesteps last multiples of dt (c.f. add_durations and duration)
     m.dt = pyomo.Param(
         within=pyomo.Reals,
         initialize=dt,
@@ -77,6 +143,11 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         ordered=True,
         doc='Set of modelled timesteps')
 
+    # representative periods of aggregated timeseries
+    m = add_periods(m)
+    # timesteps of different durations of segmented timeseries
+    m = add_durations(m)
+
     # support timeframes (e.g. 2020, 2030...)
     indexlist = list()
     for key in m.commodity_dict["price"]:
@@ -141,12 +212,17 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         within=m.stf * m.sit * m.pro,
         initialize=tuple(m.process_dict["inv-cost"].keys()),
         doc='Combinations of possible processes, e.g. (2018,North,Coal plant)')
+    m = add_mutable_params(m, 'commodity_dict', m.com_tuples)
+    m = add_mutable_params(m, 'process_dict', m.pro_tuples)
     m.com_stock = pyomo.Set(
         within=m.com,
         initialize=commodity_subset(m.com_tuples, 'Stock'),
         doc='Commodities that can be purchased at some site(s)')
 
     if m.mode['int']:
+        # years through which units count as operational in each stf
+        m.stf_table = stf_table(m)
+
         # tuples for operational status of technologies
         m.operational_pro_tuples = pyomo.Set(
             within=m.sit * m.pro * m.stf * m.stf,
@@ -164,6 +240,7 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
                         for (sit, pro, stf)
                         in inst_pro_tuples(m)],
             doc='Installed processes that are still operational through stf')
+        m.pro_built_stfs = built_stfs(m.operational_pro_tuples)
 
     # commodity type subsets
     m.com_supim = pyomo.Set(
@@ -179,35 +256,100 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         initialize=commodity_subset(m.com_tuples, 'Env'),
         doc='Commodities that (might) have a maximum creation limit')
 
+    # commodity tuples of the commodity constraints (by commodity type)
+    m.com_vertex_tuples = pyomo.Set(
+        within=m.stf * m.sit * m.com * m.com_type,
+        initialize=[(stf, sit, com, com_type)
+                    for (stf, sit, com, com_type) in m.com_tuples
+                    if com not in m.com_env and com not in m.com_supim],
+        doc='Commodities with a vertex rule, i.e. neither Env nor SupIm')
+    m.com_stock_tuples = pyomo.Set(
+        within=m.stf * m.sit * m.com * m.com_type,
+        initialize=[(stf, sit, com, com_type)
+                    for (stf, sit, com, com_type) in m.com_tuples
+                    if com in m.com_stock],
+        doc='Stock commodities, e.g. (2020,Mid,Coal,Stock)')
+    m.com_env_tuples = pyomo.Set(
+        within=m.stf * m.sit * m.com * m.com_type,
+        initialize=[(stf, sit, com, com_type)
+                    for (stf, sit, com, com_type) in m.com_tuples
+                    if com in m.com_env],
+        doc='Environmental commodities, e.g. (2020,Mid,CO2,Env)')
+
     # process tuples for area rule
     m.pro_area_tuples = pyomo.Set(
         within=m.stf * m.sit * m.pro,
         initialize=tuple(m.proc_area_dict.keys()),
         doc='Processes and Sites with area Restriction')
+    m.area_index = group_tuples(m.pro_area_tuples, (0, 1))
+    m.sit_area_tuples = pyomo.Set(
+        within=m.stf * m.sit,
+        initialize=[(stf, sit) for (stf, sit) in m.sit_tuples
+                    if m.site_dict['area'][stf, sit] >= 0 and sum(
+                        m.process_dict['area-per-cap'][pro_area]
+                        for pro_area in m.area_index.get((stf, sit), ())) > 0],
+        doc='Sites with area restriction and processes using area')
 
     # process input/output
+    # (commodity ratios are grouped by (stf, process) once, so that each
+    # process tuple only looks up its own commodities)
+    r_in_by_pro = group_tuples(m.r_in_dict.keys(), (0, 1))
+    r_out_by_pro = group_tuples(m.r_out_dict.keys(), (0, 1))
+    r_in_min = group_tuples(m.r_in_min_fraction_dict.keys(), (0, 1))
+    r_out_min = group_tuples(m.r_out_min_fraction_dict.keys(), (0, 1))
     m.pro_input_tuples = pyomo.Set(
         within=m.stf * m.sit * m.pro * m.com,
         initialize=[(stf, site, process, commodity)
                     for (stf, site, process) in m.pro_tuples
-                    for (s, pro, commodity) in tuple(m.r_in_dict.keys())
-                    if process == pro and s == stf],
+                    for (_, _, commodity)
+                    in r_in_by_pro.get((stf, process), ())],
         doc='Commodities consumed by process by site,'
             'e.g. (2020,Mid,PV,Solar)')
     m.pro_output_tuples = pyomo.Set(
         within=m.stf * m.sit * m.pro * m.com,
         initialize=[(stf, site, process, commodity)
                     for (stf, site, process) in m.pro_tuples
-                    for (s, pro, commodity) in tuple(m.r_out_dict.keys())
-                    if process == pro and s == stf],
+                    for (_, _, commodity)
+                    in r_out_by_pro.get((stf, process), ())],
         doc='Commodities produced by process by site, e.g. (2020,Mid,PV,Elec)')
+    m.pro_supim_input_tuples = pyomo.Set(
+        within=m.stf * m.sit * m.pro * m.com,
+        initialize=[(stf, site, process, commodity)
+                    for (stf, site, process, commodity) in m.pro_input_tuples
+                    if commodity in m.com_supim],
+        doc='Intermittent commodities consumed by process by site,'
+            'e.g. (2020,Mid,PV,Solar)')
 
-    # process tuples for maximum gradient feature
+    # cost attribution index: for each process the stock commodities it
+    # consumes (fuel costs) and the environmental commodities it creates
+    # (environmental costs), c.f. def_specific_process_costs_rule
+    com_by_type = group_tuples(m.com_tuples, (0, 1, 3))
+    pro_inputs = set(m.pro_input_tuples)
+    pro_outputs = set(m.pro_output_tuples)
+    m.cost_index = {
+        'Fuel': {
+            (stf, sit, pro): [
+                c for c in com_by_type.get((stf, sit, 'Stock'), ())
+                if (stf, sit, pro, c[2]) in pro_inputs]
+            for (stf, sit, pro) in m.pro_tuples},
+        'Environmental': {
+            (stf, sit, pro): [
+                c for c in com_by_type.get((stf, sit, 'Env'), ())
+                if (stf, sit, pro, c[2]) in pro_outputs]
+            for (stf, sit, pro) in m.pro_tuples}}
+
+    # process tuples for maximum gradient feature (a gradient may only limit
+    # the throughput if it is smaller than the shortest timestep length)
+    if m.segmentation is None:
+        shortest = dt
+    else:
+        shortest = dt * m.segmentation['duration'].min()
     m.pro_maxgrad_tuples = pyomo.Set(
         within=m.stf * m.sit * m.pro,
         initialize=[(stf, sit, pro)
                     for (stf, sit, pro) in m.pro_tuples
-                    if m.process_dict['max-grad'][stf, sit, pro] < 1.0 / dt],
+                    if m.process_dict['max-grad'][stf, sit, pro] <
+                    1.0 / shortest],
         doc='Processes with maximum gradient smaller than timestep length')
 
     # process tuples for partial feature
@@ -215,17 +357,15 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         within=m.stf * m.sit * m.pro,
         initialize=[(stf, site, process)
                     for (stf, site, process) in m.pro_tuples
-                    for (s, pro, _) in tuple(m.r_in_min_fraction_dict.keys())
-                    if process == pro and s == stf],
+                    if (stf, process) in r_in_min],
         doc='Processes with partial input')
 
     m.pro_partial_input_tuples = pyomo.Set(
         within=m.stf * m.sit * m.pro * m.com,
         initialize=[(stf, site, process, commodity)
                     for (stf, site, process) in m.pro_partial_tuples
-                    for (s, pro, commodity) in tuple(m.r_in_min_fraction_dict
-                                                     .keys())
-                    if process == pro and s == stf],
+                    for (_, _, commodity)
+                    in r_in_min[stf, process]],
         doc='Commodities with partial input ratio,'
             'e.g. (2020,Mid,Coal PP,Coal)')
 
@@ -233,9 +373,8 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         within=m.stf * m.sit * m.pro * m.com,
         initialize=[(stf, site, process, commodity)
                     for (stf, site, process) in m.pro_partial_tuples
-                    for (s, pro, commodity) in tuple(m.r_out_min_fraction_dict
-                                                     .keys())
-                    if process == pro and s == stf],
+                    for (_, _, commodity)
+                    in r_out_min.get((stf, process), ())],
         doc='Commodities with partial input ratio, e.g. (Mid,Coal PP,CO2)')
 
     # Variables
@@ -246,11 +385,12 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         within=pyomo.Reals,
         doc='Costs by type (EUR/a)')
         
-    m.process_costs = pyomo.Var(
-        m.pro_tuples,
-        m.cost_type,
-        within=pyomo.Reals,
-        doc='Costs by type and site (EUR/a)')    
+    if m.cost_breakdown:
+        m.process_costs = pyomo.Var(
+            m.pro_tuples,
+            m.cost_type,
+            within=pyomo.Reals,
+            doc='Costs by type and site (EUR/a)')
 
     # commodity
     m.e_co_stock = pyomo.Var(
@@ -289,6 +429,9 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
     if m.mode['tra']:
         if m.mode['dpf']:
             m = add_transmission_dc(m)
+            # DCPF lines are only modelled in one direction
+            m.balance_index['tra_in'] = group_tuples(m.tra_tuples, (0, 1, 4))
+            m.balance_index['tra_out'] = group_tuples(m.tra_tuples, (0, 2, 4))
         else:
             m = add_transmission(m)
     if m.mode['sto']:
@@ -304,49 +447,65 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
             within=m.stf * m.sit * m.pro * m.com,
             doc='empty set needed for (partial) process output')
 
+    # commodity balance as expression object, built only once per timestep
+    # and shared by the vertex, environmental, CO2 and cost equations
+    # (supim commodities are only consumed and never balanced)
+    m.com_balance_tuples = pyomo.Set(
+        within=m.stf * m.sit * m.com,
+        initialize=list(dict.fromkeys(
+            (stf, sit, com) for (stf, sit, com, com_type) in m.com_tuples
+            if com not in m.com_supim)),
+        doc='Combinations of balanced commodities, e.g. (2020,Mid,Elec)')
+    m.e_balance = pyomo.Expression(
+        m.tm, m.com_balance_tuples,
+        rule=def_commodity_balance_rule,
+        doc='Commodity balance (MW) per timestep, positive means consumption')
+
     # Equation declarations
     # equation bodies are defined in separate functions, referred to here by
     # their name in the "rule" keyword.
 
     # commodity
     m.res_vertex = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_vertex_tuples,
         rule=res_vertex_rule,
         doc='storage + transmission + process + source + buy - sell == demand')
     m.res_stock_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_stock_tuples,
         rule=res_stock_step_rule,
         doc='stock commodity input per step <= commodity.maxperstep')
     m.res_stock_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_stock_tuples,
         rule=res_stock_total_rule,
         doc='total stock commodity input <= commodity.max')
     m.res_env_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_env_tuples,
         rule=res_env_step_rule,
         doc='environmental output per step <= commodity.maxperstep')
     m.res_env_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_env_tuples,
         rule=res_env_total_rule,
         doc='total environmental commodity output <= commodity.max')
 
     # process
-    m.def_process_input = pyomo.Constraint(
-        m.tm, m.pro_input_tuples - m.pro_partial_input_tuples,
-        rule=def_process_input_rule,
+    add_batch_constraint(
+        m, 'def_process_input',
+        m.pro_input_tuples - m.pro_partial_input_tuples,
+        def_process_input_rule,
         doc='process input = process throughput * input ratio')
-    m.def_process_output = pyomo.Constraint(
-        m.tm, (m.pro_output_tuples - m.pro_partial_output_tuples -
-               m.pro_timevar_output_tuples),
-        rule=def_process_output_rule,
+    add_batch_constraint(
+        m, 'def_process_output',
+        (m.pro_output_tuples - m.pro_partial_output_tuples -
+         m.pro_timevar_output_tuples),
+        def_process_output_rule,
         doc='process output = process throughput * output ratio')
-    m.def_intermittent_supply = pyomo.Constraint(
-        m.tm, m.pro_input_tuples,
-        rule=def_intermittent_supply_rule,
+    add_batch_constraint(
+        m, 'def_intermittent_supply', m.pro_supim_input_tuples,
+        def_intermittent_supply_rule,
         doc='process output = process capacity * supim timeseries')
-    m.res_process_throughput_by_capacity = pyomo.Constraint(
-        m.tm, m.pro_tuples,
-        rule=res_process_throughput_by_capacity_rule,
+    add_batch_constraint(
+        m, 'res_process_throughput_by_capacity', m.pro_tuples,
+        res_process_throughput_by_capacity_rule,
         doc='process throughput <= total process capacity')
     m.res_process_maxgrad_lower = pyomo.Constraint(
         m.tm, m.pro_maxgrad_tuples,
@@ -362,7 +521,7 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
         doc='process.cap-lo <= total process capacity <= process.cap-up')
 
     m.res_area = pyomo.Constraint(
-        m.sit_tuples,
+        m.sit_area_tuples,
         rule=res_area_rule,
         doc='used process area <= total process area')
 
@@ -392,17 +551,26 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
     #        doc='total co2 commodity output <= global.prop CO2 limit')
 
     # costs
+    if m.mode['bsp']:
+        # revenue and purchase costs do not depend on the process, so their
+        # (large) expressions are built only once
+        m.bsp_costs = {'Revenue': revenue_costs(m),
+                       'Purchase': purchase_costs(m)}
     m.def_costs = pyomo.Constraint(
         m.cost_type,
         rule=def_costs_rule,
         doc='main cost function by cost type')
         
     # specific cost calculation allows to identify individual contributors to the cost function. 
-    m.def_specific_process_costs = pyomo.Constraint(
-        m.pro_tuples,
-        m.cost_type,
-        rule=def_specific_process_costs_rule,
-        doc='main cost function of processes by cost type by process and stf')    
+    # (without cost_breakdown, these are computed from the solution instead,
+    # c.f. urbs.output.get_cost_breakdown)
+    if m.cost_breakdown:
+        m.def_specific_process_costs = pyomo.Constraint(
+            m.pro_tuples,
+            m.cost_type,
+            rule=def_specific_process_costs_rule,
+            doc='main cost function of processes by cost type by process and '
+                'stf')
 
     # objective and global constraints
     if m.obj.value == 'cost':
@@ -452,6 +620,14 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
                                   "either 'cost' or 'CO2' as the objective in "
                                   "runme.py!")
 
+    if presolve:
+        bounds, fixed = presolve_bounds(m)
+        m.presolve_stats = {'units': removed_units, 'bounds': bounds,
+                            'fixed': fixed}
+        print('Presolve: removed {} units without capacity, turned {} '
+              'capacity limits into variable bounds and fixed {} capacity '
+              'variables.'.format(removed_units, bounds, fixed))
+
     if dual:
         m.dual = pyomo.Suffix(direction=pyomo.Suffix.IMPORT)
 
@@ -462,24 +638,25 @@ def create_model(data, dt=1, timesteps=None, objective='cost',
 
 # commodity
 
+# commodity balance (for m.e_balance expression)
+def def_commodity_balance_rule(m, tm, stf, sit, com):
+    return commodity_balance(m, tm, stf, sit, com)
+
+
 # vertex equation: calculate balance for given commodity and site;
 # contains implicit constraints for process activity, import/export and
 # storage activity (calculated by function commodity_balance);
 # contains implicit constraint for stock commodity source term
+# (environmental or supim commodities don't have this constraint (yet), c.f.
+# m.com_vertex_tuples)
 def res_vertex_rule(m, tm, stf, sit, com, com_type):
-    # environmental or supim commodities don't have this constraint (yet)
-    if com in m.com_env:
-        return pyomo.Constraint.Skip
-    if com in m.com_supim:
-        return pyomo.Constraint.Skip
-
     # helper function commodity_balance calculates balance from input to
     # and output from processes, storage and transmission.
     # if power_surplus > 0: production/storage/imports create net positive
     #                       amount of commodity com
     # if power_surplus < 0: production/storage/exports consume a net
     #                       amount of the commodity com
-    power_surplus = - commodity_balance(m, tm, stf, sit, com)
+    power_surplus = - balance(m, tm, stf, sit, com)
 
     # if com is a stock commodity, the commodity source term e_co_stock
     # can supply a possibly negative power_surplus
@@ -494,10 +671,9 @@ def res_vertex_rule(m, tm, stf, sit, com, com_type):
     # demand value; no scaling by m.dt or m.weight is needed here, as this
     # constraint is about power (MW), not energy (MWh)
     if com in m.com_demand:
-        try:
-            power_surplus -= m.demand_dict[(sit, com)][(stf, tm)]
-        except KeyError:
-            pass
+        demand = m.demand_dict.get((sit, com))
+        if demand is not None and (stf, tm) in demand:
+            power_surplus -= demand[(stf, tm)]
 
     if m.mode['dsm']:
         power_surplus += dsm_surplus(m, tm, stf, sit, com)
@@ -510,28 +686,21 @@ def res_vertex_rule(m, tm, stf, sit, com, com_type):
 
 
 def res_stock_step_rule(m, tm, stf, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_stock[tm, stf, sit, com, com_type] <=
-                m.dt * m.commodity_dict['maxperhour']
-                [(stf, sit, com, com_type)])
+    return (m.e_co_stock[tm, stf, sit, com, com_type] <=
+            duration(m, tm) * m.commodity_dict['maxperhour']
+            [(stf, sit, com, com_type)])
 
 
 # limit stock commodity use in total (scaled to annual consumption, thanks
 # to m.weight)
 def res_stock_total_rule(m, stf, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total consumption of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_stock[tm, stf, sit, com, com_type])
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity_dict['max'][(stf, sit, com, com_type)])
+    # calculate total consumption of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_stock[tm, stf, sit, com, com_type] * weight(m, tm))
+    return (total_consumption <=
+            m.commodity_dict['max'][(stf, sit, com, com_type)])
 
 
 # environmental commodity creation == - commodity_balance of that commodity
@@ -539,28 +708,21 @@ def res_stock_total_rule(m, stf, sit, com, com_type):
 # any process activity;
 # limit environmental commodity output per time step
 def res_env_step_rule(m, tm, stf, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        environmental_output = - commodity_balance(m, tm, stf, sit, com)
-        return (environmental_output <=
-                m.dt * m.commodity_dict['maxperhour']
-                [(stf, sit, com, com_type)])
+    environmental_output = - balance(m, tm, stf, sit, com)
+    return (environmental_output <=
+            duration(m, tm) * m.commodity_dict['maxperhour']
+            [(stf, sit, com, com_type)])
 
 
 # limit environmental commodity output in total (scaled to annual
 # emissions, thanks to m.weight)
 def res_env_total_rule(m, stf, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total creation of environmental commodity com
-        env_output_sum = 0
-        for tm in m.tm:
-            env_output_sum += (- commodity_balance(m, tm, stf, sit, com))
-        env_output_sum *= m.weight
-        return (env_output_sum <=
-                m.commodity_dict['max'][(stf, sit, com, com_type)])
+    # calculate total creation of environmental commodity com
+    env_output_sum = 0
+    for tm in m.tm:
+        env_output_sum += (- balance(m, tm, stf, sit, com) * weight(m, tm))
+    return (env_output_sum <=
+            m.commodity_dict['max'][(stf, sit, com, com_type)])
 
 
 # process
@@ -574,15 +736,13 @@ def def_process_capacity_rule(m, stf, sit, pro):
             else:
                 cap_pro = \
                     (sum(m.cap_pro_new[stf_built, sit, pro]
-                         for stf_built in m.stf
-                         if (sit, pro, stf_built, stf)
-                         in m.operational_pro_tuples) +
+                         for stf_built
+                         in m.pro_built_stfs.get((sit, pro, stf), ())) +
                      m.process_dict['inst-cap'][(min(m.stf), sit, pro)])
         else:
             cap_pro = sum(
                 m.cap_pro_new[stf_built, sit, pro]
-                for stf_built in m.stf
-                if (sit, pro, stf_built, stf) in m.operational_pro_tuples)
+                for stf_built in m.pro_built_stfs.get((sit, pro, stf), ()))
     else:
         if (sit, pro, stf) in m.pro_const_cap_dict:
             cap_pro = m.process_dict['inst-cap'][(stf, sit, pro)]
@@ -592,52 +752,82 @@ def def_process_capacity_rule(m, stf, sit, pro):
     return cap_pro
 
 # process input power == process throughput * input ratio
+# (all modelled timesteps of one process input, c.f. add_batch_constraint)
 
 
-def def_process_input_rule(m, tm, stf, sit, pro, com):
-    return (m.e_pro_in[tm, stf, sit, pro, com] ==
-            m.tau_pro[tm, stf, sit, pro] * m.r_in_dict[(stf, pro, com)])
+def def_process_input_rule(m, stf, sit, pro, com):
+    return equalities([
+        terms(1, [m.e_pro_in[tm, stf, sit, pro, com] for tm in m.tm]),
+        terms(-m.r_in_dict[(stf, pro, com)],
+              [m.tau_pro[tm, stf, sit, pro] for tm in m.tm])])
 
 
 # process output power = process throughput * output ratio
-def def_process_output_rule(m, tm, stf, sit, pro, com):
-    return (m.e_pro_out[tm, stf, sit, pro, com] ==
-            m.tau_pro[tm, stf, sit, pro] * m.r_out_dict[(stf, pro, com)])
+def def_process_output_rule(m, stf, sit, pro, com):
+    return equalities([
+        terms(1, [m.e_pro_out[tm, stf, sit, pro, com] for tm in m.tm]),
+        terms(-m.r_out_dict[(stf, pro, com)],
+              [m.tau_pro[tm, stf, sit, pro] for tm in m.tm])])
 
 
 # process input (for supim commodity) = process capacity * timeseries
-def def_intermittent_supply_rule(m, tm, stf, sit, pro, coin):
-    if coin in m.com_supim:
-        return (m.e_pro_in[tm, stf, sit, pro, coin] ==
-                m.cap_pro[stf, sit, pro] * m.supim_dict[(sit, coin)]
-                [(stf, tm)] * m.dt)
-    else:
-        return pyomo.Constraint.Skip
+def def_intermittent_supply_rule(m, stf, sit, pro, coin):
+    factors = (m.supim_dict.timeseries((sit, coin), stf, m.tm) *
+               durations(m)).tolist()
+    capacity, constants = capacity_columns(m.cap_pro[stf, sit, pro], factors)
+    return equalities(
+        [terms(1, [m.e_pro_in[tm, stf, sit, pro, coin] for tm in m.tm])] +
+        capacity, constants)
 
 
 # process throughput <= process capacity
-def res_process_throughput_by_capacity_rule(m, tm, stf, sit, pro):
-    return (m.tau_pro[tm, stf, sit, pro] <= m.dt * m.cap_pro[stf, sit, pro])
+def res_process_throughput_by_capacity_rule(m, stf, sit, pro):
+    capacity, constants = capacity_columns(m.cap_pro[stf, sit, pro],
+                                           durations(m))
+    return less_equals(
+        [terms(1, [m.tau_pro[tm, stf, sit, pro] for tm in m.tm])] +
+        capacity, constants)
 
 
 def res_process_maxgrad_lower_rule(m, t, stf, sit, pro):
-    return (m.tau_pro[t - 1, stf, sit, pro] -
+    if m.segmentation is not None:
+        previous, ramp = segmented_gradient(m, t, stf, sit, pro)
+        return previous - ramp <= m.tau_pro[t, stf, sit, pro]
+    return (m.tau_pro[previous_timestep(m, t), stf, sit, pro] -
             m.cap_pro[stf, sit, pro] *
             m.process_dict['max-grad'][(stf, sit, pro)] * m.dt <=
             m.tau_pro[t, stf, sit, pro])
 
 
 def res_process_maxgrad_upper_rule(m, t, stf, sit, pro):
-    return (m.tau_pro[t - 1, stf, sit, pro] +
+    if m.segmentation is not None:
+        previous, ramp = segmented_gradient(m, t, stf, sit, pro)
+        return previous + ramp >= m.tau_pro[t, stf, sit, pro]
+    return (m.tau_pro[previous_timestep(m, t), stf, sit, pro] +
             m.cap_pro[stf, sit, pro] *
             m.process_dict['max-grad'][(stf, sit, pro)] * m.dt >=
             m.tau_pro[t, stf, sit, pro])
 
 
+def segmented_gradient(m, t, stf, sit, pro):
+    """Throughput of the previous timestep scaled to the duration of
+    timestep t, and the allowed change of the throughput in t, for
+    timesteps of different durations: the power may change by max-grad
+    times the capacity per hour between the midpoints of both timesteps"""
+    length = m.duration[t]
+    previous_length = m.duration[t - 1]
+    previous = m.tau_pro[t - 1, stf, sit, pro] * (length / previous_length)
+    ramp = (m.cap_pro[stf, sit, pro] *
+            (m.process_dict['max-grad'][(stf, sit, pro)] * length *
+             (length + previous_length) / 2))
+    return previous, ramp
+
+
 def res_throughput_by_capacity_min_rule(m, tm, stf, sit, pro):
     return (m.tau_pro[tm, stf, sit, pro] >=
             m.cap_pro[stf, sit, pro] *
-            m.process_dict['min-fraction'][(stf, sit, pro)] * m.dt)
+            m.process_dict['min-fraction'][(stf, sit, pro)] *
+            duration(m, tm))
 
 
 def def_partial_process_input_rule(m, tm, stf, sit, pro, coin):
@@ -651,7 +841,7 @@ def def_partial_process_input_rule(m, tm, stf, sit, pro, coin):
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
 
     return (m.e_pro_in[tm, stf, sit, pro, coin] ==
-            m.dt * m.cap_pro[stf, sit, pro] * online_factor +
+            duration(m, tm) * m.cap_pro[stf, sit, pro] * online_factor +
             m.tau_pro[tm, stf, sit, pro] * throughput_factor)
 
 
@@ -666,7 +856,7 @@ def def_partial_process_output_rule(m, tm, stf, sit, pro, coo):
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
 
     return (m.e_pro_out[tm, stf, sit, pro, coo] ==
-            m.dt * m.cap_pro[stf, sit, pro] * online_factor +
+            duration(m, tm) * m.cap_pro[stf, sit, pro] * online_factor +
             m.tau_pro[tm, stf, sit, pro] * throughput_factor)
 
 
@@ -678,19 +868,12 @@ def res_process_capacity_rule(m, stf, sit, pro):
 
 
 # used process area <= maximal process area
+# (only for sites with a numeric area, c.f. m.sit_area_tuples)
 def res_area_rule(m, stf, sit):
-    if m.site_dict['area'][stf, sit] >= 0 and sum(
-        m.process_dict['area-per-cap'][st, s, p]
-        for (st, s, p) in m.pro_area_tuples
-            if s == sit and st == stf) > 0:
-        total_area = sum(m.cap_pro[st, s, p] *
-                         m.process_dict['area-per-cap'][st, s, p]
-                         for (st, s, p) in m.pro_area_tuples
-                         if s == sit and st == stf)
-        return total_area <= m.site_dict['area'][stf, sit]
-    else:
-        # Skip constraint, if area is not numeric
-        return pyomo.Constraint.Skip
+    total_area = sum(m.cap_pro[st, s, p] *
+                     m.process_dict['area-per-cap'][st, s, p]
+                     for (st, s, p) in m.area_index[stf, sit])
+    return total_area <= m.site_dict['area'][stf, sit]
 
 
 # total CO2 output <= Global CO2 limit
@@ -702,12 +885,10 @@ def res_global_co2_limit_rule(m, stf):
         for tm in m.tm:
             for sit in m.sit:
                 # minus because negative commodity_balance represents creation
-                # of that commodity.
-                co2_output_sum += (- commodity_balance(m, tm,
-                                                       stf, sit, 'CO2'))
-
-        # scaling to annual output (cf. definition of m.weight)
-        co2_output_sum *= m.weight
+                # of that commodity; scaled to annual output (cf. definition
+                # of m.weight)
+                co2_output_sum += (- balance(m, tm, stf, sit, 'CO2') *
+                                   weight(m, tm))
         return (co2_output_sum <= m.global_prop_dict['value']
                                                     [stf, 'CO2 limit'])
     else:
@@ -725,9 +906,8 @@ def res_global_co2_budget_rule(m):
                 for sit in m.sit:
                     # minus because negative commodity_balance represents
                     # creation of that commodity.
-                    co2_output_sum += (- commodity_balance
-                                       (m, tm, stf, sit, 'CO2') *
-                                       m.weight *
+                    co2_output_sum += (- balance(m, tm, stf, sit, 'CO2') *
+                                       weight(m, tm) *
                                        stf_dist(stf, m))
 
         return (co2_output_sum <=
@@ -773,7 +953,12 @@ def def_costs_rule(m, cost_type):
     #    capacity.
     #  - Variables costs for usage of processes, storage and transmission.
     #  - Fuel costs for stock commodity purchase.
+    return m.costs[cost_type] == total_cost_by_type(m, cost_type)
 
+
+def total_cost_by_type(m, cost_type):
+    """Return the total costs of one cost type, i.e. the expression of
+    m.costs[cost_type] in def_costs (c.f. process_cost_by_type)."""
     if cost_type == 'Invest':
         cost = \
             sum(m.cap_pro_new[p] *
@@ -792,7 +977,7 @@ def def_costs_rule(m, cost_type):
         if m.mode['sto']:
             # storage_cost is defined in storage.py
             cost += storage_cost(m, cost_type)
-        return m.costs[cost_type] == cost
+        return cost
 
     elif cost_type == 'Fixed':
         cost = \
@@ -803,11 +988,11 @@ def def_costs_rule(m, cost_type):
             cost += transmission_cost(m, cost_type)
         if m.mode['sto']:
             cost += storage_cost(m, cost_type)
-        return m.costs[cost_type] == cost
+        return cost
 
     elif cost_type == 'Variable':
         cost = \
-            sum(m.tau_pro[(tm,) + p] * m.weight *
+            sum(m.tau_pro[(tm,) + p] * weight(m, tm) *
                 m.process_dict['var-cost'][p] *
                 m.process_dict['cost_factor'][p]
                 for tm in m.tm
@@ -816,19 +1001,19 @@ def def_costs_rule(m, cost_type):
             cost += transmission_cost(m, cost_type)
         if m.mode['sto']:
             cost += storage_cost(m, cost_type)
-        return m.costs[cost_type] == cost
+        return cost
 
     elif cost_type == 'Fuel':
-        return m.costs[cost_type] == sum(
-            m.e_co_stock[(tm,) + c] * m.weight *
+        return sum(
+            m.e_co_stock[(tm,) + c] * weight(m, tm) *
             m.commodity_dict['price'][c] *
             m.commodity_dict['cost_factor'][c]
             for tm in m.tm for c in m.com_tuples
             if c[2] in m.com_stock)
 
     elif cost_type == 'Environmental':
-        return m.costs[cost_type] == sum(
-            - commodity_balance(m, tm, stf, sit, com) * m.weight *
+        return sum(
+            - balance(m, tm, stf, sit, com) * weight(m, tm) *
             m.commodity_dict['price'][(stf, sit, com, com_type)] *
             m.commodity_dict['cost_factor'][(stf, sit, com, com_type)]
             for tm in m.tm
@@ -837,18 +1022,27 @@ def def_costs_rule(m, cost_type):
 
     # Revenue and Purchase costs defined in BuySellPrice.py
     elif cost_type == 'Revenue':
-        return m.costs[cost_type] == revenue_costs(m)
+        return m.bsp_costs['Revenue']
 
     elif cost_type == 'Purchase':
-        return m.costs[cost_type] == purchase_costs(m)
+        return m.bsp_costs['Purchase']
 
     else:
         raise NotImplementedError("Unknown cost type.")
 
 
 def def_specific_process_costs_rule(m, stf, sit, pro, cost_type):
-   # Calculate total costs by cost type per process and stf. This allows to easily identify the biggest contributors to the cost functions. 
+    return (m.process_costs[stf, sit, pro, cost_type] ==
+            process_cost_by_type(m, stf, sit, pro, cost_type))
+
+
+def process_cost_by_type(m, stf, sit, pro, cost_type):
+    """Return the costs of one cost type of a process in stf.
 
+    This allows to easily identify the biggest contributors to the cost
+    function, either as constraint of m.process_costs or, after solving, by
+    urbs.output.get_cost_breakdown.
+    """
     if cost_type == 'Invest':
         cost_spec = \
             (m.cap_pro_new[stf, sit, pro] *
@@ -862,7 +1056,7 @@ def def_specific_process_costs_rule(m, stf, sit, pro, cost_type):
                  m.process_dict['inv-cost'][stf, sit, pro] *
                  m.process_dict['overpay-factor'][stf, sit, pro])
 
-        return m.process_costs[stf, sit, pro, cost_type] == cost_spec
+        return cost_spec
 
     elif cost_type == 'Fixed':
         cost_spec = \
@@ -870,46 +1064,44 @@ def def_specific_process_costs_rule(m, stf, sit, pro, cost_type):
              m.process_dict['cost_factor'][stf, sit, pro]
              )
 
-        return m.process_costs[stf, sit, pro, cost_type] == cost_spec
+        return cost_spec
 
     elif cost_type == 'Variable':
         cost_spec = \
-            sum(m.tau_pro[tm, stf, sit, pro] * m.weight *
+            sum(m.tau_pro[tm, stf, sit, pro] * weight(m, tm) *
                 m.process_dict['var-cost'][stf, sit, pro] *
                 m.process_dict['cost_factor'][stf, sit, pro]
                 for tm in m.tm)
 
-        return m.process_costs[stf, sit, pro, cost_type] == cost_spec
+        return cost_spec
 
     elif cost_type == 'Fuel':
-        return m.process_costs[stf, sit, pro, cost_type] == \
-               sum(
-                   m.e_pro_in[(tm, st, si, pro, co)] * m.weight *
-                   m.commodity_dict['price'][st, si, co, co_type] *
-                   m.commodity_dict['cost_factor'][st, si, co, co_type]
-                   for tm in m.tm for (st, si, co, co_type) in m.com_tuples
-                   if st == stf
-                   if si == sit
-                   if ((stf, sit, pro, co) in m.pro_input_tuples) and co_type == "Stock")
+        # stock commodities consumed by the process (c.f. m.cost_index)
+        return sum(
+            m.e_pro_in[(tm, st, si, pro, co)] * weight(m, tm) *
+            m.commodity_dict['price'][st, si, co, co_type] *
+            m.commodity_dict['cost_factor'][st, si, co, co_type]
+            for tm in m.tm
+            for (st, si, co, co_type)
+            in m.cost_index['Fuel'][stf, sit, pro])
 
     elif cost_type == 'Environmental':
-        return m.process_costs[stf, sit, pro, cost_type] == \
-               sum(
-                   m.e_pro_out[(tm, st, si, pro, co)] * m.weight *
-                   m.commodity_dict['price'][st, si, co, co_type] *
-                   m.commodity_dict['cost_factor'][st, si, co, co_type]
-                   for tm in m.tm for (st, si, co, co_type) in m.com_tuples
-                   if st == stf
-                   if si == sit
-                   if ((stf, sit, pro, co) in m.pro_output_tuples) and co_type == "Env")
+        # environmental commodities created by the process
+        return sum(
+            m.e_pro_out[(tm, st, si, pro, co)] * weight(m, tm) *
+            m.commodity_dict['price'][st, si, co, co_type] *
+            m.commodity_dict['cost_factor'][st, si, co, co_type]
+            for tm in m.tm
+            for (st, si, co, co_type)
+            in m.cost_index['Environmental'][stf, sit, pro])
 
 
     # Revenue and Purchase costs defined in BuySellPrice.py
     elif cost_type == 'Revenue':
-        return m.process_costs[stf, sit, pro, cost_type] == revenue_costs(m)
+        return m.bsp_costs['Revenue']
 
     elif cost_type == 'Purchase':
-        return m.process_costs[stf, sit, pro, cost_type] == purchase_costs(m)
+        return m.bsp_costs['Purchase']
 
     else:
         raise NotImplementedError("Unknown cost type.")
@@ -928,10 +1120,10 @@ def co2_rule(m):
                 # minus because negative commodity_balance represents
                 # creation of that commodity.
                 if m.mode['int']:
-                    co2_output_sum += (- commodity_balance(m, tm, stf, sit, 'CO2') *
-                                       m.weight * stf_dist(stf, m))
+                    co2_output_sum += (- balance(m, tm, stf, sit, 'CO2') *
+                                       weight(m, tm) * stf_dist(stf, m))
                 else:
-                    co2_output_sum += (- commodity_balance(m, tm, stf, sit, 'CO2') *
-                                       m.weight)
+                    co2_output_sum += (- balance(m, tm, stf, sit, 'CO2') *
+                                       weight(m, tm))
 
     return (co2_output_sum)
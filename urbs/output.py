@@ -1,8 +1,19 @@
 import pandas as pd
+import pyomo.core as pyomo
+from .features.storage import storage_cost_by_type
+from .features.transmission import transmission_cost_by_type
 from .input import get_input
-from .pyomoio import get_entity, get_entities
+from .model import process_cost_by_type
+from .pyomoio import get_entity, get_entities, _entity_series, \
+                    _get_onset_names
 from .util import is_string
 
+# cost breakdown entities: name, index tuple set and cost function
+COST_BREAKDOWN = [
+    ('process_costs', 'pro_tuples', process_cost_by_type),
+    ('transmission_costs', 'tra_tuples', transmission_cost_by_type),
+    ('storage_costs', 'sto_tuples', storage_cost_by_type)]
+
 
 def get_constants(instance):
     """Return summary DataFrames for important variables
@@ -55,6 +66,54 @@ def get_constants(instance):
     return costs, cpro, ctra, csto
 
 
+def get_cost_breakdown(instance, value=pyomo.value):
+    """Return the costs by type of each process, transmission and storage.
+
+    Models created with create_model(..., cost_breakdown=False) contain no
+    variables process_costs, transmission_costs and storage_costs. Their
+    values are then computed from the solution, using the same cost terms
+    as the constraints of the full model.
+
+    Usage:
+        breakdown = get_cost_breakdown(instance)
+        breakdown['process_costs'].xs('Fuel', level='cost_type')
+
+    Args:
+        instance: a solved urbs model instance
+        value: (optional) function evaluating a cost term of a model
+               without cost breakdown, default: its value in the solution
+
+    Returns:
+        dict of the Series process_costs, transmission_costs and
+        storage_costs, indexed like the variables (c.f. get_entity)
+    """
+    breakdown = {}
+    if getattr(instance, 'cost_breakdown', True):
+        for name, _, _ in COST_BREAKDOWN:
+            breakdown[name] = get_entity(instance, name)
+        return breakdown
+
+    # revenue and purchase costs are shared by all processes, c.f.
+    # create_model; evaluate them only once
+    shared = {id(expression): value(expression)
+              for expression in getattr(instance, 'bsp_costs', {}).values()}
+    for name, tuples, cost_by_type in COST_BREAKDOWN:
+        if not hasattr(instance, tuples):
+            continue
+        rows = []
+        for index in getattr(instance, tuples):
+            for cost_type in instance.cost_type:
+                expression = cost_by_type(instance, *index, cost_type)
+                cost = shared.get(id(expression))
+                if cost is None:
+                    cost = value(expression)
+                rows.append(index + (cost_type, cost))
+        labels = _get_onset_names(getattr(instance, tuples)) + ['cost_type']
+        breakdown[name] = _entity_series(instance, pd.DataFrame(rows),
+                                         labels, name)
+    return breakdown
+
+
 def get_timeseries(instance, stf, com, sites, timesteps=None):
     """Return DataFrames of all timeseries referring to given commodity
 
@@ -96,15 +155,8 @@ def get_timeseries(instance, stf, com, sites, timesteps=None):
         # select relevant timesteps (=rows)
         # select commodity (xs), then the sites from remaining simple columns
         # and sum all together to form a Series
-        demand = (
-            pd.DataFrame.from_dict(
-                get_input(
-                    instance,
-                    'demand_dict')).loc[stf] .loc[timesteps].xs(
-                com,
-                axis=1,
-                level=1)[sites].sum(
-                    axis=1))
+        demand = (get_input(instance, 'demand').loc[stf].loc[timesteps]
+                  .xs(com, axis=1, level=1)[sites].sum(axis=1))
     except KeyError:
         demand = pd.Series(0, index=timesteps)
     demand.name = 'Demand'
@@ -220,6 +272,9 @@ def get_timeseries(instance, stf, com, sites, timesteps=None):
     # DEMAND SIDE MANAGEMENT (load shifting)
     dsmup = get_entity(instance, 'dsm_up')
     dsmdo = get_entity(instance, 'dsm_down')
+    if dsmdo.empty:
+        # DSM formulation "level": downshifts are summed per timestep
+        dsmdo = get_entity(instance, 'dsm_downshift')
 
     if dsmup.empty:
         # if no DSM happened, the demand is not modified (delta = 0)
@@ -239,9 +294,10 @@ def get_timeseries(instance, stf, com, sites, timesteps=None):
             dsmup = dsmup.unstack()[sites].sum(axis=1)
             dsmdo = dsmdo.unstack()[sites].sum(axis=1)
 
-            # convert dsmdo to Series by summing over the first time level
-            dsmdo = dsmdo.unstack().sum(axis=0)
-            dsmdo.index.names = ['t']
+            if dsmdo.index.nlevels > 1:
+                # convert dsmdo to Series by summing over the first time level
+                dsmdo = dsmdo.unstack().sum(axis=0)
+                dsmdo.index.names = ['t']
 
             # derive secondary timeseries
             delta = dsmup - dsmdo
@@ -0,0 +1,111 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+
+class ParamStore(MutableMapping):
+    """Columns of an input DataFrame, used like DataFrame.to_dict().
+
+    store[column][index_tuple] returns the value of a cell, e.g.
+    m.process_dict['var-cost'][(stf, sit, pro)]. Instead of one dict per
+    column, the index tuples are coded once as integer positions, which all
+    columns share, and each column keeps its values in a NumPy array.
+
+    Columns may be replaced by any mapping, e.g. a mutable pyomo Param.
+    """
+    def __init__(self, frame):
+        self.positions = {key: position
+                          for position, key in enumerate(frame.index)}
+        self.columns = {
+            column: ParamColumn(self.positions,
+                                frame[column].to_numpy(copy=True))
+            for column in frame.columns}
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __setitem__(self, column, values):
+        self.columns[column] = values
+
+    def __delitem__(self, column):
+        del self.columns[column]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+
+class ParamColumn(MutableMapping):
+    """One column of a ParamStore, used like a dict of index tuple to value.
+
+    Existing values may be changed, but no index tuples added or removed.
+    An integer column becomes a float column when a float is written to it,
+    instead of truncating the float.
+    """
+    def __init__(self, positions, array):
+        self.positions = positions
+        self.array = array
+
+    def __getitem__(self, key):
+        return self.array[self.positions[key]]
+
+    def __setitem__(self, key, value):
+        position = self.positions[key]
+        if self.array.dtype.kind in 'biu':
+            dtype = np.result_type(self.array, np.asarray(value))
+            if dtype != self.array.dtype:
+                self.array = self.array.astype(dtype)
+        self.array[position] = value
+
+    def __delitem__(self, key):
+        raise TypeError('ParamColumn does not support removing index tuples')
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def keys(self):
+        return self.positions.keys()
+
+
+class TimeSeriesStore(ParamStore):
+    """Timeseries of an input DataFrame, used like DataFrame.to_dict().
+
+    store[column][(stf, t)] returns the value of a timestep, e.g.
+    m.demand_dict[(sit, com)][(stf, tm)]. All values are kept in a single
+    2-D float array (timestep x column), of which the columns are views.
+    """
+    def __init__(self, frame):
+        self.positions = {key: position
+                          for position, key in enumerate(frame.index)}
+        self.array = np.asfortranarray(frame.to_numpy(dtype=float))
+        self.columns = {column: ParamColumn(self.positions,
+                                            self.array[:, position])
+                        for position, column in enumerate(frame.columns)}
+
+    def timeseries(self, column, stf, timesteps, missing=None):
+        """Array of the values of a column for timesteps of stf.
+
+        Args:
+            - column: a column key, e.g. (sit, com)
+            - stf: the support timeframe
+            - timesteps: the timesteps
+            - missing: value of timesteps which are missing or NaN in the
+              store; by default, missing timesteps raise a KeyError
+
+        Returns:
+            a float array with one value per timestep
+        """
+        positions = self.positions
+        if missing is None:
+            rows = [positions[(stf, t)] for t in timesteps]
+            return self.columns[column].array[rows]
+        rows = [positions.get((stf, t), -1) for t in timesteps]
+        values = np.append(self.columns[column].array, missing)[rows]
+        return np.where(np.isnan(values), missing, values)
@@ -0,0 +1,120 @@
+import math
+from collections.abc import Mapping
+import pandas as pd
+import pyomo.core as pyomo
+from .input import pyomo_model_prep
+from .features.mutable import MUTABLE_PARAMS, mutable_param_name
+
+# global properties which may change without rebuilding the model, and the
+# constraints which use them
+GLOBAL_LIMITS = ['CO2 limit', 'Cost limit', 'CO2 budget', 'Cost budget']
+GLOBAL_LIMIT_CONSTRAINTS = ['res_global_co2_limit', 'res_global_co2_budget',
+                            'res_global_cost_limit', 'res_global_cost_budget']
+
+
+def update_model(prob, data):
+    """ Apply changed input data to a model created with mutable=True.
+
+    Changes of the mutable parameters (c.f. urbs.input.MUTABLE_PARAMS) are
+    written to their Params, changes of the global CO2/cost limits and
+    budgets rebuild the few constraints which use them. Any other change
+    (e.g. of a timeseries or of the set of processes) requires a new model.
+
+    Args:
+        - prob: a model created by create_model(..., mutable=True)
+        - data: the changed input data dict (c.f. read_input)
+
+    Returns:
+        True if the model was updated, False if it has to be rebuilt; in
+        this case, prob is left unchanged
+    """
+    if not getattr(prob, 'mutable', False):
+        return False
+
+    new = pyomo_model_prep(data, prob.timesteps)
+    standard = set(vars(pyomo.ConcreteModel()))
+    attributes = set(vars(new)) - standard
+    attributes.discard('balance_index')  # derived from r_in/r_out_dict
+    if not attributes <= set(vars(prob)):
+        return False
+
+    # mutable columns: only the values may change, not the index
+    new_values = {}
+    for dict_name, columns in MUTABLE_PARAMS.items():
+        if dict_name not in attributes:
+            continue
+        new_dict = getattr(new, dict_name)
+        for column in columns:
+            param = getattr(prob, mutable_param_name(dict_name, column))
+            if not all(key in new_dict[column] for key in param):
+                return False
+            new_values[param.name] = {key: new_dict[column][key]
+                                      for key in param}
+
+    # global limits: only the values of the limits and budgets may change
+    limits_changed = not _equal(prob.global_prop, new.global_prop)
+    if limits_changed:
+        old_props = _without_limits(prob.global_prop)
+        new_props = _without_limits(new.global_prop)
+        if not _equal(old_props, new_props):
+            return False
+
+    # everything else has to be unchanged
+    for name in attributes - {'global_prop', 'global_prop_dict'}:
+        old = getattr(prob, name)
+        new_attr = getattr(new, name)
+        if name in MUTABLE_PARAMS:
+            old = {col: values for col, values in old.items()
+                   if col not in MUTABLE_PARAMS[name]}
+            new_attr = {col: values for col, values in new_attr.items()
+                        if col not in MUTABLE_PARAMS[name]}
+        if not _equal(old, new_attr):
+            return False
+
+    # apply changes
+    for name, values in new_values.items():
+        getattr(prob, name).store_values(values)
+    if limits_changed:
+        prob.global_prop = new.global_prop
+        prob.global_prop_dict = new.global_prop_dict
+        for name in GLOBAL_LIMIT_CONSTRAINTS:
+            if hasattr(prob, name):
+                _rebuild_constraint(prob, name)
+    prob._data = data
+    if hasattr(prob, '_result'):
+        del prob._result  # result cache of the previous solution
+    return True
+
+
+def _without_limits(global_prop):
+    """Drop the rows of the global limits and budgets from global_prop."""
+    limits = global_prop.index.get_level_values('Property').isin(
+        GLOBAL_LIMITS)
+    return global_prop[~limits]
+
+
+def _rebuild_constraint(prob, name):
+    """Replace a constraint by a new one from its (unchanged) rule."""
+    old = prob.find_component(name)
+    index = old.index_set() if old.is_indexed() else None
+    prob.del_component(name)
+    if index is None:
+        prob.add_component(name, pyomo.Constraint(rule=old.rule, doc=old.doc))
+    else:
+        prob.add_component(
+            name, pyomo.Constraint(index, rule=old.rule, doc=old.doc))
+
+
+def _equal(a, b):
+    """Compare prepared model inputs, treating NaN as equal to NaN."""
+    if isinstance(a, (pd.DataFrame, pd.Series)):
+        return isinstance(b, type(a)) and a.equals(b)
+    if isinstance(a, Mapping):
+        return (isinstance(b, Mapping) and a.keys() == b.keys() and
+                all(_equal(a[key], b[key]) for key in a))
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b))
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
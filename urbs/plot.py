@@ -90,9 +90,25 @@ def plot(prob, stf, com, sit, dt, timesteps, timesteps_plot,
         # default to all simulated timesteps
         timesteps = sorted(get_entity(prob, 'tm').index)
 
-    # convert timesteps to hour series for the plots
-    hoursteps = timesteps * dt.iloc[0]
-    hoursteps_plot = timesteps_plot * dt.iloc[0]
+    # convert timesteps to hour series for the plots; timesteps of different
+    # durations (c.f. segment_timeseries) are placed at their ends
+    try:
+        segmentation = get_input(prob, 'segmentation')
+    except ValueError:
+        segmentation = None
+    if segmentation is None:
+        durations = np.full(len(timesteps), dt.iloc[0])
+        hoursteps = timesteps * dt.iloc[0]
+        hoursteps_plot = timesteps_plot * dt.iloc[0]
+    else:
+        durations = (segmentation['duration']
+                     .reindex(timesteps, fill_value=1)
+                     .to_numpy(dtype=float) * dt.iloc[0])
+        hours = pd.Series(timesteps[0] * dt.iloc[0] +
+                          np.cumsum(durations) - durations[0],
+                          index=timesteps)
+        hoursteps = hours.to_numpy()
+        hoursteps_plot = hours[timesteps_plot].to_numpy()
 
     if is_string(sit):
         # wrap single site in 1-element list for consistent behaviour
@@ -163,7 +179,7 @@ def plot(prob, stf, com, sit, dt, timesteps, timesteps_plot,
 
     # stack plot for consumed commodities (divided by dt for power)
     sp00 = ax0.stackplot(hoursteps[1:],
-                         -consumed.values.T / dt.iloc[0],
+                         -consumed.values.T / durations[1:],
                          labels=tuple(consumed.columns),
                          linewidth=0.15)
     # color
@@ -177,7 +193,7 @@ def plot(prob, stf, com, sit, dt, timesteps, timesteps_plot,
 
     # stack plot for created commodities (divided by dt for power)
     sp0 = ax0.stackplot(hoursteps[1:],
-                        created.values.T / dt.iloc[0],
+                        created.values.T / durations[1:],
                         labels=tuple(created.columns),
                         linewidth=0.15)
 
@@ -223,12 +239,12 @@ def plot(prob, stf, com, sit, dt, timesteps, timesteps_plot,
 
     # PLOT DEMAND
     # line plot for demand (unshifted) commodities (divided by dt for power)
-    ax0.plot(hoursteps, original.values / dt.iloc[0], linewidth=0.8,
+    ax0.plot(hoursteps, original.values / durations, linewidth=0.8,
              color=to_color('Unshifted'))
 
     # line plot for demand (in case of DSM mode: shifted) commodities
     # (divided by dt for power)
-    ax0.plot(hoursteps[1:], demand.values / dt.iloc[0], linewidth=1.0,
+    ax0.plot(hoursteps[1:], demand.values / durations[1:], linewidth=1.0,
              color=to_color('Shifted'))
 
     # PLOT STORAGE
@@ -265,7 +281,7 @@ def plot(prob, stf, com, sit, dt, timesteps, timesteps_plot,
 
         # bar plot for DSM up-/downshift power (bar width depending on dt)
         ax2.bar(hoursteps,
-                deltademand.values / dt[0], width=0.8 * dt[0],
+                deltademand.values / durations, width=0.8 * durations,
                 color=to_color('Delta'),
                 edgecolor='none')
 
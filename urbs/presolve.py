@@ -0,0 +1,121 @@
+import math
+from pyomo.common.collections import ComponentSet
+from pyomo.core.expr.numvalue import value
+from pyomo.repn import generate_standard_repn
+
+# units which may be removed if they can have no capacity: input DataFrame,
+# index levels of a unit and its (cap-up, inst-cap, cap-lo) columns
+UNITS = {
+    'process': (['Site', 'Process'], [('cap-up', 'inst-cap', 'cap-lo')]),
+    'storage': (['Site', 'Storage', 'Commodity'],
+                [('cap-up-c', 'inst-cap-c', 'cap-lo-c'),
+                 ('cap-up-p', 'inst-cap-p', 'cap-lo-p')]),
+    'transmission': (['Site In', 'Site Out', 'Transmission', 'Commodity'],
+                     [('cap-up', 'inst-cap', 'cap-lo')])}
+
+# constraints lower <= capacity <= upper of the units
+CAPACITY_LIMITS = ['res_process_capacity', 'res_transmission_capacity',
+                   'res_storage_capacity', 'res_storage_power']
+
+# new capacity variables of the units
+CAPACITY_VARIABLES = ['cap_pro_new', 'cap_tra_new', 'cap_sto_c_new',
+                      'cap_sto_p_new']
+
+
+def remove_units_without_capacity(data):
+    """Remove processes, storages and transmissions without capacity.
+
+    A unit (e.g. a process in a site) is removed if cap-up and inst-cap are
+    zero (and cap-lo is not positive) in all support timeframes; so all its
+    variables, e.g. its time-indexed flows, are always zero. Transmissions
+    are only removed together with their reverse direction.
+
+    Args:
+        data: input data dict (c.f. read_input)
+
+    Returns:
+        a tuple of the reduced data dict and the number of removed units
+    """
+    data = dict(data)
+    removed = 0
+    for name, (levels, columns) in UNITS.items():
+        frame = data[name]
+        if frame.empty:
+            continue
+        zero = True
+        for up, inst, lo in columns:
+            zero = zero & ((frame[up] == 0) & (frame[inst] == 0) &
+                           ~(frame[lo] > 0))
+        zero = zero.groupby(level=levels).all()
+        units = set(zero.index[zero])
+        if name == 'transmission':
+            units = {(sin, sout, tra, com) for (sin, sout, tra, com) in units
+                     if (sout, sin, tra, com) in units or
+                     (sout, sin, tra, com) not in zero.index}
+        if not units:
+            continue
+        keep = [key not in units for key in
+                frame.index.droplevel('support_timeframe')]
+        data[name] = frame[keep]
+        removed += len(units)
+
+        if name == 'process' and not data['eff_factor'].empty:
+            eff_factor = data['eff_factor']
+            data['eff_factor'] = eff_factor[
+                [column for column in eff_factor.columns
+                 if column not in units]]
+    return data, removed
+
+
+def presolve_bounds(m):
+    """Turn capacity limits into variable bounds.
+
+    A capacity limit (e.g. res_process_capacity) of a capacity which
+    consists of a single variable (e.g. cap_pro_new) and a constant becomes
+    a bound of this variable, and the constraint is deactivated. New
+    capacity variables which are part of no capacity (e.g. of units with
+    constant capacity) are fixed to zero, like variables whose bounds are
+    equal; the solver interface does not pass them as columns.
+
+    Returns:
+        a tuple of the numbers of deactivated constraints (i.e. rows) and
+        fixed variables (i.e. columns)
+    """
+    used = ComponentSet()
+    rows = 0
+    for name in CAPACITY_LIMITS:
+        if not hasattr(m, name):
+            continue
+        for con in getattr(m, name).values():
+            repn = generate_standard_repn(con.body)
+            used.update(repn.linear_vars)
+            if not repn.is_linear() or len(repn.linear_vars) != 1:
+                continue
+            var, coef = repn.linear_vars[0], repn.linear_coefs[0]
+            if coef == 0:
+                continue
+            bounds = [(value(bound) - repn.constant) / coef
+                      if bound is not None else None
+                      for bound in (con.lower, con.upper)]
+            lower, upper = bounds if coef > 0 else bounds[::-1]
+            if lower is not None and (var.lb is None or lower > var.lb):
+                var.setlb(lower)
+            if (upper is not None and not math.isinf(upper) and
+                    (var.ub is None or upper < var.ub)):
+                var.setub(upper)
+            con.deactivate()
+            rows += 1
+
+    columns = 0
+    for name in CAPACITY_VARIABLES:
+        if not hasattr(m, name):
+            continue
+        for var in getattr(m, name).values():
+            if var not in used:
+                var.fix(0)
+            elif var.lb is not None and var.lb == var.ub:
+                var.fix(var.lb)
+            else:
+                continue
+            columns += 1
+    return rows, columns
@@ -41,12 +41,13 @@ def get_entity(instance, name):
             name = name + '_'
 
     elif isinstance(entity, pyomo.Param):
+        # pyomo.value also returns the values of mutable Params
         if entity.dim() > 1:
             results = pd.DataFrame(
-                [v[0] + (v[1],) for v in entity.items()])
+                [v[0] + (pyomo.value(v[1]),) for v in entity.items()])
         elif entity.dim() == 1:
             results = pd.DataFrame(
-                [(v[0], v[1]) for v in entity.items()])
+                [(v[0], pyomo.value(v[1])) for v in entity.items()])
         else:
             results = pd.DataFrame(
                 [(v[0], v[1].value) for v in entity.items()])
@@ -98,6 +99,22 @@ def get_entity(instance, name):
                 [(v[0], v[1].value) for v in entity.items()])
             labels = ['None']
 
+    return _entity_series(instance, results, labels, name)
+
+
+def _entity_series(instance, results, labels, name):
+    """ Convert a DataFrame of index elements and values to a Series.
+
+    Args:
+        instance: the Pyomo ConcreteModel instance of the entity
+        results: a DataFrame with one column per index element (labelled by
+                 labels) followed by a column of values
+        labels: list of domain set names of the index elements
+        name: name of the entity
+
+    Returns:
+        a Pandas Series as returned by get_entity
+    """
     # check for duplicate onset names and append one to several "_" to make
     # them unique, e.g. ['sit', 'sit', 'com'] becomes ['sit', 'sit_', 'com']
     for k, label in enumerate(labels):
@@ -1,8 +1,14 @@
+import copy
 import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 import pyomo.environ
 from pyomo.opt.base import SolverFactory
 from datetime import datetime, date
+from .cache import cache_directory
+from .dispatch import chunked_dispatch, fix_capacities, rolling_horizon
 from .model import create_model
+from .persistent import update_model
 from .report import *
 from .plot import *
 from .input import *
@@ -56,7 +62,7 @@ def setup_solver(optim, logfile='solver.log'):
 def run_scenario(input_files, Solver, timesteps, scenario, result_dir, dt,
                  objective, plot_tuples=None,  plot_sites_name=None,
                  plot_periods=None, report_tuples=None,
-                 report_sites_name=None):
+                 report_sites_name=None, backend='pyomo'):
     """ run an urbs model for given input, time steps and scenario
 
     Args:
@@ -75,10 +81,17 @@ def run_scenario(input_files, Solver, timesteps, scenario, result_dir, dt,
           (c.f. urbs.report)
         - report_sites_name: (optional) dict of names for sites in
           report_tuples
+        - backend: (optional) model backend, "pyomo" (default) or "matrix"
+          (c.f. urbs.create_model); the matrix backend solves with HiGHS
+          only, so Solver has to be "highs" or "appsi_highs"
 
     Returns:
         the urbs model instance
     """
+    if backend == 'matrix' and Solver not in ('highs', 'appsi_highs'):
+        raise ValueError("The matrix backend solves with HiGHS only, not "
+                         "with '{}'. Use method write of the model to create "
+                         "an MPS file for other solvers.".format(Solver))
 
     # sets a modeled year for non-intertemporal problems
     # (necessary for consitency)
@@ -92,7 +105,7 @@ def run_scenario(input_files, Solver, timesteps, scenario, result_dir, dt,
     validate_dc_objective(data, objective)
 
     # create model
-    prob = create_model(data, dt, timesteps, objective)
+    prob = create_model(data, dt, timesteps, objective, backend=backend)
     # prob_filename = os.path.join(result_dir, 'model.lp')
     # prob.write(prob_filename, io_options={'symbolic_solver_labels':True})
 
@@ -100,11 +113,303 @@ def run_scenario(input_files, Solver, timesteps, scenario, result_dir, dt,
     log_filename = os.path.join(result_dir, '{}.log').format(sce)
 
     # solve model and read results
-    optim = SolverFactory(Solver)  # cplex, glpk, gurobi, ...
-    optim = setup_solver(optim, logfile=log_filename)
-    result = optim.solve(prob, tee=True)
-    assert str(result.solver.termination_condition) == 'optimal'
+    if backend == 'matrix':
+        status = prob.solve('highs', tee=True, logfile=log_filename)
+        if status != 'optimal':
+            raise RuntimeError("Scenario {} could not be solved: model "
+                               "status {}.".format(sce, status))
+    else:
+        optim = SolverFactory(Solver)  # cplex, glpk, gurobi, ...
+        optim = setup_solver(optim, logfile=log_filename)
+        result = optim.solve(prob, tee=True)
+        assert str(result.solver.termination_condition) == 'optimal'
+
+    save_results(prob, sce, result_dir, timesteps, plot_tuples,
+                 plot_sites_name, plot_periods, report_tuples,
+                 report_sites_name)
+
+    return prob
+
+
+def run_rolling_horizon(input_files, Solver, timesteps, scenario, result_dir,
+                        dt, objective, reference=None, window=168,
+                        lookahead=24, plot_tuples=None, plot_sites_name=None,
+                        plot_periods=None, report_tuples=None,
+                        report_sites_name=None):
+    """ run the dispatch of fixed capacities in successive time windows
+
+    Instead of one model of all timesteps, a model of each window and a
+    look-ahead is solved (c.f. urbs.rolling_horizon). The capacities are
+    either fixed in the input (cap-up equal to inst-cap) or taken from a
+    reference result, e.g. of a capacity expansion run of the scenario.
+
+    Args:
+        - reference: (optional) result file (.h5) of the same timesteps,
+          whose capacities are fixed and whose storage contents and CO2
+          emissions the windows follow (c.f. urbs.rolling_horizon)
+        - window: (optional) number of timesteps of a window, default: 168
+        - lookahead: (optional) number of further timesteps of each model,
+          default: 24
+        - other arguments: see run_scenario
+
+    Returns:
+        the result (c.f. urbs.saveload.ResultContainer)
+    """
+
+    # sets a modeled year for non-intertemporal problems
+    # (necessary for consitency)
+    year = date.today().year
+
+    # scenario name, read and modify data for scenario
+    sce = scenario.__name__
+    data = read_input(input_files, year)
+    data = scenario(data)
+    validate_input(data)
+    validate_dc_objective(data, objective)
+
+    # fix capacities to the ones of the reference
+    if reference is not None:
+        reference = load(reference)
+        data = fix_capacities(data, reference)
+
+    prob = rolling_horizon(data, Solver, window, lookahead, dt, timesteps,
+                           objective, reference=reference, tee=False)
+
+    save_results(prob, sce, result_dir, timesteps, plot_tuples,
+                 plot_sites_name, plot_periods, report_tuples,
+                 report_sites_name)
+
+    return prob
+
+
+def run_chunked_dispatch(input_files, Solver, timesteps, scenario, result_dir,
+                         dt, objective, reference, chunk=730, workers=1,
+                         threads=None, plot_tuples=None, plot_sites_name=None,
+                         plot_periods=None, report_tuples=None,
+                         report_sites_name=None):
+    """ run the dispatch of the capacities of a result in parallel chunks
+
+    The capacities of a reference result, e.g. of a capacity expansion run,
+    are fixed, and the dispatch of the scenario (e.g. with new prices or
+    timeseries) is solved in independent time chunks by worker processes
+    (c.f. urbs.chunked_dispatch). The chunks are merged to one result file.
+
+    Args:
+        - reference: result file (.h5) of the same timesteps, whose
+          capacities are fixed and whose operation around each chunk,
+          storage contents and CO2 emissions the chunks follow
+        - chunk: (optional) number of timesteps of a chunk, default: 730
+        - workers: (optional) number of worker processes, also parsing the
+          input files, default: 1
+        - threads: (optional) number of solver threads per worker; choose
+          workers * threads not larger than the number of cores, default:
+          solver default
+        - other arguments: see run_scenario
+
+    Returns:
+        the result (c.f. urbs.saveload.ResultContainer)
+    """
+
+    # sets a modeled year for non-intertemporal problems
+    # (necessary for consitency)
+    year = date.today().year
+
+    # scenario name, read and modify data for scenario
+    sce = scenario.__name__
+    data = read_input(input_files, year, workers=workers)
+    data = scenario(data)
+    validate_input(data)
+    validate_dc_objective(data, objective)
 
+    # fix capacities to the ones of the reference
+    reference = load(reference)
+    data = fix_capacities(data, reference)
+
+    prob = chunked_dispatch(data, Solver, reference, chunk, dt, timesteps,
+                            objective, workers=workers, threads=threads)
+
+    save_results(prob, sce, result_dir, timesteps, plot_tuples,
+                 plot_sites_name, plot_periods, report_tuples,
+                 report_sites_name)
+
+    return prob
+
+
+def run_scenarios(input_files, Solver, timesteps, scenarios, result_dir, dt,
+                  objective, plot_tuples=None, plot_sites_name=None,
+                  plot_periods=None, report_tuples=None,
+                  report_sites_name=None, workers=1, threads=None,
+                  persistent=False):
+    """ run an urbs model for given input, time steps and several scenarios
+
+    By default, each scenario is run like in run_scenario: its model is
+    created and solved anew. With persistent=True, the model is built only
+    once with mutable parameters. Each scenario is then applied as a change
+    of these parameters (c.f. urbs.update_model) and solved with a
+    persistent solver interface, which starts from the solution of the
+    previous scenario. Only scenarios changing more than prices, capacity
+    bounds, cost coefficients and global limits (e.g. scenario_no_dsm)
+    rebuild the model.
+
+    With workers > 1, the input files are parsed in parallel and the
+    scenarios are distributed over a pool of worker processes, each of which
+    runs its share of the scenarios as described. A failing scenario does not
+    stop the others; its traceback is printed.
+
+    Args:
+        - scenarios: a list of scenario functions
+        - workers: (optional) number of worker processes, default: 1
+        - threads: (optional) number of solver threads per worker; choose
+          workers * threads not larger than the number of cores, default:
+          solver default
+        - persistent: (optional) set True to re-solve the scenarios on one
+          model with a persistent solver interface, default: False
+        - other arguments: see run_scenario
+
+    Returns:
+        a dict of scenario names to the result file (.h5) of the scenario,
+        or to the exception which stopped it
+    """
+    args = (input_files, Solver, timesteps, result_dir, dt, objective,
+            plot_tuples, plot_sites_name, plot_periods, report_tuples,
+            report_sites_name, threads)
+    if workers <= 1:
+        return run_scenario_sweep(scenarios, *args, tee=True,
+                                  persistent=persistent)
+
+    # parse the input files in parallel once, so that the workers find
+    # them in the input cache instead of all parsing them (c.f. read_input)
+    if cache_directory() is not None:
+        read_input(input_files, date.today().year, workers=workers)
+
+    # distribute scenarios round-robin; solver output would interleave
+    shares = [scenarios[i::workers] for i in range(workers)]
+    shares = [share for share in shares if share]
+    results = {}
+    with ProcessPoolExecutor(max_workers=len(shares)) as executor:
+        futures = [(share, executor.submit(run_scenario_sweep, share, *args,
+                                           tee=False, persistent=persistent))
+                   for share in shares]
+        for share, future in futures:
+            try:
+                results.update(future.result())
+            except Exception as error:  # e.g. a crashed worker process
+                for scenario in share:
+                    results[scenario.__name__] = error
+    return {scenario.__name__: results[scenario.__name__]
+            for scenario in scenarios}
+
+
+def run_scenario_sweep(scenarios, input_files, Solver, timesteps, result_dir,
+                       dt, objective, plot_tuples=None, plot_sites_name=None,
+                       plot_periods=None, report_tuples=None,
+                       report_sites_name=None, threads=None, tee=True,
+                       persistent=False):
+    """ run several scenarios one after the other
+
+    Args:
+        - tee: show solver output
+        - persistent: re-solve the scenarios on one model with a persistent
+          solver interface (c.f. run_scenarios)
+        - other arguments: see run_scenarios
+
+    Returns:
+        see run_scenarios
+    """
+
+    # sets a modeled year for non-intertemporal problems
+    # (necessary for consitency)
+    year = date.today().year
+
+    # read data once; each scenario modifies a copy of it
+    base_data = read_input(input_files, year)
+
+    results = {}
+    prob = None
+    if persistent:
+        optim = persistent_solver(Solver, threads)
+    for scenario in scenarios:
+        sce = scenario.__name__
+        try:
+            data = scenario(copy.deepcopy(base_data))
+            validate_input(data)
+            validate_dc_objective(data, objective)
+
+            # create model, or change the one of the previous scenario
+            if not persistent:
+                prob = create_model(data, dt, timesteps, objective)
+                optim = SolverFactory(Solver)  # cplex, glpk, gurobi, ...
+                if threads is not None and Solver != 'glpk':
+                    optim.options['threads'] = threads
+            elif prob is None or not update_model(prob, data):
+                prob = create_model(data, dt, timesteps, objective,
+                                    mutable=True)
+
+            # solve model and read results
+            log_filename = os.path.join(result_dir, '{}.log').format(sce)
+            if hasattr(optim, 'config'):
+                optim.config.logfile = log_filename  # appsi interface
+            else:
+                optim = setup_solver(optim, logfile=log_filename)
+            result = optim.solve(prob, tee=tee)
+            condition = result.solver.termination_condition
+            if str(condition) != 'optimal':
+                raise RuntimeError("Scenario {} could not be solved: "
+                                   "termination condition {}.".format(
+                                       sce, condition))
+
+            save_results(prob, sce, result_dir, timesteps, plot_tuples,
+                         plot_sites_name, plot_periods, report_tuples,
+                         report_sites_name)
+            results[sce] = os.path.join(result_dir, '{}.h5'.format(sce))
+        except Exception as error:
+            print("Warning from run_scenarios: scenario '{}' failed:\n"
+                  "{}".format(sce, traceback.format_exc()))
+            results[sce] = error
+            prob = None  # start the next scenario from a new model
+    return results
+
+
+def persistent_solver(Solver, threads=None):
+    """ return a solver which keeps the model between solves
+
+    Args:
+        - Solver: the user specified solver, e.g. 'gurobi' or 'appsi_highs'
+        - threads: (optional) maximum number of solver threads
+
+    Returns:
+        the persistent (appsi) interface of the solver if available, else
+        the plain solver
+    """
+    name = Solver
+    if name.startswith('appsi_'):
+        name = name[len('appsi_'):]
+    if name.endswith('_persistent'):
+        name = name[:-len('_persistent')]
+    optim = None
+    if 'appsi_' + name in SolverFactory:
+        optim = SolverFactory('appsi_' + name)
+        if not optim.available(exception_flag=False):
+            optim = None
+    if optim is None:
+        print("Warning from persistent_solver: no persistent interface for "
+              "solver '{}'!".format(Solver))
+        optim = SolverFactory(Solver)
+    if threads is not None and name != 'glpk':  # glpk is single-threaded
+        optim.options['threads'] = threads
+    return optim
+
+
+def save_results(prob, sce, result_dir, timesteps, plot_tuples=None,
+                 plot_sites_name=None, plot_periods=None, report_tuples=None,
+                 report_sites_name=None):
+    """ save, report and plot the results of a solved scenario
+
+    Args:
+        - prob: the solved urbs model instance
+        - sce: the scenario name
+        - other arguments: see run_scenario
+    """
     # save problem solution (and input data) to HDF5 file
     save(prob, os.path.join(result_dir, '{}.h5'.format(sce)))
 
@@ -125,5 +430,3 @@ def run_scenario(input_files, Solver, timesteps, scenario, result_dir, dt,
         plot_sites_name=plot_sites_name,
         periods=plot_periods,
         figure_size=(24, 9))
-
-    return prob
@@ -1,4 +1,5 @@
 import pandas as pd
+from .output import get_cost_breakdown
 from .pyomoio import get_entity, list_entities
 
 
@@ -14,6 +15,9 @@ def create_result_cache(prob):
     result_cache = {}
     for entity in entities:
         result_cache[entity] = get_entity(prob, entity)
+    if not getattr(prob, 'cost_breakdown', True):
+        # costs by type per process, transmission and storage
+        result_cache.update(get_cost_breakdown(prob))
     return result_cache
 
 